@@ -0,0 +1,302 @@
+"""Benchmarks of the measurement and calibration routines on the simulated rig.
+
+Every phase runs on fresh simulated instruments (`config/rig_SIM.toml`) with the fixed
+latency model below and a path loss equal to the simulated paths. It records:
+
+* `wall_s`: Wall time of the phase.
+* `writes`, `queries`: VISA calls sent to the instruments.
+* `sleep_s`: Time slept by the scripts and drivers (`time.sleep`).
+* `instrument_s`: Simulated instrument latency, for reference.
+
+The results are compared with the baselines in `config/benchmark_baseline.json`. A
+phase fails if it sends more commands, sleeps longer or takes longer than its baseline
+allows (see `BUDGETS`):
+
+    python benchmark.py                  # all phases, exits with 1 on a regression
+    python benchmark.py lasig find_pout  # selected phases
+    python benchmark.py --update         # store the results as the new baselines
+"""
+# Standard library imports
+import argparse
+import contextlib
+import dataclasses
+import json
+import pathlib
+import sys
+import time
+from typing import Callable
+
+# Third party imports
+import pandas as pd
+
+# Local imports
+from config import config as cfg, load_rig
+from config.plan import compile_plan
+from library import tracing
+from library.estimate import true_path_loss
+from library.rig import Rig
+from library.simulator import SimResourceManager
+import calibrate
+import pa_characterization
+
+baseline_path = pathlib.Path(__file__).parent / "config" / "benchmark_baseline.json"
+
+# Fixed latency model, independent of the simulator defaults so baselines stay valid
+LATENCY_S = {
+    "write": 0.001,
+    "query": 0.003,
+    "*RST": 1.0,
+    "INST:CRE": 0.5,
+    "INIT": 0.05,
+    "INIT:IMM": 0.02,
+    "CALC:MARK:MAX": 0.02,
+    "LIST:LEAR": 0.5,
+    "BB:ARB:WAV:SEL": 1.0,
+    "CONF:REFS:CGW:READ": 1.0,
+    "MEAS:VOLT?": 0.05,
+    "MEAS:CURR?": 0.05,
+    "ddpd_iteration": 0.5,
+}
+
+# Allowed increase over the baseline: (relative, absolute)
+BUDGETS = {
+    "wall_s": (0.15, 0.5),
+    "writes": (0.05, 2),
+    "queries": (0.05, 2),
+    "sleep_s": (0.05, 0.1),
+}
+
+FREQUENCY = 3.45e9
+CALIBRATION_FREQUENCIES = [3.3e9, 3.4e9, 3.5e9, 3.6e9]
+POUT_TARGET_DBM = 28.0
+
+
+def main(phases: list[str] | None = None, update: bool = False) -> bool:
+    """Runs the benchmark phases and compares them with the baselines.
+
+    Returns:
+        bool: True if no phase exceeded its budget.
+    """
+    baselines = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    results = {}
+    passed = True
+    for name in phases or PHASES:
+        results[name] = run_phase(PHASES[name])
+        failures = compare(results[name], baselines.get(name))
+        passed &= not failures
+        report(name, results[name], baselines.get(name), failures)
+
+    if update:
+        baseline_path.write_text(json.dumps(baselines | results, indent=4))
+        print(f"Baselines written to {baseline_path}")
+    return passed
+
+
+def run_phase(phase: Callable[[Rig, SimResourceManager], None]) -> dict[str, float]:
+    """Runs `phase` on a fresh simulated rig and returns its metrics."""
+    settings = load_rig("SIM")
+    settings["Simulation"] |= {"seed": 1, "time_scale": 1.0, "latency_s": LATENCY_S}
+    rm = SimResourceManager(settings)
+    rig = Rig.open(rm, "SIM", settings, path_loss=true_path_loss(rm))
+
+    calls, waited = rm.calls.copy(), rm.bench.waited
+    with count_sleeps() as slept:
+        start = time.perf_counter()
+        phase(rig, rm)
+        wall_s = time.perf_counter() - start
+    return {
+        "wall_s": round(wall_s, 3),
+        "writes": rm.calls["write"] - calls["write"],
+        "queries": rm.calls["query"] - calls["query"],
+        "sleep_s": round(sum(slept), 3),
+        "instrument_s": round(rm.bench.waited - waited, 3),
+    }
+
+
+@contextlib.contextmanager
+def count_sleeps():
+    """Replaces `time.sleep` with a version that adds each sleep to the yielded list.
+
+    Sleeps of worker threads count too, so concurrent sleeps add up.
+    """
+    slept = []
+
+    def counting_sleep(seconds: float) -> None:
+        slept.append(seconds)
+        beneath("sleep")(seconds)
+
+    with tracing.patch_time(sleep=counting_sleep) as beneath:
+        yield slept
+
+
+def compare(result: dict, baseline: dict | None) -> list[str]:
+    """Returns the metrics of `result` exceeding their budget over `baseline`."""
+    if baseline is None:
+        return []
+    return [
+        metric
+        for metric, (relative, absolute) in BUDGETS.items()
+        if result[metric] > baseline[metric] * (1 + relative) + absolute
+    ]
+
+
+def report(name: str, result: dict, baseline: dict | None, failures: list[str]) -> None:
+    if baseline is None:
+        status = "no baseline"
+    elif failures:
+        status = "FAIL " + ", ".join(failures)
+    else:
+        status = "ok"
+    metrics = ", ".join(
+        f"{metric} {value:g}"
+        + (f" ({baseline[metric]:g})" if baseline and metric in baseline else "")
+        for metric, value in result.items()
+    )
+    print(f"{name:<22} {metrics}  {status}")
+
+
+def benchmark_plan():
+    plan = compile_plan(cfg, cfg["product"], "SIM", load_rig("SIM"))
+    return dataclasses.replace(
+        plan,
+        lasig_frequencies=(FREQUENCY,),
+        modulated_frequencies=(FREQUENCY,),
+        pout_targets=(POUT_TARGET_DBM,),
+    )
+
+
+def tune(rig: Rig, frequency: float, pin: float, pout: float) -> None:
+    """Tunes the rig to `frequency` like the measurement loops, with the path losses
+    at the drive levels `pin` and `pout` (dBm)."""
+    path_loss = rig.path_loss
+    sa_path_loss = path_loss.loss(frequency, "sa_to_dut_p2_loss_db", power=pout)
+    rig.vsa.set_reference_level(offset=-sa_path_loss)
+    rig.vsa.set_frequency(center=frequency, span=0)
+    rig.vsg.set_rf(
+        frequency=frequency,
+        compensation_offset=path_loss.loss(
+            frequency, "sg_to_dut_p1_loss_db", power=pin
+        ),
+    )
+    rig.sensor.set_frequency(frequency)
+
+
+# ------------------------
+# Measurement phases
+
+
+def lasig(rig: Rig, rm: SimResourceManager) -> None:
+    plan = benchmark_plan()
+    pa_characterization.power_up(rig, plan)
+    pa_characterization.run_lasig(rig, plan)
+
+
+def aclr(rig: Rig, rm: SimResourceManager) -> None:
+    plan = benchmark_plan()
+    pa_characterization.power_up(rig, plan)
+    pa_characterization.run_aclr(rig, plan, with_dpd=False)
+
+
+def aclr_dpd(rig: Rig, rm: SimResourceManager) -> None:
+    plan = benchmark_plan()
+    pa_characterization.power_up(rig, plan)
+    pa_characterization.run_aclr(rig, plan, with_dpd=True)
+
+
+def harmonic(rig: Rig, rm: SimResourceManager) -> None:
+    plan = benchmark_plan()
+    pa_characterization.power_up(rig, plan)
+    tune(rig, FREQUENCY, pin=0, pout=POUT_TARGET_DBM)
+    rig.vsg.set_rf(dut_input_level=0)
+    rig.vsg.set_output("ON")
+    pa_characterization.measure_harmonic(
+        rig, multiple=[2, 3], fundamental_frequency=FREQUENCY
+    )
+    rig.vsg.set_output("OFF")
+
+
+def find_pout(rig: Rig, rm: SimResourceManager) -> None:
+    plan = benchmark_plan()
+    pa_characterization.power_up(rig, plan)
+    tune(rig, FREQUENCY, pin=plan.sweep.start_dbm, pout=POUT_TARGET_DBM)
+    pa_characterization.find_pout(
+        rig,
+        frequency=FREQUENCY,
+        target_dbm=POUT_TARGET_DBM,
+        pin_low=plan.sweep.start_dbm,
+        pin_high=plan.sweep.stop_dbm,
+        average_count=3,
+        settling=plan.settling["pout"],
+    )
+    rig.vsg.set_output("OFF")
+
+
+# ------------------------
+# Calibration phases
+
+
+def use_rig(rig: Rig, rm: SimResourceManager, connection: str) -> pd.Series:
+    """Points the calibration routines at the simulated instruments and returns the
+    true input path loss."""
+    calibrate.vsa, calibrate.vsg, calibrate.sensor, calibrate.rm = (
+        rig.vsa,
+        rig.vsg,
+        rig.sensor,
+        rm,
+    )
+    rm.connect(connection)
+    return pd.Series(
+        [rm.bench.path_gain("input", f) for f in CALIBRATION_FREQUENCIES],
+        index=CALIBRATION_FREQUENCIES,
+    )
+
+
+def cal_input(rig: Rig, rm: SimResourceManager) -> None:
+    use_rig(rig, rm, "input")
+    calibrate.calibrate_input_path_loss(CALIBRATION_FREQUENCIES, power_dbm=0)
+
+
+def cal_sa(rig: Rig, rm: SimResourceManager) -> None:
+    input_path_loss = use_rig(rig, rm, "output")
+    calibrate.calibrate_sa_path_loss(
+        CALIBRATION_FREQUENCIES, power_dbm=0, input_path_loss=input_path_loss
+    )
+
+
+def cal_sensor(rig: Rig, rm: SimResourceManager) -> None:
+    input_path_loss = use_rig(rig, rm, "output")
+    calibrate.calibrate_sensor_path_loss(
+        CALIBRATION_FREQUENCIES, power_dbm=0, input_path_loss=input_path_loss
+    )
+
+
+def cal_sa_sensor(rig: Rig, rm: SimResourceManager) -> None:
+    input_path_loss = use_rig(rig, rm, "output")
+    calibrate.calibrate_sa_sensor_path_loss(
+        CALIBRATION_FREQUENCIES, power_dbm=0, input_path_loss=input_path_loss
+    )
+
+
+PHASES = {
+    "lasig": lasig,
+    "aclr": aclr,
+    "aclr_dpd": aclr_dpd,
+    "harmonic": harmonic,
+    "find_pout": find_pout,
+    "cal_input": cal_input,
+    "cal_sa": cal_sa,
+    "cal_sensor": cal_sensor,
+    "cal_sa_sensor": cal_sa_sensor,
+}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("phases", nargs="*", help=f"any of {', '.join(PHASES)}")
+    parser.add_argument("--update", action="store_true", help="store new baselines")
+    args = parser.parse_args()
+    if unknown := set(args.phases) - set(PHASES):
+        parser.error(f"unknown phases {', '.join(sorted(unknown))}")
+
+    sys.exit(0 if main(args.phases or None, update=args.update) else 1)
@@ -1,15 +1,29 @@
+import argparse
+import concurrent.futures
+import json
 import re
 import pathlib
 import time
 
+# Startup timing, imported first so it covers the imports below. pandas and NumPy are
+# not deferred: every measurement needs them, deferring would only move their cost
+from library.startup import Startup
+
 import pandas as pd
-import pyvisa
 import numpy as np
 
-from config import config as cfg, rig
+from config import config as cfg, load_rig, path_loss_store
 from library.drivers.vsa import FSW43
 from library.drivers.vsg import SMW200A
 from library.drivers.sensors import NRPZ86
+from library.rig import (
+    lock_instruments,
+    open_instruments,
+    resource_manager,
+    server_socket,
+)
+from library.settling import read_settled
+from library.touchstone import Touchstone
 
 
 def main(
@@ -17,6 +31,8 @@ def main(
     power_dbm: float | None = None,
     average_count: int = 10,
     write_to_csv: bool = True,
+    startup: Startup | None = None,
+    date: str | None = None,
 ):
     """Call this function with the following optional arguments:
     Args:
@@ -24,7 +40,11 @@ def main(
         * power_dbm: Supply the transmission power directly to skip the prompt.
         * average_count: The measurement sample count, which is then averaged. Defaults to 10.
         * write_to_csv: Whether to save the result to a csv file.
+        * startup: Startup timing, marked at the first calibration reading.
+        * date: Date stamp ("%y%m%d-%Hh%Mm") of the calibration. Defaults to now.
     """
+    if date is None:
+        date = time.strftime("%y%m%d-%Hh%Mm")
     if frange is None:
         frange = generate_frange()
     else:
@@ -50,22 +70,18 @@ def main(
     print(f"{frange[-1] / 1e9:.2f} GHz")
     print(f"Transmission power: {power_dbm} dBm\n")
 
-    # adapter_loss = adapter_insertion_loss(file="", freqs=frange, write_to_csv=True)
-    try:
-        adapter_loss = pd.read_csv(
-            pathlib.Path(__file__).parent / "config" / "adapter_deembedded.csv",
-            index_col="frequency_hz",
-        ).squeeze()
-    except:
-        adapter_loss = None
+    adapter_loss = load_adapter_loss(frange)
 
-    input("\nPress any key to start input loss calibration ")
+    connect("input", "\nPress any key to start input loss calibration ")
+    if startup is not None:
+        startup.first_measurement()
     input_path_loss = calibrate_input_path_loss(
         frange=frange, power_dbm=power_dbm, average_count=average_count
     )
     print(input_path_loss)
-    input(
-        "Input loss calibrated. Press any key to continue SA/Sensor loss calibration "
+    connect(
+        "output",
+        "Input loss calibrated. Press any key to continue SA/Sensor loss calibration ",
     )
     sa_path_loss, sensor_path_loss = calibrate_sa_sensor_path_loss(
         frange=frange,
@@ -85,21 +101,286 @@ def main(
         }
     ).set_index(["power", "frequency"])
     print(path_loss)
+    save_path_loss(path_loss, power_dbm, date, write_to_csv=write_to_csv)
+
+
+def main_incremental(
+    path_loss_file: str | None = None,
+    power_dbm: float | None = None,
+    spot_checks: int = 5,
+    tolerance_db: float = 0.2,
+    average_count: int = 10,
+    write_to_csv: bool = True,
+    startup: Startup | None = None,
+    date: str | None = None,
+):
+    """Verifies an existing calibration and re-measures only the bands that drifted.
+
+    A sparse, evenly spread subset of the calibrated frequencies is measured and
+    compared with the stored losses. Every frequency is assigned to its nearest spot
+    check; the frequencies of spot checks that drifted more than `tolerance_db` are
+    re-measured. The merged result is written as a new path loss file, with a JSON file
+    of the same name recording its provenance. One power level is verified per run.
+
+    Args:
+        * path_loss_file: Calibration to verify, in ./config. Defaults to `path_loss_file` of the config, or the rig's latest stored calibration if that is empty.
+        * power_dbm: Power level to verify. Defaults to the lowest one of the file, or the power of the latest stored calibration.
+        * spot_checks: Number of frequencies to spot-check.
+        * tolerance_db: Allowed drift before a band is re-measured.
+        * average_count: The measurement sample count, which is then averaged. Defaults to 10.
+        * write_to_csv: Whether to save the result to a csv file.
+        * startup: Startup timing, marked at the first spot check.
+        * date: Date stamp ("%y%m%d-%Hh%Mm") of the new calibration. Defaults to now.
+    """
+    if date is None:
+        date = time.strftime("%y%m%d-%Hh%Mm")
+    dir_config = pathlib.Path(__file__).parent / "config"
+    if path_loss_file is None:
+        path_loss_file = cfg["path_loss_file"]
+    if path_loss_file:
+        path_loss = pd.read_csv(dir_config / path_loss_file)
+    else:
+        catalog = path_loss_store.catalog(cfg["test_rig"])
+        if power_dbm is not None:
+            catalog = catalog[catalog["power_dbm"] == power_dbm]
+        if catalog.empty:
+            raise SystemExit(f"No stored calibration at {power_dbm} dBm to verify")
+        latest = catalog["path"].iloc[0]
+        path_loss, _ = path_loss_store.read(latest)
+        path_loss_file = latest.name
+    path_loss = path_loss.rename(columns={"frequency_hz": "frequency"})
+    if "power" in path_loss:
+        # Each power level has its own losses at the same frequencies
+        powers = sorted(path_loss["power"].unique())
+        if power_dbm is None:
+            power_dbm = powers[0]
+        if power_dbm not in powers:
+            raise SystemExit(f"{path_loss_file} has no calibration at {power_dbm} dBm")
+        if len(powers) > 1:
+            print(f"{path_loss_file} holds {powers} dBm, verifying {power_dbm} dBm")
+        path_loss = path_loss[path_loss["power"] == power_dbm].drop(columns="power")
+    power_dbm = float(power_dbm or 0)
+    path_loss = path_loss.set_index("frequency").sort_index()
+    frange = list(path_loss.index)
+    spots = np.unique(np.linspace(0, len(frange) - 1, spot_checks).round().astype(int))
+    spots = [frange[i] for i in spots]
+
+    print(f"Spot-checking {len(spots)} of {len(frange)} frequencies at {power_dbm} dBm")
+    provenance = {
+        "parent": path_loss_file,
+        "date": date,
+        "power_dbm": power_dbm,
+        "tolerance_db": tolerance_db,
+        "spot_frequencies_hz": spots,
+        "drift_db": {},
+        "remeasured_hz": {},
+    }
+
+    connect(
+        "input", "\nConnect the input path. Press any key to spot-check the input loss "
+    )
+    if startup is not None:
+        startup.first_measurement()
+    column = "sg_to_dut_p1_loss_db"
+    spot = calibrate_input_path_loss(spots, power_dbm, average_count=average_count)
+    drift = spot - path_loss.loc[spots, column]
+    remeasure = drifted_frequencies(frange, drift, tolerance_db)
+    if remeasure:
+        print(f"Input loss drifted, re-measuring {len(remeasure)} frequencies")
+        path_loss.loc[remeasure, column] = calibrate_input_path_loss(
+            remeasure, power_dbm, average_count=average_count
+        )
+    provenance["drift_db"][column] = drift.tolist()
+    provenance["remeasured_hz"][column] = remeasure
+
+    connect(
+        "output",
+        "\nConnect the output path. Press any key to spot-check the SA/Sensor loss ",
+    )
+    columns = ["sa_to_dut_p2_loss_db", "sensor_to_dut_p2_loss_db"]
+    input_path_loss = path_loss[column]
+    adapter_loss = load_adapter_loss(frange)
+    spot = calibrate_sa_sensor_path_loss(
+        spots,
+        power_dbm,
+        input_path_loss=input_path_loss,
+        adapter_loss=adapter_loss,
+        average_count=average_count,
+    )
+    drift = pd.concat(spot, axis=1) - path_loss.loc[spots, columns]
+    remeasure = drifted_frequencies(frange, drift.abs().max(axis=1), tolerance_db)
+    if remeasure:
+        print(f"SA/Sensor loss drifted, re-measuring {len(remeasure)} frequencies")
+        sa_path_loss, sensor_path_loss = calibrate_sa_sensor_path_loss(
+            remeasure,
+            power_dbm,
+            input_path_loss=input_path_loss,
+            adapter_loss=adapter_loss,
+            average_count=average_count,
+        )
+        path_loss.loc[remeasure, columns[0]] = sa_path_loss
+        path_loss.loc[remeasure, columns[1]] = sensor_path_loss
+    for name in columns:
+        provenance["drift_db"][name] = drift[name].tolist()
+        provenance["remeasured_hz"][name] = remeasure
+
+    path_loss = path_loss.reset_index()
+    path_loss["power"] = power_dbm
+    path_loss = path_loss.set_index(["power", "frequency"])
+    print(path_loss)
+    save_path_loss(
+        path_loss, power_dbm, date, write_to_csv=write_to_csv, provenance=provenance
+    )
+    if write_to_csv:
+        with (dir_config / f"pathloss_{date}.json").open("w") as fp:
+            json.dump(provenance, fp, indent=4)
+
+
+def dry_run(
+    frange: list,
+    power_dbm: float = 0,
+    average_count: int = 10,
+    cost_model=None,
+):
+    """Estimates how long `main` takes for `frange`, without the instruments.
+
+    The calibration runs on the simulated rig on a virtual clock, see
+    `library.estimate`. The time the operator takes to reconnect is not included.
+
+    Args:
+        cost_model (CostModel, optional): Instrument latencies. Defaults to the ones
+            recorded on the configured rig.
+
+    Returns:
+        Estimate: Duration per calibration step.
+    """
+    from library import tracing
+    from library.estimate import CostModel, Estimate, simulated_rig, virtual_clock
+
+    global vsa, vsg, sensor, rm
+    cost_model = cost_model or CostModel.for_rig(cfg["test_rig"])
+
+    with virtual_clock():
+        simulated, rm = simulated_rig(load_rig("SIM"), cost_model)
+        vsa, vsg, sensor = simulated.vsa, simulated.vsg, simulated.sensor
+        calls, waited = sum(rm.calls.values()), rm.bench.waited
+        with tracing.recording("calibration dry run") as trace:
+            rm.connect("input")
+            with tracing.span("input path loss"):
+                input_path_loss = calibrate_input_path_loss(
+                    frange=frange, power_dbm=power_dbm, average_count=average_count
+                )
+            rm.connect("output")
+            with tracing.span("SA/sensor path loss"):
+                calibrate_sa_sensor_path_loss(
+                    frange=frange,
+                    power_dbm=power_dbm,
+                    input_path_loss=input_path_loss,
+                    average_count=average_count,
+                )
+
+    durations = trace.durations()
+    phases = {
+        phase: durations[phase] for phase in ["input path loss", "SA/sensor path loss"]
+    }
+    return Estimate(
+        name="the calibration",
+        phases=phases,
+        parameters={"frequencies": (sum(phases.values()), len(frange))},
+        commands=sum(rm.calls.values()) - calls,
+        sleep_s=durations.get("sleep", 0),
+        instrument_s=rm.bench.waited - waited,
+        cost_model=cost_model,
+    )
+
+
+def connect(path: str, prompt: str) -> None:
+    """Prompts the operator to connect the `"input"` or `"output"` calibration path.
+    A simulated rig is reconnected to match."""
+    input(prompt)
+    if hasattr(rm, "connect"):
+        rm.connect(path)
+
+
+def save_path_loss(
+    path_loss: pd.DataFrame,
+    power_dbm: float,
+    date: str,
+    write_to_csv: bool = True,
+    **metadata,
+) -> None:
+    """Adds a calibration to the path loss store and optionally writes it as CSV.
+
+    The store entry records the rig, `date` ("%y%m%d-%Hh%Mm"), power and the rig's
+    `[Cables]` IDs.
+    """
+    path_loss_store.save(
+        path_loss,
+        rig=cfg["test_rig"],
+        power_dbm=power_dbm,
+        date=date,
+        cables=load_rig(cfg["test_rig"]).get("Cables", {}),
+        **metadata,
+    )
     if write_to_csv:
         dir_config = pathlib.Path(__file__).parent / "config"
         path_loss.to_csv(dir_config / f"pathloss_{date}.csv")
 
 
+def drifted_frequencies(frange: list, drift: pd.Series, tolerance_db: float) -> list:
+    """Returns the frequencies whose nearest spot check drifted beyond `tolerance_db`.
+
+    Args:
+        frange (list): Sorted calibration frequencies.
+        drift (pd.Series): Drift in dB indexed by the sorted spot check frequencies.
+    """
+    spots = drift.index.to_numpy()
+    midpoints = (spots[1:] + spots[:-1]) / 2
+    nearest = np.searchsorted(midpoints, frange)
+    drifted = np.abs(drift.to_numpy()) > tolerance_db
+    return [freq for freq, i in zip(frange, nearest) if drifted[i]]
+
+
+def load_adapter_loss(frange: list) -> pd.Series | None:
+    """Loads the adapter insertion loss at `frange` for de-embedding, if available.
+
+    Uses the Touchstone file `adapter_file` from the `[Calibration]` config, or falls
+    back to a previously exported `adapter_deembedded.csv`.
+
+    Raises:
+        SystemExit: If the Touchstone file does not cover `frange`.
+    """
+    if file := cfg["Calibration"].get("adapter_file"):
+        try:
+            return adapter_insertion_loss(file, freqs=frange)
+        except ValueError as error:
+            raise SystemExit(
+                f"Adapter file {file} cannot de-embed the calibration frequencies: "
+                f"{error}"
+            )
+    try:
+        return pd.read_csv(
+            pathlib.Path(__file__).parent / "config" / "adapter_deembedded.csv",
+            index_col="frequency_hz",
+        ).squeeze()
+    except:
+        return None
+
+
 def calibrate_input_path_loss(
     frange: list,
     power_dbm: int | float,
     average_count: int = 10,
     sampling_timeout: float = 1,
+    tolerance_db: float = 0.05,
 ) -> pd.Series:
     """
     Args:
         frange (list): Frequencies to perform the measurement on.
         power_dbm (int | float): The signal output power.
+        average_count (int): Number of settled sensor readings per frequency.
+        sampling_timeout (float): Maximum settling time per frequency in seconds.
+        tolerance_db (float): Allowed spread of the settled readings.
 
     Returns:
         pd.Series: Pandas Series of measured power at the end of the signal cable (input path loss).
@@ -109,9 +390,14 @@ def calibrate_input_path_loss(
         sensor.set_frequency(freq)
         vsg.set_rf(frequency=freq, source_power=power_dbm)
         vsg.set_output("ON")
-        time.sleep(sampling_timeout)
         input_path_loss[freq] = (
-            np.median([sensor.get_power() for _ in range(average_count)]) - power_dbm
+            read_settled(
+                sensor.get_power,
+                average_count=average_count,
+                tolerance=tolerance_db,
+                max_wait=sampling_timeout,
+            )
+            - power_dbm
         )
     input_path_loss = pd.Series(input_path_loss, name="sg_to_dut_p1_loss_db")
     input_path_loss.index.name = "frequency_hz"
@@ -127,6 +413,7 @@ def calibrate_sa_path_loss(
     adapter_loss=None,
     average_count: int = 10,
     sampling_timeout: float = 1,
+    tolerance_db: float = 0.05,
 ):
     sa_path_loss = {}
     vsa.set_frequency(span=0)
@@ -141,9 +428,14 @@ def calibrate_sa_path_loss(
             frequency=freq, dut_input_level=power_dbm, compensation_offset=compensation
         )
         vsg.set_output("ON")
-        time.sleep(sampling_timeout)
         sa_path_loss[freq] = (
-            np.median([vsa.measure_peak() for _ in range(average_count)]) - power_dbm
+            read_settled(
+                vsa.measure_peak,
+                average_count=average_count,
+                tolerance=tolerance_db,
+                max_wait=sampling_timeout,
+            )
+            - power_dbm
         )
 
     sa_path_loss = pd.Series(sa_path_loss, name="sa_to_dut_p2_loss_db")
@@ -160,6 +452,7 @@ def calibrate_sensor_path_loss(
     adapter_loss=None,
     average_count: int = 10,
     sampling_timeout: float = 1,
+    tolerance_db: float = 0.05,
 ):
     sensor_path_loss = {}
     for freq in frange:
@@ -173,9 +466,14 @@ def calibrate_sensor_path_loss(
             frequency=freq, dut_input_level=power_dbm, compensation_offset=compensation
         )
         vsg.set_output("ON")
-        time.sleep(sampling_timeout)
         sensor_path_loss[freq] = (
-            np.median([sensor.get_power() for _ in range(average_count)]) - power_dbm
+            read_settled(
+                sensor.get_power,
+                average_count=average_count,
+                tolerance=tolerance_db,
+                max_wait=sampling_timeout,
+            )
+            - power_dbm
         )
     sensor_path_loss = pd.Series(sensor_path_loss, name="sensor_to_dut_p2_loss_db")
     sensor_path_loss.index.name = "frequency_hz"
@@ -191,30 +489,51 @@ def calibrate_sa_sensor_path_loss(
     adapter_loss=None,
     average_count: int = 10,
     sampling_timeout: float = 1,
+    tolerance_db: float = 0.05,
 ):
+    """Calibrates the analyzer and sensor paths together.
+
+    The analyzer and sensor are read concurrently. Each reading has settled once its
+    last `window` readings (3, see `read_settled`) lie within `tolerance_db` of each
+    other; it then averages `average_count` readings. A reading that has not settled
+    after `sampling_timeout` seconds averages its last readings anyway.
+
+    The gain over `calibrate_sa_path_loss` and `calibrate_sensor_path_loss` in turn is
+    marginal: the analyzer readings overlap the much slower sensor readings, whose
+    fixed sleeps in `NRPZ86.get_power` set the time per frequency. On the benchmark
+    rig this takes 10.5 s against 1.4 s + 9.5 s in turn, about 3 % less.
+    """
     sa_path_loss = {}
     sensor_path_loss = {}
     vsa.set_frequency(span=0)
     vsg.reset()
-    for freq in frange:
-        vsa.set_frequency(center=freq)
-        sensor.set_frequency(freq)
-        compensation = 0
-        if input_path_loss is not None:
-            compensation = input_path_loss[freq]
-        if adapter_loss is not None:
-            compensation = compensation + adapter_loss[freq]
-        vsg.set_rf(
-            frequency=freq, dut_input_level=power_dbm, compensation_offset=compensation
-        )
-        vsg.set_output("ON")
-        time.sleep(sampling_timeout)
-        sa_path_loss[freq] = (
-            np.median([vsa.measure_peak() for _ in range(average_count)]) - power_dbm
-        )
-        sensor_path_loss[freq] = (
-            np.median([sensor.get_power() for _ in range(average_count)]) - power_dbm
-        )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        for freq in frange:
+            vsa.set_frequency(center=freq)
+            sensor.set_frequency(freq)
+            compensation = 0
+            if input_path_loss is not None:
+                compensation = input_path_loss[freq]
+            if adapter_loss is not None:
+                compensation = compensation + adapter_loss[freq]
+            vsg.set_rf(
+                frequency=freq,
+                dut_input_level=power_dbm,
+                compensation_offset=compensation,
+            )
+            vsg.set_output("ON")
+            sa_reading, sensor_reading = [
+                pool.submit(
+                    read_settled,
+                    read,
+                    average_count=average_count,
+                    tolerance=tolerance_db,
+                    max_wait=sampling_timeout,
+                )
+                for read in [vsa.measure_peak, sensor.get_power]
+            ]
+            sa_path_loss[freq] = sa_reading.result() - power_dbm
+            sensor_path_loss[freq] = sensor_reading.result() - power_dbm
     sa_path_loss = pd.Series(sa_path_loss, name="sa_to_dut_p2_loss_db")
     sa_path_loss.index.name = "frequency_hz"
     sensor_path_loss = pd.Series(sensor_path_loss, name="sensor_to_dut_p2_loss_db")
@@ -269,15 +588,20 @@ Input: """
 def adapter_insertion_loss(
     file: str, freqs: list | None = None, write_to_csv=False
 ) -> pd.Series:
-    import skrf as rf
+    """Returns the adapter S21 in dB from the Touchstone `file` in ./config.
 
+    The parsed file is cached as `.npz` and only re-parsed when it changes. With
+    `freqs`, S21 is interpolated at those frequencies, otherwise the file's own
+    frequencies are used.
+    """
     adapter_calfile = pathlib.Path(__file__).parent / "config" / file
-    df = rf.Network(adapter_calfile).to_dataframe()
-    df.index.name = "frequency_hz"
-    adapter_insertion_loss = df["s_db 21"]
-    adapter_insertion_loss.name = "adapter_s21_db"
-    if freqs is not None:
-        adapter_insertion_loss = adapter_insertion_loss["s_db 21"].filter(items=freqs)
+    adapter = Touchstone(adapter_calfile)
+    if freqs is None:
+        freqs = adapter.frequency
+    adapter_insertion_loss = pd.Series(
+        adapter.s21_db(freqs), index=freqs, name="adapter_s21_db"
+    )
+    adapter_insertion_loss.index.name = "frequency_hz"
     if write_to_csv:
         adapter_insertion_loss.to_csv(
             adapter_calfile.parent / f"{file.removesuffix('.s2p')}.csv"
@@ -287,17 +611,54 @@ def adapter_insertion_loss(
 
 if __name__ == "__main__":
 
+    startup = Startup()
+    startup.mark("imports")
     date = time.strftime("%y%m%d-%Hh%Mm")
 
-    rm = pyvisa.ResourceManager()
-    vsa = FSW43(rm, ip_address=rig["SA"]["FSW43"]["ip"])
-    vsg = SMW200A(rm, ip_address=rig["SG"]["SMW200A"]["ip"])
-    sensor = NRPZ86(
-        rm,
-        device_id=rig["PowerSensor"]["NRP_Z86"]["device_id"],
-        serial=rig["PowerSensor"]["NRP_Z86"]["serial_nu"],
+    parser = argparse.ArgumentParser(description="Calibrates the rig's path loss.")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="estimate the duration without touching the instruments",
+    )
+    if parser.parse_args().dry_run:
+        estimate = dry_run(generate_frange())
+        print(estimate.report())
+        raise SystemExit
+
+    rig = load_rig(cfg["test_rig"])
+    rm = resource_manager(rig, cfg["test_rig"], cfg)
+    # The sessions of an instrument server are shared: no reset, and locked for the
+    # calibration so that no other script changes the instruments in between
+    shared = server_socket(cfg, cfg["test_rig"]) is not None
+    instruments = open_instruments(
+        vsa=lambda: FSW43(rm, ip_address=rig["SA"]["FSW43"]["ip"], reset=not shared),
+        vsg=lambda: SMW200A(
+            rm, ip_address=rig["SG"]["SMW200A"]["ip"], reset=not shared
+        ),
+        sensor=lambda: NRPZ86(
+            rm,
+            device_id=rig["PowerSensor"]["NRP_Z86"]["device_id"],
+            serial=rig["PowerSensor"]["NRP_Z86"]["serial_nu"],
+            reset=not shared,
+        ),
     )
+    vsa, vsg, sensor = instruments["vsa"], instruments["vsg"], instruments["sensor"]
+    if shared:
+        lock_instruments(
+            vsa, vsg, sensor, timeout=cfg["InstrumentServer"].get("lock_timeout", 60)
+        )
+    startup.mark("instruments")
     try:
-        main()
+        if cfg["Calibration"]["incremental"]:
+            main_incremental(
+                spot_checks=cfg["Calibration"]["spot_checks"],
+                tolerance_db=cfg["Calibration"]["tolerance_db"],
+                startup=startup,
+                date=date,
+            )
+        else:
+            main(startup=startup, date=date)
     finally:
         vsg.set_output("OFF")
+    print(startup.report())
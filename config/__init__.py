@@ -1,5 +1,16 @@
-import pandas as pd
+"""Config and rig settings.
+
+Nothing is read at import. `config`, `rig`, `path_loss`, `path_loss_path` and
+`path_loss_store` are loaded on first access and then cached, e.g.
+`from config import config as cfg` parses `config.toml` once. NumPy is only imported
+with the path loss.
+"""
+import functools
 import pathlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from library.path_loss import PathLoss
 
 try:
     import tomllib
@@ -8,16 +19,58 @@ except ModuleNotFoundError:
 
 
 config_path = pathlib.Path(__file__).parent / "config.toml"
-with config_path.open(mode="rb") as fp:
-    config = tomllib.load(fp)
 
-rig_path = pathlib.Path(__file__).parent / f"rig_{config['test_rig']}.toml"
-with rig_path.open(mode="rb") as fp:
-    rig = tomllib.load(fp)
 
-try:
-    path_loss_path = pathlib.Path(__file__).parent / config["path_loss_file"]
-    path_loss = pd.read_csv(path_loss_path, index_col="frequency")
-except:
-    path_loss_path = None
-    path_loss = None
+@functools.cache
+def load_config() -> dict:
+    """Loads `config.toml`."""
+    with config_path.open(mode="rb") as fp:
+        return tomllib.load(fp)
+
+
+def load_rig(name: str) -> dict:
+    """Loads the instrument settings of test rig `name` from `rig_{name}.toml`."""
+    rig_path = pathlib.Path(__file__).parent / f"rig_{name}.toml"
+    with rig_path.open(mode="rb") as fp:
+        return tomllib.load(fp)
+
+
+def load_path_loss(rig_name: str, file: str = "") -> tuple[pathlib.Path, "PathLoss"]:
+    """Loads a path loss file from the config directory or, without `file`, the latest
+    calibrations of `rig_name` from the path loss store in `config/pathloss/`."""
+    from library.path_loss import PathLoss, PathLossStore
+
+    max_extrapolation_hz = load_config().get("path_loss_max_extrapolation_hz", 0)
+    if file:
+        path_loss = PathLoss.from_csv(
+            pathlib.Path(__file__).parent / file,
+            max_extrapolation_hz=max_extrapolation_hz,
+        )
+    else:
+        path_loss = PathLossStore(pathlib.Path(__file__).parent / "pathloss").load(
+            rig_name, max_extrapolation_hz=max_extrapolation_hz
+        )
+    return path_loss.sources[0], path_loss
+
+
+def __getattr__(name: str):
+    match name:
+        case "config":
+            value = load_config()
+        case "rig":
+            value = load_rig(load_config()["test_rig"])
+        case "path_loss" | "path_loss_path":
+            test_rig = load_config()["test_rig"]
+            file = load_rig(test_rig).get("path_loss_file", load_config()["path_loss_file"])
+            globals()["path_loss_path"], globals()["path_loss"] = load_path_loss(
+                test_rig, file
+            )
+            return globals()[name]
+        case "path_loss_store":
+            from library.path_loss import PathLossStore
+
+            value = PathLossStore(pathlib.Path(__file__).parent / "pathloss")
+        case _:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -0,0 +1,269 @@
+"""Compiled test plan.
+
+`compile_plan` resolves and validates everything a run reads from the config once,
+before any instrument is touched, into an immutable `TestPlan`:
+
+    plan = compile_plan(config, product="Product-A", rig_name="A", path_loss=path_loss)
+    plan.aclr.waveform  # "'/usb/UDISK/5GNR_ETM31_4X20MHZ_85DB_CCDF001'"
+"""
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from library.settling import CONTEXTS, Settling, settling_contexts
+
+if TYPE_CHECKING:
+    from library.path_loss import PathLoss
+
+
+class PlanError(ValueError):
+    """Raised when the config does not describe a runnable test plan."""
+
+
+@dataclass(frozen=True)
+class Supplies:
+    vcc: float
+    icc: float
+    vbias: float
+    ibias: float
+    vpaen: float
+    ipaen: float
+
+
+@dataclass(frozen=True)
+class Sweep:
+    start_dbm: float
+    stop_dbm: float
+    step_dbm: float
+
+
+@dataclass(frozen=True)
+class Aclr:
+    signal_bandwidth: float
+    carrier_number: int
+    channel_bandwidth: float
+    adjacent_channels: int
+    waveform: str
+    resolution_bandwidth: float
+    sweep_time: float
+    sa_ref_level: float
+    sa_inp_att_level: int
+    sg_att_level: int
+    # Waveforms of all products, loaded as one multi-segment waveform if not empty
+    segments: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Dpd:
+    iteration: int
+    tradeoff: int
+    gain_expansion_db: float | None
+    iq_count: int | None
+    estimation_range: tuple[float, float] | None
+    # Stop a sequence once an iteration improves the EVM less, None runs all
+    min_evm_improvement_pct: float | None = None
+
+
+@dataclass(frozen=True)
+class TestPlan:
+    product: str
+    rig: str
+    lasig_frequencies: tuple[float, ...]
+    modulated_frequencies: tuple[float, ...]
+    pout_targets: tuple[float, ...]
+    sweep: Sweep
+    supplies: Supplies
+    aclr: Aclr
+    dpd: Dpd
+    # Settling criteria per measurement context, see `library.settling`
+    settling: dict[str, Settling] = field(default_factory=lambda: dict(CONTEXTS))
+    # Age up to which repeated readings are served, see `library.measurement_cache`
+    readings_freshness_s: float = 0
+
+
+# ARB waveforms per (carrier number, signal bandwidth): ACLR channel bandwidth,
+# adjacent channels (None: one per carrier) and file name
+WAVEFORMS = {
+    20e6: (19080000, None, "5GNR_ETM31_{carrier_number}X20MHZ_85DB_CCDF001"),
+    100e6: (98280000, 2, "5gnrfdd_BW_100_CF_8.5dB_mkr"),
+}
+
+USB_DRIVES = {"a": "UDISK", "b": "GG"}
+
+
+def compile_plan(
+    cfg: dict,
+    product: str,
+    rig_name: str,
+    rig_settings: dict | None = None,
+    path_loss: "PathLoss | None" = None,
+) -> TestPlan:
+    """Resolves and validates the test plan of `product` on rig `rig_name`.
+
+    Args:
+        cfg (dict): Parsed `config.toml`.
+        product (str): Product section to test.
+        rig_name (str): Test rig, selects the USB drive holding the ARB waveforms.
+        rig_settings (dict, optional): Parsed rig file. `[SG] SMW200A.usb_drive`
+            overrides the default USB drive of the rig.
+        path_loss (PathLoss, optional): If given, every test frequency must be covered.
+
+    Raises:
+        PlanError: If a setting is missing or invalid.
+    """
+    try:
+        section = cfg[product]
+    except KeyError:
+        raise PlanError(f"No [{product}] section in the config") from None
+
+    try:
+        plan = TestPlan(
+            product=product,
+            rig=rig_name,
+            lasig_frequencies=frequencies(section, "lasig"),
+            modulated_frequencies=frequencies(section, "modulated"),
+            pout_targets=pout_targets(cfg["pout_target_dbm"]),
+            sweep=Sweep(
+                start_dbm=float(section["sweep_start_dbm"]),
+                stop_dbm=float(section["sweep_stop_dbm"]),
+                step_dbm=float(section["sweep_step_dbm"]),
+            ),
+            supplies=Supplies(
+                vcc=cfg["PowerSupply"]["ps1_ch1_voltage"],
+                icc=cfg["PowerSupply"]["ps1_ch1_current"],
+                vbias=cfg["PowerSupply"]["ps2_ch1_voltage"],
+                ibias=cfg["PowerSupply"]["ps2_ch1_current"],
+                vpaen=cfg["PowerSupply"]["ps2_ch2_voltage"],
+                ipaen=cfg["PowerSupply"]["ps2_ch2_current"],
+            ),
+            aclr=aclr(cfg, section, rig_name, rig_settings or {}),
+            dpd=Dpd(
+                iteration=int(cfg["DPD"]["iteration"]),
+                tradeoff=int(cfg["DPD"]["tradeoff"]),
+                gain_expansion_db=section.get("dpd_expansion"),
+                iq_count=cfg["DPD"]["iq_count"] if cfg["DPD"]["iq_flag"] else None,
+                estimation_range=(
+                    tuple(cfg["DPD"]["estim_range"])
+                    if cfg["DPD"]["estim_flag"]
+                    else None
+                ),
+                min_evm_improvement_pct=(
+                    cfg["DPD"].get("min_evm_improvement_pct") or None
+                ),
+            ),
+            settling=settling_contexts(cfg.get("Settling", {})),
+            readings_freshness_s=cfg.get("Readings", {}).get("freshness_s", 0),
+        )
+    except KeyError as key:
+        raise PlanError(f"Missing setting {key} for {product}") from None
+    except ValueError as error:
+        raise PlanError(str(error)) from None
+
+    if plan.sweep.step_dbm <= 0 or plan.sweep.start_dbm >= plan.sweep.stop_dbm:
+        raise PlanError(f"Invalid sweep {plan.sweep} for {product}")
+    if not 1 <= plan.dpd.iteration <= 1000:
+        raise PlanError(f"DPD iteration must be 1 to 1000, not {plan.dpd.iteration}")
+    if not 0 <= plan.dpd.tradeoff <= 100:
+        raise PlanError(f"DPD tradeoff must be 0 to 100, not {plan.dpd.tradeoff}")
+    if plan.readings_freshness_s < 0:
+        raise PlanError(f"Invalid readings freshness {plan.readings_freshness_s}")
+    if path_loss is not None:
+        # The input loss is looked up at the swept Pin, the output losses at the Pout
+        drive_levels = [
+            ("sg_to_dut_p1_loss_db", plan.sweep.start_dbm),
+            ("sg_to_dut_p1_loss_db", plan.sweep.stop_dbm),
+        ] + [
+            (column, pout)
+            for column in ("sa_to_dut_p2_loss_db", "sensor_to_dut_p2_loss_db")
+            for pout in plan.pout_targets
+        ]
+        for freq in plan.lasig_frequencies + plan.modulated_frequencies:
+            try:
+                for column, power in drive_levels:
+                    path_loss.loss(freq, column, power=power)
+            except ValueError as error:
+                raise PlanError(f"No path loss for {product}: {error}") from None
+
+    return plan
+
+
+def frequencies(section: dict, kind: str) -> tuple[float, ...]:
+    freqs = section["Freqs"][kind]
+    if not freqs or not all(isinstance(f, (int, float)) and f > 0 for f in freqs):
+        raise PlanError(f"Invalid {kind} frequencies {freqs}")
+    return tuple(float(f) for f in freqs)
+
+
+def pout_targets(targets) -> tuple[float, ...]:
+    match targets:
+        case int() | float():
+            return (targets,)
+        case list() if targets and all(isinstance(t, (int, float)) for t in targets):
+            return tuple(targets)
+        case _:
+            raise PlanError(f"Invalid pout_target_dbm {targets}")
+
+
+def aclr(cfg: dict, section: dict, rig_name: str, rig_settings: dict) -> Aclr:
+    carrier_number = section["carrier_number"]
+    signal_bandwidth = section["signal_bw"]
+    channel_bandwidth, adjacent_channels, waveform = resolve_waveform(
+        carrier_number, signal_bandwidth
+    )
+
+    usb_drive = rig_settings.get("SG", {}).get("SMW200A", {}).get("usb_drive")
+    if usb_drive is None and (usb_drive := USB_DRIVES.get(rig_name.casefold())) is None:
+        raise PlanError(f"No USB drive known for rig {rig_name}")
+
+    segments = ()
+    if cfg["ACLR"].get("multi_segment"):
+        segments = tuple(
+            sorted({f"'/usb/{usb_drive}/{name}'" for name in product_waveforms(cfg)})
+        )
+
+    return Aclr(
+        signal_bandwidth=signal_bandwidth,
+        carrier_number=carrier_number,
+        channel_bandwidth=channel_bandwidth,
+        adjacent_channels=adjacent_channels,
+        waveform=f"'/usb/{usb_drive}/{waveform}'",
+        resolution_bandwidth=cfg["ACLR"]["resolution_bandwidth"],
+        sweep_time=cfg["ACLR"]["sweep_time"],
+        sa_ref_level=section["sa_ref_level"],
+        sa_inp_att_level=section["sa_inp_att_level"],
+        sg_att_level=section["sg_att_level"],
+        segments=segments,
+    )
+
+
+def resolve_waveform(
+    carrier_number: int, signal_bandwidth: float
+) -> tuple[float, int, str]:
+    """Returns the channel bandwidth, adjacent channel count and ARB waveform name
+    of a carrier configuration."""
+    match (carrier_number, WAVEFORMS.get(signal_bandwidth)):
+        case (int(), (channel_bandwidth, None, waveform)):
+            adjacent_channels = carrier_number
+        case (1, (channel_bandwidth, int() as adjacent_channels, waveform)):
+            pass
+        case _:
+            raise PlanError(
+                f"No waveform for {carrier_number} x {signal_bandwidth / 1e6:g} MHz"
+            )
+    waveform = waveform.format(carrier_number=carrier_number)
+    return channel_bandwidth, adjacent_channels, waveform
+
+
+def product_waveforms(cfg: dict) -> list[str]:
+    """Returns the ARB waveform names of all products in the config with a valid
+    carrier configuration."""
+    names = []
+    for section in cfg.values():
+        if not isinstance(section, dict) or "signal_bw" not in section:
+            continue
+        try:
+            names.append(
+                resolve_waveform(section.get("carrier_number"), section["signal_bw"])[2]
+            )
+        except PlanError:
+            pass
+    return names
@@ -0,0 +1,44 @@
+"""Keeps the instrument sessions of the configured test rig open for the scripts.
+
+Run it in a terminal of its own; with `connect = true` under `[InstrumentServer]` in
+`config.toml`, `pa_characterization.py`, `calibrate.py` and `orchestrate.py` then use
+its sessions instead of opening their own (see `library/instrument_server.py`):
+
+    python instrument_server.py        # the configured `test_rig`
+    python instrument_server.py B      # rig B
+"""
+# Standard library imports
+import argparse
+
+# Local imports
+from config import config as cfg, load_rig
+from library.instrument_server import InstrumentServer
+from library.rig import resource_manager, resource_names, socket_path
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rig", nargs="?", default=cfg["test_rig"], help="rig name")
+    name = parser.parse_args().rig
+
+    settings = load_rig(name)
+    # The server opens the sessions itself, recorded if configured
+    rm = resource_manager(settings, name, cfg | {"InstrumentServer": {}})
+    server_settings = cfg.get("InstrumentServer", {})
+    server = InstrumentServer(
+        rm,
+        socket_path(server_settings, name),
+        lock_timeout=server_settings.get("lock_timeout", 60),
+    )
+    for instrument, resource_name in resource_names(settings).items():
+        server.open(resource_name)
+        print(f"Opened {instrument}: {resource_name}")
+
+    print(f"Serving rig {name} on {server.path}, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,301 @@
+"""Fleet analytics over the results store.
+
+`FleetSummary` keeps mergeable per-group summaries (count, mean, variance, min/max,
+a fixed-width histogram for percentiles and regression sums for drift) for every
+(product, metric, frequency, condition). New runs are folded in incrementally, so
+adding one serial only costs the rows of that serial:
+
+    from library.analytics import FleetSummary, fleet_limits
+    from library.results import ResultsStore
+
+    store = ResultsStore("log/results")
+    summary = FleetSummary.load(store.root / "_analytics")
+    summary.ingest(store)
+    summary.save(store.root / "_analytics")
+    print(summary.statistics(limits=fleet_limits(cfg, summary.products())))
+"""
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from library.results import ResultsStore
+
+
+GROUP = ["product", "metric", "frequency_hz", "condition"]
+MOMENTS = ["n", "mean", "m2", "min", "max", "t_sum", "t2_sum", "x_sum", "xt_sum"]
+EPOCH = pd.Timestamp("2020-01-01")
+
+
+class FleetSummary:
+    def __init__(self, bin_width: float = 0.01):
+        """
+        Args:
+            bin_width (float): Histogram resolution in the metric's unit (dB, %), which
+                bounds the percentile error. Defaults to 0.01.
+        """
+        self.bin_width = bin_width
+        self.clear()
+
+    def clear(self) -> None:
+        """Empties the summary."""
+        self.moments = pd.DataFrame(
+            columns=MOMENTS, index=pd.MultiIndex.from_tuples([], names=GROUP)
+        )
+        self.histogram = pd.Series(
+            dtype="int64",
+            index=pd.MultiIndex.from_tuples([], names=GROUP + ["bin"]),
+            name="count",
+        )
+        # Modification time (ns) of each ingested file, by file
+        self.ingested = {}
+
+    def ingest(self, store: ResultsStore) -> int:
+        """Folds every run of `store` that is not yet part of the summary.
+
+        A run appended again rewrites its file. The rows it replaced cannot be taken
+        out of the moments and histogram, so the summary is then rebuilt from the
+        whole store.
+
+        Returns:
+            int: Number of newly ingested files.
+        """
+        index = store.index()
+        index = index[index["table"].isin(["lasig", "aclr"])]
+        files = index.drop_duplicates("file")
+        modified = {
+            file: (store.root / file).stat().st_mtime_ns for file in files["file"]
+        }
+        if any(self.ingested.get(f, mtime) != mtime for f, mtime in modified.items()):
+            self.clear()
+        new = files[~files["file"].isin(self.ingested.keys())]
+        for table, group in new.groupby("table")["file"]:
+            self.update(melt(table, store.read(table, list(group))))
+            self.ingested.update({file: modified[file] for file in group})
+        return len(new)
+
+    def update(self, values: pd.DataFrame) -> None:
+        """Merges a long-format frame (`GROUP` columns, `value`, `timestamp`)."""
+        values = values.dropna(subset=["value"])
+        if values.empty:
+            return
+        values = values.assign(
+            condition=values["condition"].fillna(""),
+            t=(pd.to_datetime(values["timestamp"]) - EPOCH) / pd.Timedelta(days=1),
+        )
+        values = values.assign(
+            t2=values["t"] ** 2,
+            xt=values["value"] * values["t"],
+            bin=np.floor(values["value"] / self.bin_width).astype("int64"),
+        )
+
+        grouped = values.groupby(GROUP)
+        batch = grouped["value"].agg(["count", "mean", "var", "min", "max", "sum"])
+        batch = pd.DataFrame(
+            {
+                "n": batch["count"],
+                "mean": batch["mean"],
+                "m2": batch["var"].fillna(0) * (batch["count"] - 1),
+                "min": batch["min"],
+                "max": batch["max"],
+                "t_sum": grouped["t"].sum(),
+                "t2_sum": grouped["t2"].sum(),
+                "x_sum": batch["sum"],
+                "xt_sum": grouped["xt"].sum(),
+            }
+        )
+        self.moments = merge_moments(self.moments, batch)
+
+        counts = values.groupby(GROUP + ["bin"]).size().rename("count")
+        self.histogram = self.histogram.add(counts, fill_value=0).astype("int64")
+
+    def percentiles(self, q: tuple[float, ...] = (5, 50, 95)) -> pd.DataFrame:
+        """Returns the requested percentiles per group, resolved to `bin_width`."""
+        histogram = self.histogram.sort_index()
+        cumulative = histogram.groupby(level=GROUP).cumsum()
+        total = histogram.groupby(level=GROUP).transform("sum")
+        res = {}
+        for p in q:
+            reached = cumulative >= total * p / 100
+            first = reached[reached].groupby(level=GROUP).head(1)
+            res[f"p{p:g}"] = pd.Series(
+                (first.index.get_level_values("bin").to_numpy() + 0.5)
+                * self.bin_width,
+                index=first.index.droplevel("bin"),
+            )
+        return pd.DataFrame(res).reindex(self.moments.index)
+
+    def products(self) -> list[str]:
+        """Returns the products in the summary."""
+        return list(self.moments.index.unique("product"))
+
+    def statistics(
+        self,
+        limits: dict[str, dict[str, tuple[float | None, float | None]]] | None = None,
+    ) -> pd.DataFrame:
+        """Returns count, mean, std, min/max, percentiles and drift per group.
+
+        Args:
+            limits (dict, optional): `{product: {metric: (lsl, usl)}}`, see
+                `fleet_limits()`. When given, `cpk` and `yield_pct` are added for the
+                metrics that have limits, each against the limits of its own product.
+        """
+        m = self.moments.astype("float64")
+        n = m["n"]
+        std = np.sqrt(m["m2"] / (n - 1).where(n > 1))
+        slope_denominator = n * m["t2_sum"] - m["t_sum"] ** 2
+        stats = pd.DataFrame(
+            {
+                "n": n.astype("int64"),
+                "mean": m["mean"],
+                "std": std,
+                "min": m["min"],
+                "max": m["max"],
+            }
+        ).join(self.percentiles())
+        stats["drift_per_day"] = (
+            n * m["xt_sum"] - m["x_sum"] * m["t_sum"]
+        ) / slope_denominator.where(slope_denominator > 0)
+
+        if limits:
+            bounds = [
+                limits.get(product, {}).get(metric, (None, None))
+                for product, metric in zip(
+                    stats.index.get_level_values("product"),
+                    stats.index.get_level_values("metric"),
+                )
+            ]
+            lsl = pd.Series([b[0] for b in bounds], index=stats.index).astype("float64")
+            usl = pd.Series([b[1] for b in bounds], index=stats.index).astype("float64")
+            cpk = pd.concat(
+                [(stats["mean"] - lsl) / (3 * std), (usl - stats["mean"]) / (3 * std)],
+                axis=1,
+            )
+            stats["cpk"] = cpk.min(axis=1, skipna=True).where(cpk.notna().any(axis=1))
+
+            centers = (
+                self.histogram.index.get_level_values("bin").to_numpy() + 0.5
+            ) * self.bin_width
+            key = self.histogram.index.droplevel("bin")
+            bin_lsl = lsl.reindex(key).fillna(-np.inf).to_numpy()
+            bin_usl = usl.reindex(key).fillna(np.inf).to_numpy()
+            passed = self.histogram.where((centers >= bin_lsl) & (centers <= bin_usl), 0)
+            stats["yield_pct"] = (
+                100 * passed.groupby(level=GROUP).sum() / stats["n"]
+            ).where(lsl.notna() | usl.notna())
+
+        return stats
+
+    def save(self, path: str | pathlib.Path) -> None:
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.moments.reset_index().to_parquet(path / "moments.parquet")
+        self.histogram.reset_index().to_parquet(path / "histogram.parquet")
+        pd.DataFrame(
+            {
+                "file": sorted(self.ingested),
+                "mtime_ns": [self.ingested[file] for file in sorted(self.ingested)],
+                "bin_width": self.bin_width,
+            }
+        ).to_parquet(path / "ingested.parquet")
+
+    @classmethod
+    def load(cls, path: str | pathlib.Path, bin_width: float = 0.01) -> "FleetSummary":
+        """Loads a saved summary, or returns an empty one if `path` holds none."""
+        path = pathlib.Path(path)
+        if not (path / "ingested.parquet").exists():
+            return cls(bin_width=bin_width)
+        ingested = pd.read_parquet(path / "ingested.parquet")
+        summary = cls(
+            bin_width=ingested["bin_width"].iloc[0] if len(ingested) else bin_width
+        )
+        summary.moments = pd.read_parquet(path / "moments.parquet").set_index(GROUP)
+        summary.histogram = (
+            pd.read_parquet(path / "histogram.parquet")
+            .set_index(GROUP + ["bin"])["count"]
+        )
+        summary.ingested = dict(zip(ingested["file"], ingested["mtime_ns"]))
+        return summary
+
+
+def merge_moments(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Merges two moment tables group-wise (Chan et al. parallel variance)."""
+    if a.empty:
+        return b[MOMENTS].astype("float64")
+    index = a.index.union(b.index)
+    a = a.reindex(index).astype("float64")
+    b = b.reindex(index).astype("float64")
+    na = a["n"].fillna(0)
+    nb = b["n"].fillna(0)
+    n = na + nb
+    delta = b["mean"].fillna(0) - a["mean"].fillna(0)
+    merged = pd.DataFrame(index=index)
+    merged["n"] = n
+    merged["mean"] = a["mean"].fillna(0) + delta * nb / n
+    merged["m2"] = a["m2"].fillna(0) + b["m2"].fillna(0) + delta**2 * na * nb / n
+    merged["min"] = pd.concat([a["min"], b["min"]], axis=1).min(axis=1)
+    merged["max"] = pd.concat([a["max"], b["max"]], axis=1).max(axis=1)
+    for column in ["t_sum", "t2_sum", "x_sum", "xt_sum"]:
+        merged[column] = a[column].fillna(0) + b[column].fillna(0)
+    return merged
+
+
+def melt(table: str, frame: pd.DataFrame) -> pd.DataFrame:
+    """Converts a results store table into long format, one row per metric value.
+
+    LASIG compression points (`op1db`, `op3db`, `op5db`) become metrics of their own,
+    every other numeric column is a metric under its `condition` (Pout target).
+    """
+    frame = frame.assign(
+        timestamp=pd.to_datetime(frame["run"], format="%y%m%d-%Hh%Mm", errors="coerce")
+    )
+    keys = ["product", "serial", "timestamp", "frequency_hz", "condition"]
+    frame["product"] = frame["product"].astype(str)
+
+    parts = []
+    if table == "lasig":
+        compression = frame["condition"].isin(["op1db", "op3db", "op5db"])
+        points = frame.loc[compression, keys + ["pout_dbm"]].rename(
+            columns={"pout_dbm": "value"}
+        )
+        points["metric"] = points["condition"]
+        points["condition"] = ""
+        parts.append(points)
+        frame = frame[~compression]
+
+    metrics = [
+        column
+        for column in frame.columns
+        if column not in keys + ["run", "date", "pout_target"]
+        and pd.api.types.is_numeric_dtype(frame[column])
+    ]
+    parts.append(
+        frame.melt(id_vars=keys, value_vars=metrics, var_name="metric", value_name="value")
+    )
+    return pd.concat(parts, ignore_index=True)
+
+
+def limits(cfg: dict, product: str) -> dict[str, tuple[float | None, float | None]]:
+    """Reads `[<product>.Limits]` from the config into `{metric: (lsl, usl)}`."""
+    return {
+        metric: (limit.get("lsl"), limit.get("usl"))
+        for metric, limit in cfg[product].get("Limits", {}).items()
+    }
+
+
+def fleet_limits(
+    cfg: dict, products: list[str]
+) -> dict[str, dict[str, tuple[float | None, float | None]]]:
+    """Reads the limits of every product in `products` that has a config section."""
+    return {product: limits(cfg, product) for product in products if product in cfg}
+
+
+if __name__ == "__main__":
+    from config import config as cfg
+
+    store = ResultsStore(pathlib.Path(__file__).parents[1] / cfg["results_dir"])
+    summary = FleetSummary.load(store.root / "_analytics")
+    print(f"Ingested {summary.ingest(store)} new result files")
+    summary.save(store.root / "_analytics")
+    with pd.option_context("display.max_rows", None, "display.width", None):
+        print(summary.statistics(limits=fleet_limits(cfg, summary.products())))
@@ -0,0 +1,146 @@
+"""Warm-started direct DPD with early stopping.
+
+The direct DPD of the FSW-K18 converges to similar corrections at neighbouring
+frequencies and output powers. `DirectDpd` saves the correction of each condition on
+the analyzer and starts the next sequence from the nearest saved one, and it aborts a
+sequence once an iteration improves the EVM by less than a threshold:
+
+    dpd = DirectDpd(vsa, max_iterations=10, min_improvement_pct=0.05,
+                    correction_dir="C:\\R_S\\Instr\\user\\ddpd", name="Product-A_A")
+    for frequency in frequencies:
+        for pout in pout_targets:
+            ...  # set up the DPD channel, drive the DUT to `pout`
+            result = dpd.run(frequency, pout)
+
+Without `correction_dir` every sequence starts from scratch, and without
+`min_improvement_pct` every sequence runs `max_iterations`, like `start_ddpd` alone.
+"""
+import dataclasses
+import time
+
+from library import tracing
+from library.drivers.vsa import FSW43
+
+
+@dataclasses.dataclass
+class DpdResult:
+    """Outcome of one direct DPD sequence.
+
+    Args:
+        frequency (float): Carrier frequency in Hz.
+        pout_dbm (float): Output power target.
+        iterations (int): Iterations run.
+        evm_pct (float | None): Raw EVM after the last iteration, read only for the
+            early stop.
+        correction (str | None): Saved correction file on the analyzer.
+        seed (DpdResult | None): Result whose correction the sequence started from.
+    """
+
+    frequency: float
+    pout_dbm: float
+    iterations: int
+    evm_pct: float | None = None
+    correction: str | None = None
+    seed: "DpdResult | None" = None
+
+
+class DirectDpd:
+    """Runs direct DPD sequences on `vsa`, see the module docstring.
+
+    Args:
+        vsa (FSW43): Analyzer with a configured DPD channel.
+        max_iterations (int): Iterations of a sequence, as configured with
+            `configure_ddpd(count=...)`.
+        min_improvement_pct (float, optional): Stop once an iteration lowers the raw
+            EVM by less than this many percentage points.
+        correction_dir (str, optional): Analyzer folder for the corrections of the
+            warm start.
+        name (str, optional): Prefix of the correction files, e.g. product and rig, so
+            that a sequence only starts from corrections of the same DUT type.
+        hz_per_db (float, optional): Frequency offset weighing as much as 1 dB of
+            output power when looking for the nearest correction. Defaults to 50 MHz.
+        poll_s (float, optional): Interval of the progress queries.
+        timeout_s (float, optional): Seconds after which a sequence that has not
+            finished is stopped. Defaults to 30 s per iteration.
+    """
+
+    def __init__(
+        self,
+        vsa: FSW43,
+        max_iterations: int,
+        min_improvement_pct: float | None = None,
+        correction_dir: str = "",
+        name: str = "",
+        hz_per_db: float = 50e6,
+        poll_s: float = 1.0,
+        timeout_s: float | None = None,
+    ):
+        self.vsa = vsa
+        self.max_iterations = max_iterations
+        self.min_improvement_pct = min_improvement_pct
+        self.correction_dir = correction_dir
+        self.name = name
+        self.hz_per_db = hz_per_db
+        self.poll_s = poll_s
+        self.timeout_s = 30.0 * max_iterations if timeout_s is None else timeout_s
+        self.results = []
+
+    def nearest(self, frequency: float, pout_dbm: float) -> DpdResult | None:
+        """Returns the saved result closest to a condition, if any."""
+        return min(
+            (result for result in self.results if result.correction is not None),
+            key=lambda result: abs(result.frequency - frequency) / self.hz_per_db
+            + abs(result.pout_dbm - pout_dbm),
+            default=None,
+        )
+
+    def run(self, frequency: float, pout_dbm: float) -> DpdResult:
+        """Runs one sequence at the current condition, seeded from the nearest saved
+        correction, and saves its correction for the next ones.
+
+        Raises:
+            TimeoutError: If the sequence has not finished within `timeout_s`. It is
+                stopped first.
+        """
+        vsa = self.vsa
+        seed = self.nearest(frequency, pout_dbm)
+        if seed is not None:
+            vsa.load_ddpd(seed.correction)
+            vsa.apply_ddpd(state="on")
+
+        early_stop = self.min_improvement_pct is not None
+        evm_pct = vsa.get_raw_evm_current() if early_stop else None
+        iteration = 0
+        with tracing.span("ddpd", iterations=self.max_iterations, warm=bool(seed)):
+            vsa.start_ddpd()
+            deadline = time.perf_counter() + self.timeout_s
+            while iteration < self.max_iterations:
+                if time.perf_counter() > deadline:
+                    vsa.stop_ddpd()
+                    raise TimeoutError(
+                        f"Direct DPD stopped at iteration {iteration} of "
+                        f"{self.max_iterations} after {self.timeout_s:g} s"
+                    )
+                time.sleep(self.poll_s)
+                current = vsa.get_ddpd_iteration()
+                if current == iteration:
+                    continue
+                iteration = current
+                if not early_stop:
+                    continue
+                previous, evm_pct = evm_pct, vsa.get_raw_evm_current()
+                if previous - evm_pct < self.min_improvement_pct:
+                    break
+            if iteration < self.max_iterations:
+                vsa.stop_ddpd()
+
+        result = DpdResult(frequency, pout_dbm, iteration, evm_pct, seed=seed)
+        if self.correction_dir:
+            prefix = f"{self.name}_" if self.name else ""
+            result.correction = (
+                f"{self.correction_dir}\\{prefix}ddpd_{frequency / 1e6:.0f}MHz_"
+                f"{pout_dbm:g}dBm"
+            )
+            vsa.store_ddpd(result.correction)
+        self.results.append(result)
+        return result
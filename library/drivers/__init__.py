@@ -1,12 +1,17 @@
 import math
+from typing import TYPE_CHECKING
 
-from pyvisa import ResourceManager
+if TYPE_CHECKING:
+    from pyvisa import ResourceManager
 
 
 class Instrument:
+    # Expected in the `*IDN?` response, checked by `identify`
+    MODEL: str | None = None
+
     def __init__(
         self,
-        rm: ResourceManager,
+        rm: "ResourceManager",
         ip_address: str,
         timeout: int = 5000,
         reset: bool = True,
@@ -25,7 +30,23 @@ class Instrument:
         else:
             self.instrument.write("*RST")
         if clear_status:
-            self.instrument.write("*CLS")
+            self.clear_status()
+
+    def clear_status(self) -> None:
+        """Clears the error queue and status registers (`*CLS`)."""
+        self.instrument.write("*CLS")
+
+    def identify(self) -> str:
+        """Returns the `*IDN?` response.
+
+        Raises:
+            ConnectionError: If the response does not name the expected `MODEL`, e.g.
+                when a rig file points at the wrong instrument.
+        """
+        idn = self.instrument.query("*IDN?").strip()
+        if self.MODEL is not None and self.MODEL.casefold() not in idn.casefold():
+            raise ConnectionError(f"Expected a {self.MODEL}, {idn!r} answered")
+        return idn
 
     @staticmethod
     def watt_to_dbm(watt):
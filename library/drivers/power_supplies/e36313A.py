@@ -2,6 +2,8 @@ from library.drivers import Instrument
 
 
 class E36313A(Instrument):
+    MODEL = "E36313A"
+
     def set_channel(self, channel: int, voltage: float, current: float) -> None:
         """Sets the voltage and current of the selected channel."""
         self.instrument.write(f"APPL CH{channel}, {voltage}, {current}")
@@ -4,6 +4,8 @@ from library.drivers import Instrument
 
 
 class NRPZ86(Instrument):
+    MODEL = "NRP-Z86"
+
     def __init__(
         self, rm, device_id: str, serial: str, timeout: int = 5000, reset=True
     ):
@@ -0,0 +1 @@
+from .rf_switch import RFSwitch
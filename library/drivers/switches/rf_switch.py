@@ -0,0 +1,14 @@
+from library.drivers import Instrument
+
+
+class RFSwitch(Instrument):
+    """SCPI controlled RF switch connecting its common port to one of its numbered
+    ports, e.g. a shared analyzer to the DUT output of one of several rigs."""
+
+    def select(self, port: int) -> None:
+        """Connects the common port to `port` and waits for the relay to settle."""
+        self.instrument.query(f"ROUT:CLOS (@{port});*OPC?")
+
+    def get_port(self) -> int:
+        """Returns the port connected to the common port."""
+        return int(self.instrument.query("ROUT:CLOS:STAT?").strip("()@\n"))
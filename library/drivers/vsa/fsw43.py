@@ -2,6 +2,8 @@ from library.drivers import Instrument
 
 
 class FSW43(Instrument):
+    MODEL = "FSW"
+
     def select_channel(self, name: str) -> None:
         """Selects and opens the channel passed in `name`."""
         self.instrument.write(f"INST {name!r}")
@@ -387,6 +389,21 @@ class FSW43(Instrument):
         """Initiates a direct DPD sequence with the number of iterations defined."""
         self.instrument.write("CONF:DDPD:STAR")
 
+    def stop_ddpd(self) -> None:
+        """Aborts a running direct DPD sequence, keeping the correction of the last
+        completed iteration."""
+        self.instrument.query("ABOR;*OPC?")
+
+    def store_ddpd(self, path: str) -> None:
+        """Saves the current direct DPD correction to the file `path` on the
+        analyzer."""
+        self.instrument.query(f"MMEM:STOR:DDPD '{path}';*OPC?")
+
+    def load_ddpd(self, path: str) -> None:
+        """Loads a direct DPD correction saved by `store_ddpd`. A following
+        sequence starts from it once applied (`apply_ddpd`)."""
+        self.instrument.query(f"MMEM:LOAD:DDPD '{path}';*OPC?")
+
     def get_ddpd_iteration(self) -> int:
         """Queries the process of the direct DPD sequence (number of current
         iteration).
@@ -398,7 +415,7 @@ class FSW43(Instrument):
 
     def get_ddpd_operation_status(self) -> bool:
         """Queries the state of a direct DPD operation."""
-        return bool(self.instrument.query("FETC:DDPD:OPER:STAT?")[0])
+        return bool(int(self.instrument.query("FETC:DDPD:OPER:STAT?").split(",")[0]))
 
     def apply_ddpd(self, state: bool | str) -> None:
         """Transfers the waveform file with the correction values to the signal generator and applies them to the input signal.
@@ -435,6 +452,10 @@ class FSW43(Instrument):
                 case "off" | "false":
                     self.instrument.query("CONF:GEN:CONT OFF;*OPC?")
 
+    def get_generator_connection(self) -> bool:
+        """Queries whether the connection to the signal generator is established."""
+        return self.instrument.query("CONF:GEN:CONN:STAT?").strip() in ("1", "ON")
+
     def configure_reference_signal(
         self,
         load_filepath: str | None = None,
@@ -486,6 +507,13 @@ class FSW43(Instrument):
 
         return res
 
+    def get_aclr_channel_count(self) -> tuple[int, int]:
+        """Returns the number of transmission channels and of adjacent channel pairs
+        of the ACLR measurement, see `configure_aclr`."""
+        transmission = int(self.instrument.query("POW:ACH:TXCH:COUN?"))
+        adjacent = int(self.instrument.query("POW:ACH:ACP?"))
+        return transmission, adjacent
+
     def get_power_maximum(self) -> float:
         """Returns the maximum signal power at the DUT output as shown in the Result Summary."""
         return float(self.instrument.query("FETC:POW:OUTP:MAX?"))
@@ -509,3 +537,70 @@ class FSW43(Instrument):
     def get_raw_evm_current(self) -> float:
         """Returns the current raw EVM (in %) as shown in the Result Summary."""
         return float(self.instrument.query("FETC:MACC:REVM:CURR?"))
+
+    # ------------------------
+    # Instrument state
+
+    def save_state(self, register: int) -> None:
+        """Saves the current setup to the state `register` (`*SAV`)."""
+        self.instrument.query(f"*SAV {register};*OPC?")
+
+    def recall_state(self, register: int) -> None:
+        """Restores the setup saved to the state `register` (`*RCL`)."""
+        self.instrument.query(f"*RCL {register};*OPC?")
+
+    def store_setup(self, path: str) -> None:
+        """Saves the complete setup, all channels included, to the save set file
+        `path` on the instrument, e.g. `C:\\R_S\\Instr\\user\\aclr.dfl`."""
+        self.instrument.query(f"MMEM:STOR:STAT 1,'{path}';*OPC?")
+
+    def load_setup(self, path: str) -> None:
+        """Replaces the complete setup with the save set file `path`, see
+        `store_setup`. Verify the result with `get_channels`, a missing file only
+        queues an error (see `clear_status`)."""
+        self.instrument.query(f"MMEM:LOAD:STAT 1,'{path}';*OPC?")
+
+    def get_channels(self) -> dict[str, str]:
+        """Returns the open channels as `{name: kind}`, e.g. `{"ACLR": "SANALYZER"}`."""
+        fields = [
+            field.strip().strip("'\"")
+            for field in self.instrument.query("INST:LIST?").split(",")
+        ]
+        return dict(zip(fields[1::2], fields[::2]))
+
+    # ------------------------
+    # List mode
+
+    def start_list_power(
+        self,
+        frequencies: list[float],
+        ref_level: float,
+        rbw: float = 1e6,
+        meas_time: float = 1e-3,
+        rf_attenuation: int = 10,
+        trigger: str = "immediate",
+    ) -> None:
+        """Starts a list evaluation measuring the RMS power at each frequency in
+        zero span. Read the result with `get_list_power`.
+
+        trigger:
+            * `"immediate"`: Entries are measured back to back.
+            * `"external"`: Each entry waits for a trigger on the "Trigger Input"
+            connector, e.g. from the signal generator stepping its list.
+        """
+        match trigger.casefold():
+            case "immediate" | "imm":
+                command = "IMM"
+            case "external" | "ext":
+                command = "EXT"
+        self.instrument.write(f"LIST:POW:SET OFF,ON,OFF,{command},POS,0,0")
+        entries = [
+            f"{freq},{ref_level},{rf_attenuation},OFF,NORM,{rbw},{rbw},{meas_time},0"
+            for freq in frequencies
+        ]
+        self.instrument.write(f"LIST:POW {','.join(entries)}")
+
+    def get_list_power(self) -> list[float]:
+        """Returns the powers of the last list evaluation, once it has completed."""
+        self.instrument.query("*OPC?")
+        return [float(val) for val in self.instrument.query("LIST:POW:RES?").split(",")]
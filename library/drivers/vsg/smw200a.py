@@ -1,9 +1,58 @@
+import hashlib
+
 from library.drivers import Instrument
 
 
 class SMW200A(Instrument):
+    """R&S SMW200A vector signal generator.
+
+    The driver tracks which ARB waveform is resident, i.e. selected in the instrument,
+    and the baseband states it has set, so repeated setups skip slow file loads and
+    redundant commands. It also tracks the RF settings, so readings taken at the DUT
+    can be keyed by the generator state (`get_state`). The tracking assumes that this
+    session is the only one changing the generator; call `invalidate` after anything
+    else did, e.g. the DPD of an analyzer controlling the generator.
+    """
+
+    MODEL = "SMW200A"
+
+    def __init__(self, rm, ip_address: str, timeout: int = 5000, reset: bool = True):
+        super().__init__(rm, ip_address, timeout=timeout, reset=reset)
+        self.invalidate()
+
+    def reset(self, wait: bool = True, clear_status: bool = False) -> None:
+        super().reset(wait=wait, clear_status=clear_status)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Forgets the tracked waveform and states, they are asked or set again."""
+        # Selected waveform, None until asked, and `{waveform: segment}` of a
+        # multi-segment waveform, see `load_segments`
+        self.waveform = None
+        self.segments = {}
+        self.segment = None
+        self.states = {}
+        # RF settings written by `set_rf`, `set_output` and the list mode methods
+        self.rf = {}
+
+    def write_state(self, header: str, value: str) -> None:
+        """Writes `header value` unless this session already set `value`."""
+        if self.states.get(header) != value:
+            self.instrument.write(f"{header} {value};*WAI")
+            self.states[header] = value
+
+    def get_state(self) -> tuple:
+        """Returns the tracked RF and baseband settings, e.g. as the key of a reading
+        taken at them. Settings not set since `invalidate` are missing."""
+        return (
+            tuple(sorted(self.rf.items())),
+            tuple(sorted(self.states.items())),
+            self.waveform,
+            self.segment,
+        )
+
     def set_output(
-        self, state: bool | str | None = None, attenuation: int = None
+        self, state: bool | str | None = None, attenuation: int | str = None
     ) -> None:
         """
         state:
@@ -12,17 +61,24 @@ class SMW200A(Instrument):
 
         attenuation:
             * Set the output attenuation level in dB.
+            * `"auto"` returns to the automatic attenuation of the level setting.
         """
         if state is not None:
             match str(state).casefold():
                 case "on" | "true":
                     self.instrument.write("OUTP ON;*WAI")
+                    self.rf["OUTP"] = "ON"
                 case "off" | "false":
                     self.instrument.write("OUTP OFF;*WAI")
+                    self.rf["OUTP"] = "OFF"
 
-        if attenuation is not None:
+        if str(attenuation).casefold() == "auto":
+            self.instrument.write("OUTP:AMOD AUTO;*WAI")
+            self.rf.pop("POW:ATT", None)
+        elif attenuation is not None:
             self.instrument.write("OUTP:AMOD MAN;*WAI")
             self.instrument.write(f"POW:ATT {attenuation};*WAI")
+            self.rf["POW:ATT"] = attenuation
 
     def set_rf(
         self,
@@ -46,12 +102,19 @@ class SMW200A(Instrument):
         """
         if frequency is not None:
             self.instrument.write(f"FREQ:CW {frequency};*WAI")
+            self.rf["FREQ:CW"] = frequency
         if compensation_offset is not None:
             self.instrument.write(f"POW:OFFS {compensation_offset};*WAI")
+            self.rf["POW:OFFS"] = compensation_offset
+        # `POW` and `POW:POW` set the same level, with and without the offset
         if dut_input_level is not None:
             self.instrument.write(f"POW {dut_input_level};*WAI")
+            self.rf["POW"] = dut_input_level
+            self.rf.pop("POW:POW", None)
         if source_power is not None:
             self.instrument.write(f"POW:POW {source_power};*WAI")
+            self.rf["POW:POW"] = source_power
+            self.rf.pop("POW", None)
 
     def set_arb(
         self, waveform_pathname: str | None = None, state: bool | str | None = None
@@ -60,20 +123,84 @@ class SMW200A(Instrument):
 
         waveform_pathname:
             * Selects an existing waveform file, i.e. file with extension *.wv.
+            * Skipped if the waveform is resident, see `select_waveform`.
 
         state:
             * Enables the ARB generator. A waveform must be selected before the ARB generator is activated.
             * `"ON"` | `True` <=> `"OFF"` | `False`
         """
         if waveform_pathname is not None:
-            self.instrument.write(f"BB:ARB:WAV:SEL {waveform_pathname};*WAI")
+            self.select_waveform(waveform_pathname)
 
         if state is not None:
             match str(state).casefold():
                 case "on" | "true":
-                    self.instrument.write("BB:ARB:STAT ON;*WAI")
+                    self.write_state("BB:ARB:STAT", "ON")
                 case "off" | "false":
-                    self.instrument.write("BB:ARB:STAT OFF;*WAI")
+                    self.write_state("BB:ARB:STAT", "OFF")
+
+    def select_waveform(self, pathname: str) -> bool:
+        """Makes `pathname` the ARB waveform, loading the file only if it is not
+        resident.
+
+        A segment of the loaded multi-segment waveform (see `load_segments`) is
+        switched to instead of loaded.
+
+        Returns:
+            bool: True if the file was loaded.
+        """
+        key = waveform_key(pathname)
+        if key in self.segments:
+            self.select_segment(self.segments[key])
+            return False
+        if self.get_waveform() == key:
+            return False
+        self.instrument.write(f"BB:ARB:WAV:SEL '{key}';*WAI")
+        self.waveform = key
+        self.segments = {}
+        return True
+
+    def get_waveform(self) -> str:
+        """Returns the selected waveform file, asking the instrument only once."""
+        if self.waveform is None:
+            self.waveform = waveform_key(self.instrument.query("BB:ARB:WAV:SEL?"))
+        return self.waveform
+
+    def load_segments(self, pathnames: list[str], directory: str = "/var/user") -> bool:
+        """Combines waveform files into one multi-segment waveform and loads it.
+
+        Switching between the waveforms is then a segment change (`set_arb`) instead
+        of a file load, e.g. between 4x20 MHz and 100 MHz signals. The waveform is
+        created in `directory` under a name holding a hash of `pathnames`, and is
+        neither created nor loaded again while it is selected. Segments with
+        different sample rates are played at the highest one.
+
+        Returns:
+            bool: True if the waveform was created and loaded.
+        """
+        keys = [waveform_key(pathname) for pathname in pathnames]
+        digest = hashlib.sha1("\n".join(keys).encode()).hexdigest()[:8]
+        output = f"{directory}/segments_{digest}"
+        self.segments = {key: index for index, key in enumerate(keys)}
+        if self.get_waveform() == output:
+            return False
+
+        self.instrument.write(f"BB:ARB:WSEG:CONF:SEL '{output}'")
+        self.instrument.write("BB:ARB:WSEG:CONF:CLOC:MODE HIGH")
+        for key in keys:
+            self.instrument.write(f"BB:ARB:WSEG:CONF:SEGM:APP '{key}'")
+        self.instrument.write(f"BB:ARB:WSEG:CONF:OFIL '{output}'")
+        self.instrument.query(f"BB:ARB:WSEG:CRE:LOAD '{output}';*OPC?")
+        self.instrument.write("BB:ARB:TRIG:SMOD NEXT")
+        self.waveform = output
+        self.segment = 0
+        return True
+
+    def select_segment(self, index: int) -> None:
+        """Switches the loaded multi-segment waveform to segment `index`."""
+        if self.segment != index:
+            self.instrument.write(f"BB:ARB:WSEG:NEXT {index};*WAI")
+            self.segment = index
 
     def set_baseband(
         self,
@@ -95,9 +222,9 @@ class SMW200A(Instrument):
         if digital_modulation is not None:
             match str(digital_modulation).casefold():
                 case "on" | "true":
-                    self.instrument.write("BB:DM:STAT ON; *WAI")
+                    self.write_state("BB:DM:STAT", "ON")
                 case "off" | "false":
-                    self.instrument.write("BB:DM:STAT OFF; *WAI")
+                    self.write_state("BB:DM:STAT", "OFF")
 
         if optimization_mode is not None:
             match optimization_mode.casefold():
@@ -107,4 +234,92 @@ class SMW200A(Instrument):
                     command = "QHT"
                 case "high quality" | "qhig":
                     command = "QHIG"
-            self.instrument.write(f"BB:IMP:OPT:MODE {command};*WAI")
+            self.write_state("BB:IMP:OPT:MODE", command)
+
+    # ------------------------
+    # List mode
+
+    def set_list(
+        self,
+        frequencies: list[float] | None = None,
+        powers: list[float] | None = None,
+        dwell: float | None = None,
+        mode: str | None = None,
+        trigger: str | None = None,
+        name: str = "CAL",
+    ) -> None:
+        """Configures the frequency/level list used in list mode.
+
+        frequencies:
+            * Frequencies of the list entries in Hz.
+
+        powers:
+            * RF levels of the list entries in dBm. The level offset is not applied in
+            list mode, so pass the compensated source levels.
+
+        dwell:
+            * Time in seconds each entry is held in `"auto"` mode.
+
+        mode:
+            * `"auto"`: The list is processed with `dwell` per entry once triggered.
+            * `"step"`: The current entry is selected with `set_list_index`.
+
+        trigger:
+            * `"auto"` | `"single"` | `"external"`
+        """
+        self.instrument.write(f"LIST:SEL '{name}';*WAI")
+        if frequencies is not None:
+            self.instrument.write(f"LIST:FREQ {','.join(str(f) for f in frequencies)}")
+        if powers is not None:
+            self.instrument.write(f"LIST:POW {','.join(str(p) for p in powers)}")
+        if dwell is not None:
+            self.instrument.write(f"LIST:DWEL {dwell}")
+        if mode is not None:
+            match mode.casefold():
+                case "auto":
+                    self.instrument.write("LIST:MODE AUTO")
+                case "step":
+                    self.instrument.write("LIST:MODE STEP")
+        if trigger is not None:
+            match trigger.casefold():
+                case "auto":
+                    self.instrument.write("LIST:TRIG:SOUR AUTO")
+                case "single" | "sing":
+                    self.instrument.write("LIST:TRIG:SOUR SING")
+                case "external" | "ext":
+                    self.instrument.write("LIST:TRIG:SOUR EXT")
+
+    def learn_list(self) -> None:
+        """Pre-calculates the hardware settings of every list entry, so that switching
+        between entries does not need to re-level."""
+        self.instrument.query("LIST:LEAR;*OPC?")
+
+    def set_frequency_mode(self, mode: str) -> None:
+        """Selects the frequency mode.
+
+        mode:
+            * `"cw"`: Fixed frequency set with `set_rf`.
+            * `"list"`: Frequency and level are taken from the list, see `set_list`.
+        """
+        match mode.casefold():
+            case "cw" | "fixed":
+                self.instrument.write("FREQ:MODE CW;*WAI")
+                self.rf["FREQ:MODE"] = "CW"
+            case "list":
+                self.instrument.write("FREQ:MODE LIST;*WAI")
+                self.rf["FREQ:MODE"] = "LIST"
+
+    def set_list_index(self, index: int) -> None:
+        """Selects the list entry to output in `"step"` list mode."""
+        self.instrument.write(f"LIST:IND {index};*WAI")
+        self.rf["LIST:IND"] = index
+
+    def start_list(self) -> None:
+        """Triggers processing of the list in `"single"` trigger mode."""
+        self.instrument.write("LIST:TRIG:EXEC")
+
+
+def waveform_key(pathname: str) -> str:
+    """Returns a waveform path as the instrument reports it: unquoted, without the
+    `.wv` extension."""
+    return pathname.strip().strip("'\"").removesuffix(".wv")
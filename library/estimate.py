@@ -0,0 +1,219 @@
+"""Run time estimates from a dry run on a virtual clock.
+
+A dry run executes the real measurement code against the simulated rig of
+`library.simulator` while `virtual_clock` replaces `time.perf_counter` and
+`time.sleep`: sleeps and simulated instrument latencies advance the clock instead of
+waiting, so a full DUT run is walked in seconds without touching the instruments,
+including the sleeps, settling waits and the iterations of searches like `find_pout`.
+
+The instrument latencies come from a `CostModel`, calibrated from the transcripts a
+rig recorded (see `library.transcript`):
+
+    cost_model = CostModel.for_rig("A")
+    with virtual_clock(), tracing.recording("dry run") as trace:
+        rig, rm = simulated_rig(load_rig("SIM"), cost_model)
+        run_lasig(rig, plan)
+    print(trace.durations())
+
+Concurrent calls, e.g. while opening the instruments, advance the clock one after
+another, so their estimates are an upper bound.
+"""
+import contextlib
+import dataclasses
+import pathlib
+import statistics
+import threading
+import time
+
+import pandas as pd
+
+from library import simulator, tracing
+from library.path_loss import PathLoss
+from library.rig import Rig
+from library.simulator import LATENCY_S, SimResourceManager
+from library.transcript import TRANSCRIPT_DIR, read_transcript
+
+# Appended to commands to wait for them, their time is recorded with the command
+SYNC_HEADERS = ("*WAI", "*OPC?")
+
+
+@dataclasses.dataclass
+class CostModel:
+    """Instrument latency in seconds per SCPI header, see `simulator.LATENCY_S`.
+
+    `write` and `query` apply to the headers without an entry.
+    """
+
+    latency_s: dict[str, float] = dataclasses.field(
+        default_factory=lambda: dict(LATENCY_S)
+    )
+    sources: tuple[pathlib.Path, ...] = ()
+
+    @classmethod
+    def from_transcripts(cls, paths: list[pathlib.Path]) -> "CostModel":
+        """Calibrates the latencies from recorded transcripts.
+
+        Each header takes the median duration of the commands it starts. Headers the
+        transcripts do not hold keep the simulator defaults.
+        """
+        durations = {"write": [], "query": []}
+        for path in paths:
+            for calls in read_transcript(path).values():
+                for operation, command, duration, _ in calls:
+                    if operation not in ("w", "q"):
+                        continue
+                    header = headers(command)[0]
+                    kind = "write" if operation == "w" else "query"
+                    durations[kind].append(duration)
+                    durations.setdefault(header, []).append(duration)
+        latency_s = dict(LATENCY_S) | {header: 0.0 for header in SYNC_HEADERS}
+        latency_s |= {
+            header: statistics.median(values)
+            for header, values in durations.items()
+            if values
+        }
+        return cls(latency_s, sources=tuple(paths))
+
+    @classmethod
+    def for_rig(cls, rig_name: str) -> "CostModel":
+        """Calibrates from the transcripts of `rig_name` in `log/transcripts`, or
+        returns the simulator defaults without any."""
+        paths = sorted(TRANSCRIPT_DIR.glob(f"{rig_name}_*.jsonl"))
+        return cls.from_transcripts(paths) if paths else cls()
+
+
+@dataclasses.dataclass
+class Estimate:
+    """Result of a dry run.
+
+    Args:
+        name (str): What was estimated, e.g. the product.
+        phases (dict): `{phase: seconds}`, in run order.
+        parameters (dict): `{plan parameter: (seconds, count)}`, the time spent on a
+            parameter's `count` units (frequencies, sweep points, ...).
+        commands (int): VISA writes and queries sent.
+        sleep_s (float): Time slept by the scripts and drivers.
+        instrument_s (float): Time waited on instruments.
+        cost_model (CostModel): The latencies the estimate is based on.
+    """
+
+    name: str
+    phases: dict[str, float]
+    parameters: dict[str, tuple[float, int]]
+    commands: int
+    sleep_s: float
+    instrument_s: float
+    cost_model: CostModel
+
+    @property
+    def total_s(self) -> float:
+        return sum(self.phases.values())
+
+    def report(self) -> str:
+        lines = [f"Estimated duration of {self.name}: {minutes(self.total_s)}"]
+        lines += [
+            f"  {phase}: {minutes(seconds)}" for phase, seconds in self.phases.items()
+        ]
+        lines.append(
+            f"  {self.commands} instrument commands, {minutes(self.instrument_s)} "
+            f"waiting on instruments, {minutes(self.sleep_s)} in sleeps"
+        )
+        lines.append("Most expensive plan parameters (overlapping):")
+        ranked = sorted(self.parameters.items(), key=lambda item: -item[1][0])
+        for parameter, (seconds, count) in ranked:
+            per_unit = f", {seconds / count:.1f} s each" if count > 1 else ""
+            lines.append(f"  {parameter} ({count}): {minutes(seconds)}{per_unit}")
+        if self.cost_model.sources:
+            lines.append(
+                f"Latencies from {len(self.cost_model.sources)} recorded transcripts"
+            )
+        else:
+            lines.append("Latencies from the simulator defaults, record a transcript")
+        return "\n".join(lines)
+
+
+class VirtualClock:
+    """Clock advanced by `sleep` instead of waiting, see `virtual_clock`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.now = time.perf_counter()
+
+    def perf_counter(self) -> float:
+        with self.lock:
+            return self.now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            with self.lock:
+                self.now += seconds
+
+
+@contextlib.contextmanager
+def virtual_clock():
+    """Replaces `time.perf_counter` and `time.sleep`, including the simulated latency
+    and the sleeps under the `time.sleep` hook of `library.tracing`, with a
+    `VirtualClock`. The functions are patched with `tracing.patch_time`, so the clock
+    and recordings may start and end in any order.
+
+    Yields:
+        VirtualClock: The clock.
+    """
+    clock = VirtualClock()
+    saved = simulator._sleep
+    simulator._sleep = clock.sleep
+    try:
+        with tracing.patch_time(perf_counter=clock.perf_counter, sleep=clock.sleep):
+            yield clock
+    finally:
+        simulator._sleep = saved
+
+
+def simulated_rig(
+    settings: dict, cost_model: CostModel, name: str = "SIM"
+) -> tuple[Rig, SimResourceManager]:
+    """Opens a simulated rig with the latencies of `cost_model` and a path loss equal
+    to the simulated paths.
+
+    Args:
+        settings (dict): Simulated rig file, e.g. `load_rig("SIM")`.
+    """
+    settings["Simulation"] = settings["Simulation"] | {
+        "time_scale": 1.0,
+        "latency_s": cost_model.latency_s,
+        "faults": {},
+    }
+    rm = SimResourceManager(settings)
+    rig = Rig.open(rm, name, settings, path_loss=true_path_loss(rm))
+    return rig, rm
+
+
+def true_path_loss(rm: SimResourceManager) -> PathLoss:
+    """Returns a path loss equal to the simulated paths, i.e. a perfect calibration."""
+    frequencies = [2e9, 8e9, 12e9]
+    columns = {
+        "sg_to_dut_p1_loss_db": "input",
+        "sa_to_dut_p2_loss_db": "sa",
+        "sensor_to_dut_p2_loss_db": "sensor",
+    }
+    data = {"frequency": frequencies} | {
+        column: [rm.bench.path_gain(path, f) for f in frequencies]
+        for column, path in columns.items()
+    }
+    return PathLoss(pd.DataFrame(data))
+
+
+def headers(message: str) -> list[str]:
+    """Returns the SCPI headers of `message`, parsed like the simulator does."""
+    parsed = []
+    for command in message.split(";"):
+        header = command.strip().partition(" ")[0].lstrip(":").upper()
+        if header:
+            parsed.append(header)
+    return parsed or [""]
+
+
+def minutes(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f} s"
+    return f"{seconds // 60:.0f} min {seconds % 60:02.0f} s"
@@ -0,0 +1,284 @@
+"""Instrument server keeping the VISA sessions of a rig open across script runs.
+
+`InstrumentServer` owns the sessions of one rig and serves their writes and queries
+on a Unix socket; `RemoteResourceManager` stands in for `pyvisa.ResourceManager` in
+the scripts, so the drivers work unchanged. Connecting takes milliseconds and the
+instruments stay configured between runs (`python instrument_server.py`, see the
+readme).
+
+The protocol is JSON lines. Each request carries an `id` that its response echoes:
+
+    {"id": 3, "op": "write", "resource": "TCPIP::...::INSTR", "command": "*CLS"}
+    {"id": 3, "result": 4}
+    {"id": 4, "op": "query", "resource": "TCPIP::...::INSTR", "command": "FETCH?"}
+    {"id": 4, "error": "VisaIOError: Timeout expired"}
+
+Requests of one connection are executed in order, and each connection has a thread
+of its own in the server. The client opens one connection per session, so commands to
+different instruments run concurrently while the commands of one session keep their
+order. Clients pipeline writes: they send the next request without waiting for the
+response, and a failed write raises on the session's next call. Each instrument
+executes one command at a time, and a session can lock its instrument exclusively
+(`lock_excl`), e.g. for a measurement sequence, until it unlocks or disconnects.
+"""
+import concurrent.futures
+import itertools
+import json
+import pathlib
+import socket
+import socketserver
+import threading
+
+
+class RemoteError(Exception):
+    """Raised in the client for a request that failed in the server."""
+
+
+class InstrumentServer(socketserver.ThreadingUnixStreamServer):
+    """Serves the sessions of `rm` on the Unix socket `path`, one thread per client.
+
+    Args:
+        rm: Resource manager opening the sessions, e.g. `pyvisa.ResourceManager()`.
+        path (str | pathlib.Path): Socket path. A stale socket file is replaced.
+        lock_timeout (float, optional): Seconds a request waits for an instrument
+            another client has locked. Defaults to 60.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, rm, path: str | pathlib.Path, lock_timeout: float = 60):
+        self.rm = rm
+        self.path = pathlib.Path(path)
+        self.lock_timeout = lock_timeout
+        self.sessions = {}
+        self.command_locks = {}
+        self.owners = {}
+        self.condition = threading.Condition()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        super().__init__(str(self.path), ClientHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.path.unlink(missing_ok=True)
+
+    def open(self, resource_name: str):
+        """Returns the session of `resource_name`, opening it on first use."""
+        with self.condition:
+            if resource_name not in self.sessions:
+                self.sessions[resource_name] = self.rm.open_resource(resource_name)
+                self.command_locks[resource_name] = threading.Lock()
+            return self.sessions[resource_name]
+
+    def execute(self, client: int, request: dict):
+        resource_name = request.get("resource")
+        match request["op"]:
+            case "open":
+                self.open(resource_name)
+                return resource_name
+            case "list":
+                return list(self.rm.list_resources())
+            case "lock":
+                self.acquire(client, resource_name, request.get("wait"), own=True)
+            case "unlock":
+                self.release(client, [resource_name])
+            case "write" | "query" as op:
+                session = self.open(resource_name)
+                self.acquire(client, resource_name, self.lock_timeout)
+                with self.command_locks[resource_name]:
+                    if request.get("timeout") is not None:
+                        session.timeout = request["timeout"]
+                    if op == "write":
+                        return session.write(request["command"])
+                    return session.query(request["command"])
+            case op:
+                raise ValueError(f"Unknown operation {op!r}")
+
+    def acquire(
+        self,
+        client: int,
+        resource_name: str,
+        timeout: float | None,
+        own: bool = False,
+    ) -> None:
+        """Waits until `resource_name` is not locked by another client, and with
+        `own` locks it for `client`."""
+        with self.condition:
+            if not self.condition.wait_for(
+                lambda: self.owners.get(resource_name, client) == client, timeout
+            ):
+                raise TimeoutError(f"{resource_name} is locked by another client")
+            if own:
+                self.owners[resource_name] = client
+
+    def release(self, client: int, resource_names: list[str] | None = None) -> None:
+        """Unlocks the `resource_names` (default: all) `client` has locked."""
+        with self.condition:
+            for resource_name in resource_names or list(self.owners):
+                if self.owners.get(resource_name) == client:
+                    del self.owners[resource_name]
+            self.condition.notify_all()
+
+
+class ClientHandler(socketserver.StreamRequestHandler):
+    """Executes the requests of one client connection in order."""
+
+    def handle(self) -> None:
+        client = id(self)
+        try:
+            for line in self.rfile:
+                request = json.loads(line)
+                try:
+                    response = {"result": self.server.execute(client, request)}
+                except Exception as error:
+                    response = {"error": f"{type(error).__name__}: {error}"}
+                response["id"] = request.get("id")
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+                self.wfile.flush()
+        finally:
+            self.server.release(client)
+
+
+class RemoteResource:
+    """VISA session in an `InstrumentServer` over a connection of its own, see
+    `RemoteResourceManager`."""
+
+    def __init__(self, connection: "Connection", resource_name: str):
+        self.connection = connection
+        self.resource_name = resource_name
+        self.timeout = None
+        self.writes = []
+
+    def write(self, command: str) -> int:
+        """Sends `command` without waiting for the server, see `check_writes`."""
+        self.check_writes()
+        self.writes.append(self.request("write", command=command))
+        return len(command)
+
+    def query(self, command: str) -> str:
+        future = self.request("query", command=command)
+        try:
+            return future.result()
+        finally:
+            # The server answers in order, so all earlier writes are done by now
+            self.check_writes()
+
+    def lock_excl(self, timeout: float | None = None) -> None:
+        """Locks the instrument for this session until `unlock` or `close`, waiting
+        at most `timeout` seconds for another client's lock."""
+        request = {"op": "lock", "resource": self.resource_name, "wait": timeout}
+        self.connection.request(**request).result()
+
+    def unlock(self) -> None:
+        self.connection.request(op="unlock", resource=self.resource_name).result()
+
+    def close(self) -> None:
+        try:
+            self.check_writes()
+        finally:
+            self.connection.close()
+
+    def check_writes(self) -> None:
+        """Raises the error of a failed earlier write, if any."""
+        done = [future for future in self.writes if future.done()]
+        self.writes = [future for future in self.writes if future not in done]
+        for future in done:
+            future.result()
+
+    def request(self, op: str, command: str) -> concurrent.futures.Future:
+        return self.connection.request(
+            op=op, resource=self.resource_name, command=command, timeout=self.timeout
+        )
+
+
+class RemoteResourceManager:
+    """Drop-in for `pyvisa.ResourceManager` using the sessions of an
+    `InstrumentServer`.
+
+    Every opened session gets a connection of its own, so that the server runs the
+    commands of different instruments concurrently, e.g. reads of the analyzer and
+    the sensor or the `*IDN?` of sessions opened in parallel.
+
+    Args:
+        path (str | pathlib.Path): Socket of the server.
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = path
+        self.connection = Connection(path)
+        self.connections = [self.connection]
+
+    def open_resource(self, resource_name: str, **kwargs) -> RemoteResource:
+        connection = Connection(self.path)
+        try:
+            connection.request(op="open", resource=resource_name).result()
+        except Exception:
+            connection.close()
+            raise
+        self.connections.append(connection)
+        return RemoteResource(connection, resource_name)
+
+    def list_resources(self, query: str = "?*::INSTR") -> tuple[str, ...]:
+        return tuple(self.connection.request(op="list").result())
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.close()
+
+
+class Connection:
+    """Client connection to an `InstrumentServer` matching responses to requests by
+    their `id`.
+
+    Args:
+        path (str | pathlib.Path): Socket of the server.
+    """
+
+    def __init__(self, path: str | pathlib.Path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(str(path))
+        self.writer = self.socket.makefile("wb")
+        self.reader = self.socket.makefile("rb")
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.pending = {}
+        self.closed = False
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+    def request(self, **request) -> concurrent.futures.Future:
+        """Sends a request and returns the future of its result."""
+        future = concurrent.futures.Future()
+        with self.lock:
+            request["id"] = next(self.ids)
+            self.pending[request["id"]] = future
+            self.writer.write(json.dumps(request).encode() + b"\n")
+            self.writer.flush()
+        return future
+
+    def receive(self) -> None:
+        try:
+            for line in self.reader:
+                response = json.loads(line)
+                with self.lock:
+                    future = self.pending.pop(response["id"])
+                if "error" in response:
+                    future.set_exception(RemoteError(response["error"]))
+                else:
+                    future.set_result(response.get("result"))
+        except (OSError, ValueError):
+            pass
+        with self.lock:
+            for future in self.pending.values():
+                future.set_exception(ConnectionError("Instrument server disconnected"))
+            self.pending.clear()
@@ -0,0 +1,59 @@
+"""Recent readings keyed by the instrument state they were taken at.
+
+Within one frequency, the Pout search revisits Pin points the power sweep measured,
+and the PAE reads the sensor at the Pin the search ended on. A `MeasurementCache`
+serves such repeated readings from the last `freshness_s` seconds instead of
+measuring again:
+
+    cache = MeasurementCache(freshness_s=30)
+    key = ("sensor", average_count, vsg.get_state())
+    pout = cache.read(key, read_average)  # measured
+    pout = cache.read(key, read_average)  # served, if within 30 s
+
+The key must hold everything the reading depends on: the generator state with
+frequency, level, offset and attenuation, and how the reading is taken, e.g. the
+number of samples averaged. Readings older than `freshness_s` are measured again, so
+the DUT may drift for at most that long. Anything that changes the readings without
+changing the key, like powering up the next DUT, must `invalidate` the cache.
+"""
+import time
+from typing import Callable, Hashable
+
+
+class MeasurementCache:
+    """Serves repeated readings, see the module docstring.
+
+    Args:
+        freshness_s (float, optional): Age in seconds up to which a reading is served
+            again. 0 measures every reading.
+    """
+
+    def __init__(self, freshness_s: float = 0):
+        self.freshness_s = freshness_s
+        self.readings = {}
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, key: Hashable, read: Callable[[], float]) -> float:
+        """Returns the reading at `key`, calling `read` unless a fresh one is cached."""
+        now = time.perf_counter()
+        if key in self.readings:
+            taken, value = self.readings[key]
+            if now - taken <= self.freshness_s:
+                self.hits += 1
+                return value
+        value = read()
+        self.misses += 1
+        if self.freshness_s > 0:
+            self.readings[key] = time.perf_counter(), value
+        return value
+
+    def invalidate(self) -> None:
+        """Forgets all readings, they are measured again."""
+        self.readings.clear()
+
+    def report(self) -> str:
+        return (
+            f"Readings: {self.hits} of {self.hits + self.misses} served from the "
+            f"last {self.freshness_s:g} s"
+        )
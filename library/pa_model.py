@@ -0,0 +1,318 @@
+"""Behavioral PA model.
+
+A vectorized stand-in DUT with known ground truth, for benchmarking the search and
+extraction algorithms and as the DUT of the simulated rig (`library/simulator.py`):
+
+* AM-AM: Rapp model with frequency dependent small signal gain and saturation power.
+* AM-PM: Saleh model.
+* Memory: the nonlinear distortion of the complex envelope passes through an FIR
+  filter, which makes the spectral regrowth (ACLR) asymmetric.
+* Harmonics rising by (k - 1) dB per dB of output power until saturation.
+* Thermal drift: the junction temperature follows the dissipated power with a first
+  order time constant and shifts gain and saturation power.
+* Measurement noise for readings taken with `measure_pout_dbm`.
+
+Every power method takes scalars or arrays:
+
+    model = PAModel()
+    model.pout_dbm(np.arange(-20, 10), 3.45e9)
+    model.compression_point_dbm(1, 3.45e9)  # ground truth output P1dB
+    model.ground_truth([3.3e9, 3.45e9], pout_targets=[26, 28], voltage=5.0)
+"""
+import functools
+
+import numpy as np
+
+
+class PAModel:
+    def __init__(
+        self,
+        gain_db: float = 28.0,
+        psat_dbm: float = 33.0,
+        smoothness: float = 2.0,
+        center_frequency: float = 3.45e9,
+        bandwidth: float = 1e9,
+        gain_rolloff_db: float = 1.5,
+        psat_rolloff_db: float = 0.5,
+        am_pm_deg: tuple[float, float] = (8.0, 1.0),
+        harmonics_dbc: tuple[float, ...] = (-25.0, -35.0),
+        memory_taps: tuple[complex, ...] = (1.0, 0.35 - 0.25j, 0.1j),
+        quiescent_a: float = 0.1,
+        efficiency: float = 0.65,
+        thermal_resistance_c_per_w: float = 8.0,
+        thermal_time_constant_s: float = 2.0,
+        drift_db_per_c: float = -0.01,
+        ambient_c: float = 25.0,
+        dpd_residual: float = 0.05,
+        noise_db: float = 0.02,
+        seed: int | None = None,
+    ):
+        """
+        Args:
+            gain_db (float): Small signal gain at `center_frequency`.
+            psat_dbm (float): Saturated output power at `center_frequency`.
+            smoothness (float): Rapp smoothness factor, higher is a harder knee.
+            bandwidth (float): Band over which gain and saturation power roll off
+                parabolically by `gain_rolloff_db` and `psat_rolloff_db` at the edges.
+            am_pm_deg (tuple): Saleh (alpha, beta), phase shift in degrees is
+                alpha * r^2 / (1 + beta * r^2) with r the input amplitude normalized to
+                saturation.
+            harmonics_dbc (tuple): Level of the 2nd, 3rd... harmonic at saturation.
+            memory_taps (tuple): FIR taps applied to the distortion of the envelope.
+            quiescent_a (float): Supply current without RF.
+            efficiency (float): Drain efficiency at saturation (class B-like).
+            thermal_resistance_c_per_w (float): Junction to ambient.
+            thermal_time_constant_s (float): Time constant of the junction temperature.
+            drift_db_per_c (float): Gain and saturation power change per degree.
+            dpd_residual (float): Fraction of the distortion left with DPD applied.
+            noise_db (float): Standard deviation of `measure_pout_dbm`.
+            seed (int, optional): Seed of the measurement noise.
+        """
+        self.gain_db = gain_db
+        self.psat_dbm = psat_dbm
+        self.smoothness = smoothness
+        self.center_frequency = center_frequency
+        self.bandwidth = bandwidth
+        self.gain_rolloff_db = gain_rolloff_db
+        self.psat_rolloff_db = psat_rolloff_db
+        self.am_pm_deg = am_pm_deg
+        self.harmonics_dbc = harmonics_dbc
+        self.memory_taps = np.asarray(memory_taps, dtype=complex)
+        self.quiescent_a = quiescent_a
+        self.efficiency = efficiency
+        self.thermal_resistance_c_per_w = thermal_resistance_c_per_w
+        self.thermal_time_constant_s = thermal_time_constant_s
+        self.drift_db_per_c = drift_db_per_c
+        self.ambient_c = ambient_c
+        self.temperature_c = ambient_c
+        self.dpd_residual = dpd_residual
+        self.noise_db = noise_db
+        self.rng = np.random.default_rng(seed)
+        # Per model, so the cache dies with the model and models do not share slots
+        self._modulated = functools.lru_cache(maxsize=1024)(self._modulate)
+
+    # ------------------------
+    # AM-AM / AM-PM
+
+    def small_signal_gain_db(self, frequency) -> np.ndarray:
+        return (
+            self.gain_db
+            - self.gain_rolloff_db * self._offset(frequency) ** 2
+            + self._drift()
+        )
+
+    def saturation_dbm(self, frequency) -> np.ndarray:
+        return (
+            self.psat_dbm
+            - self.psat_rolloff_db * self._offset(frequency) ** 2
+            + self._drift()
+        )
+
+    def pout_dbm(self, pin_dbm, frequency) -> np.ndarray:
+        """Returns the output power for CW input power `pin_dbm`."""
+        psat = self.saturation_dbm(frequency)
+        a = self._drive(pin_dbm, frequency)
+        p = self.smoothness
+        return psat + 20 * np.log10(a / (1 + a ** (2 * p)) ** (1 / (2 * p)))
+
+    def large_signal_gain_db(self, pin_dbm, frequency) -> np.ndarray:
+        return self.pout_dbm(pin_dbm, frequency) - np.asarray(pin_dbm)
+
+    def phase_deg(self, pin_dbm, frequency) -> np.ndarray:
+        """Returns the AM-PM phase shift relative to small signal."""
+        alpha, beta = self.am_pm_deg
+        r2 = self._drive(pin_dbm, frequency) ** 2
+        return alpha * r2 / (1 + beta * r2)
+
+    def measure_pout_dbm(self, pin_dbm, frequency) -> np.ndarray:
+        """Returns `pout_dbm` with Gaussian measurement noise of `noise_db`."""
+        pout = self.pout_dbm(pin_dbm, frequency)
+        return pout + self.rng.normal(0, self.noise_db, np.shape(pout))
+
+    # ------------------------
+    # Harmonics and supply
+
+    def harmonic_dbc(self, k: int, pin_dbm, frequency) -> np.ndarray:
+        """Returns the level of the `k`th harmonic relative to the fundamental."""
+        if k < 2 or k - 2 >= len(self.harmonics_dbc):
+            return np.full(np.shape(pin_dbm), -80.0)
+        backoff = self.saturation_dbm(frequency) - self.pout_dbm(pin_dbm, frequency)
+        return self.harmonics_dbc[k - 2] - (k - 1) * np.maximum(backoff, 0)
+
+    def supply_current(self, pin_dbm, frequency, voltage: float) -> np.ndarray:
+        """Returns the supply current in A at `voltage`."""
+        pout_w = 1e-3 * 10 ** (self.pout_dbm(pin_dbm, frequency) / 10)
+        psat_w = 1e-3 * 10 ** (self.saturation_dbm(frequency) / 10)
+        return self.quiescent_a + np.sqrt(pout_w * psat_w) / self.efficiency / voltage
+
+    def pae_pct(self, pin_dbm, frequency, voltage: float) -> np.ndarray:
+        pin_w = 1e-3 * 10 ** (np.asarray(pin_dbm) / 10)
+        pout_w = 1e-3 * 10 ** (self.pout_dbm(pin_dbm, frequency) / 10)
+        supply_w = voltage * self.supply_current(pin_dbm, frequency, voltage)
+        return 100 * (pout_w - pin_w) / supply_w
+
+    # ------------------------
+    # Thermal drift
+
+    def heat(
+        self, pin_dbm: float, frequency: float, voltage: float, seconds: float
+    ) -> float:
+        """Advances the junction temperature by `seconds` at the given drive and
+        returns it. Pass `voltage=0` for an unpowered DUT."""
+        if voltage > 0:
+            pin_w = 1e-3 * 10 ** (pin_dbm / 10)
+            pout_w = 1e-3 * 10 ** (self.pout_dbm(pin_dbm, frequency) / 10)
+            supply_w = voltage * self.supply_current(pin_dbm, frequency, voltage)
+            dissipated = max(supply_w + pin_w - pout_w, 0)
+        else:
+            dissipated = 0
+        steady = self.ambient_c + self.thermal_resistance_c_per_w * dissipated
+        decay = np.exp(-seconds / self.thermal_time_constant_s)
+        self.temperature_c = float(steady + (self.temperature_c - steady) * decay)
+        return self.temperature_c
+
+    # ------------------------
+    # Modulated signal
+
+    def amplify(self, envelope: np.ndarray, frequency: float, dpd: bool = False):
+        """Passes a complex envelope in sqrt(mW) through AM-AM, AM-PM and memory.
+
+        With `dpd`, the static nonlinearity is replaced by an ideal limiter at the
+        saturation power and `dpd_residual` of the (memory filtered) distortion remains.
+        """
+        pin = 20 * np.log10(np.maximum(np.abs(envelope), 1e-12))
+        linear = envelope * 10 ** (self.small_signal_gain_db(frequency) / 20)
+        static = (
+            np.abs(envelope)
+            * 10 ** (self.large_signal_gain_db(pin, frequency) / 20)
+            * np.exp(1j * (np.angle(envelope) + np.deg2rad(self.phase_deg(pin, frequency))))
+        )
+        distortion = np.convolve(static - linear, self.memory_taps)[: len(envelope)]
+        if not dpd:
+            return linear + distortion
+        amplitude = 10 ** (self.saturation_dbm(frequency) / 20)
+        limited = linear * np.minimum(1, amplitude / np.maximum(np.abs(linear), 1e-12))
+        return limited + self.dpd_residual * distortion
+
+    def aclr_dbc(
+        self, pin_dbm: float, frequency: float, dpd: bool = False, channels: int = 1
+    ) -> np.ndarray:
+        """Returns the [lower, upper] ACLR in dBc of each of `channels` adjacent
+        channels for a noise-like signal of average power `pin_dbm`."""
+        return self._modulated(
+            round(float(pin_dbm), 1),
+            float(frequency),
+            dpd,
+            channels,
+            round(self.temperature_c),
+        )[0]
+
+    def evm_pct(self, pin_dbm: float, frequency: float, dpd: bool = False) -> float:
+        return self._modulated(
+            round(float(pin_dbm), 1), float(frequency), dpd, 1, round(self.temperature_c)
+        )[1]
+
+    def _modulate(
+        self, pin_dbm: float, frequency: float, dpd: bool, channels: int, temperature
+    ) -> tuple[np.ndarray, float]:
+        envelope = test_signal() * 10 ** (pin_dbm / 20)
+        output = self.amplify(envelope, frequency, dpd=dpd)
+
+        spectrum = np.abs(np.fft.fftshift(np.fft.fft(output.reshape(-1, 1024), axis=1)))
+        psd = (spectrum**2).mean(axis=0)
+        bins = np.arange(-512, 512)
+        width = 1024 // OVERSAMPLING
+        main = psd[np.abs(bins) < width / 2].sum()
+        aclr = []
+        for k in range(1, channels + 1):
+            lower = psd[np.abs(bins + k * width) < width / 2].sum()
+            upper = psd[np.abs(bins - k * width) < width / 2].sum()
+            aclr.append([10 * np.log10(lower / main), 10 * np.log10(upper / main)])
+
+        gain = np.vdot(envelope, output) / np.vdot(envelope, envelope)
+        error = np.linalg.norm(output - gain * envelope) / np.linalg.norm(gain * envelope)
+        return np.array(aclr), float(100 * error)
+
+    # ------------------------
+    # Ground truth
+
+    def compression_point_dbm(self, compression_db: float, frequency) -> np.ndarray:
+        """Returns the output power at which the gain has dropped `compression_db`
+        below small signal gain."""
+        g = 10 ** (-compression_db / 20)
+        p = self.smoothness
+        a = (g ** (-2 * p) - 1) ** (1 / (2 * p))
+        return self.saturation_dbm(frequency) + 20 * np.log10(a * g)
+
+    def pin_for_pout_dbm(self, pout_dbm, frequency) -> np.ndarray:
+        """Returns the input power giving `pout_dbm`, NaN at or above saturation."""
+        b = 10 ** ((np.asarray(pout_dbm) - self.saturation_dbm(frequency)) / 20)
+        p = self.smoothness
+        with np.errstate(invalid="ignore", divide="ignore"):
+            a = b / (1 - b ** (2 * p)) ** (1 / (2 * p))
+            return (
+                self.saturation_dbm(frequency)
+                + 20 * np.log10(a)
+                - self.small_signal_gain_db(frequency)
+            )
+
+    def ground_truth(
+        self, frequencies, pout_targets, voltage: float, channels: int = 1
+    ) -> dict[str, np.ndarray]:
+        """Returns the exact values the characterization should find, at the current
+        temperature, arrays indexed by [frequency] or [frequency, pout target]:
+
+        `op1db`, `op3db`, `op5db`, `pin_dbm`, `gain_db`, `pae_pct`, `aclr_dbc`
+        ([frequency, target, channel, lower/upper]) and `evm_pct`.
+        """
+        f = np.asarray(frequencies, dtype=float)[:, None]
+        targets = np.asarray(pout_targets, dtype=float)[None, :]
+        pin = self.pin_for_pout_dbm(targets, f)
+        truth = {
+            f"op{db}db": self.compression_point_dbm(db, f[:, 0]) for db in (1, 3, 5)
+        }
+        truth["pin_dbm"] = pin
+        truth["gain_db"] = targets - pin
+        truth["pae_pct"] = self.pae_pct(pin, f, voltage)
+        truth["aclr_dbc"] = np.array(
+            [
+                [self.aclr_dbc(p, freq, channels=channels) for p in row]
+                for freq, row in zip(f[:, 0], pin)
+            ]
+        )
+        truth["evm_pct"] = np.array(
+            [[self.evm_pct(p, freq) for p in row] for freq, row in zip(f[:, 0], pin)]
+        )
+        return truth
+
+    def _offset(self, frequency) -> np.ndarray:
+        return (np.asarray(frequency) - self.center_frequency) / (self.bandwidth / 2)
+
+    def _drift(self) -> float:
+        return self.drift_db_per_c * (self.temperature_c - self.ambient_c)
+
+    def _drive(self, pin_dbm, frequency) -> np.ndarray:
+        """Input amplitude normalized to the input that saturates the small signal gain."""
+        return 10 ** (
+            (
+                np.asarray(pin_dbm)
+                + self.small_signal_gain_db(frequency)
+                - self.saturation_dbm(frequency)
+            )
+            / 20
+        )
+
+
+# Test signal for ACLR and EVM: band limited complex Gaussian noise, i.e. OFDM-like,
+# occupying 1/OVERSAMPLING of the simulated bandwidth
+OVERSAMPLING = 8
+
+
+@functools.cache
+def test_signal(blocks: int = 32, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    spectrum = rng.normal(size=(blocks, 1024)) + 1j * rng.normal(size=(blocks, 1024))
+    bins = np.fft.fftfreq(1024, d=1 / 1024)
+    spectrum[:, np.abs(bins) >= 1024 // OVERSAMPLING / 2] = 0
+    signal = np.fft.ifft(spectrum, axis=1).ravel()
+    return signal / np.sqrt(np.mean(np.abs(signal) ** 2))
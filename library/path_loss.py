@@ -0,0 +1,255 @@
+"""Interpolated path loss lookups.
+
+The calibration data is loaded once into sorted NumPy arrays with precomputed segment
+slopes, so a lookup is a binary search plus one multiply-add, for a single frequency
+or a whole array of them:
+
+    path_loss = PathLoss.from_csv("config/pathloss_230101-12h00m.csv")
+    path_loss.loss(3.45e9, "sg_to_dut_p1_loss_db")
+    path_loss.loss(np.array([3.3e9, 3.45e9]), "sa_to_dut_p2_loss_db", power=10)
+
+Calibrations of several rigs and power levels are kept in a `PathLossStore`, one
+compressed `.npz` per calibration with its metadata (rig, date, power, cable IDs).
+Only the calibrations a run needs are loaded:
+
+    store = PathLossStore("config/pathloss")
+    path_loss = store.load(rig="A")  # latest calibration of every power level
+    path_loss.loss(3.45e9, "sg_to_dut_p1_loss_db", power=5)
+"""
+import json
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+
+class PathLoss:
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        max_extrapolation_hz: float = 0,
+    ):
+        """
+        Args:
+            data (pd.DataFrame): Calibration data with a `frequency` (or `frequency_hz`)
+                column, an optional `power` column and the loss columns.
+            max_extrapolation_hz (float): How far outside the calibrated range a lookup
+                may go, in which case the edge value is used. Further out raises
+                ValueError. Defaults to 0.
+        """
+        self.sources = []
+        data = data.reset_index().rename(columns={"frequency_hz": "frequency"})
+        data = data.drop(columns=["index"], errors="ignore")
+        if "power" not in data:
+            data["power"] = np.nan
+        self.columns = [c for c in data.columns if c not in ("frequency", "power")]
+        self.max_extrapolation_hz = max_extrapolation_hz
+
+        # One table per calibration power: sorted frequencies, values and slopes
+        self.powers = np.sort(data["power"].dropna().unique())
+        self.tables = {}
+        for power, group in data.groupby(data["power"].fillna(np.inf)):
+            group = group.sort_values("frequency")
+            group = group.drop_duplicates("frequency", keep="last")
+            frequency = group["frequency"].to_numpy(dtype="float64")
+            values = group[self.columns].to_numpy(dtype="float64").T
+            if len(frequency) > 1:
+                slopes = np.diff(values, axis=1) / np.diff(frequency)
+            else:
+                slopes = np.zeros((len(self.columns), 0))
+            self.tables[power] = (frequency, values, slopes)
+
+    @classmethod
+    def from_csv(cls, path: str | pathlib.Path, **kwargs) -> "PathLoss":
+        """Loads a path loss file as written by `calibrate.py`."""
+        path_loss = cls(pd.read_csv(path), **kwargs)
+        path_loss.sources = [pathlib.Path(path)]
+        return path_loss
+
+    def loss(
+        self,
+        frequency: float | np.ndarray,
+        column: str,
+        power: float | None = None,
+    ) -> float | np.ndarray:
+        """Returns the path loss in dB, linearly interpolated in frequency.
+
+        Args:
+            frequency (float | np.ndarray): Frequency or frequencies in Hz.
+            column (str): Loss column, e.g. "sg_to_dut_p1_loss_db".
+            power (float, optional): Signal power in dBm. Interpolated linearly between
+                the calibrated powers and clamped to the nearest outside them. Defaults
+                to the lowest calibrated power.
+        """
+        row = self.columns.index(column)
+        if not len(self.powers):
+            return self._interpolate(np.inf, row, frequency)
+        if power is None:
+            power = self.powers[0]
+
+        i = np.searchsorted(self.powers, power)
+        if i == 0 or i == len(self.powers):
+            nearest = self.powers[min(i, len(self.powers) - 1)]
+            return self._interpolate(nearest, row, frequency)
+        p0, p1 = self.powers[i - 1], self.powers[i]
+        l0 = self._interpolate(p0, row, frequency)
+        l1 = self._interpolate(p1, row, frequency)
+        return l0 + (l1 - l0) * (power - p0) / (p1 - p0)
+
+    def output_power(self, frequency: float, column: str, reading: float) -> float:
+        """Returns the power in dBm at the DUT end of the output path `column` for a
+        `reading` in dBm at its far end, using the loss at that power.
+
+        The power is first estimated with the loss at the lowest calibrated power,
+        which is accurate as long as the loss changes slowly with power.
+        """
+        power = reading - self.loss(frequency, column)
+        return reading - self.loss(frequency, column, power=power)
+
+    def losses(self, frequency: float, power: float | None = None) -> dict[str, float]:
+        """Returns all loss columns at `frequency`."""
+        return {column: self.loss(frequency, column, power) for column in self.columns}
+
+    def frequency_range(self) -> tuple[float, float]:
+        """Returns the lowest and highest calibrated frequency."""
+        frequencies = np.concatenate([table[0] for table in self.tables.values()])
+        return frequencies.min(), frequencies.max()
+
+    def _interpolate(self, power: float, row: int, frequency):
+        frequencies, values, slopes = self.tables[power]
+        f = np.asarray(frequency, dtype="float64")
+        outside = (f < frequencies[0] - self.max_extrapolation_hz) | (
+            f > frequencies[-1] + self.max_extrapolation_hz
+        )
+        if np.any(outside):
+            bad = np.atleast_1d(f)[np.atleast_1d(outside)][0]
+            raise ValueError(
+                f"{bad / 1e9:.4f} GHz is outside the calibrated range "
+                f"{frequencies[0] / 1e9:.4f} to {frequencies[-1] / 1e9:.4f} GHz"
+            )
+        f = np.clip(f, frequencies[0], frequencies[-1])
+        i = np.clip(np.searchsorted(frequencies, f, side="right") - 1, 0, None)
+        i = np.minimum(i, max(len(frequencies) - 2, 0))
+        if len(frequencies) == 1:
+            res = np.full(f.shape, values[row, 0])
+        else:
+            res = values[row, i] + slopes[row, i] * (f - frequencies[i])
+        return res.item() if res.ndim == 0 else res
+
+
+class PathLossStore:
+    def __init__(self, root: str | pathlib.Path):
+        self.root = pathlib.Path(root)
+        self._loaded = {}
+
+    def save(
+        self,
+        data: pd.DataFrame,
+        rig: str,
+        power_dbm: float,
+        date: str,
+        **metadata,
+    ) -> pathlib.Path:
+        """Stores one calibration.
+
+        Args:
+            data (pd.DataFrame): Loss columns indexed by frequency, as built by
+                `calibrate.main`. A `power` index level is dropped.
+            rig (str): Test rig the calibration belongs to.
+            power_dbm (float): Calibration power.
+            date (str): Calibration date stamp, "%y%m%d-%Hh%Mm".
+            **metadata: Further JSON serializable metadata, e.g. `cables` or `parent`.
+
+        Returns:
+            pathlib.Path: The written file.
+        """
+        data = data.reset_index().rename(columns={"frequency_hz": "frequency"})
+        data = data.drop(columns=["power", "index"], errors="ignore")
+        data = data.sort_values("frequency")
+        columns = [c for c in data.columns if c != "frequency"]
+        metadata = {"rig": rig, "power_dbm": power_dbm, "date": date} | metadata
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"{rig}_{date}_{power_dbm:g}dBm.npz"
+        np.savez_compressed(
+            path,
+            frequency=data["frequency"].to_numpy(dtype="float64"),
+            losses=data[columns].to_numpy(dtype="float64"),
+            columns=np.array(columns),
+            metadata=np.array(json.dumps(metadata)),
+        )
+        return path
+
+    def catalog(self, rig: str | None = None) -> pd.DataFrame:
+        """Returns the metadata of the stored calibrations, newest first.
+
+        Only the metadata entry of each file is read.
+        """
+        entries = []
+        for path in self.root.glob(f"{rig or '*'}_*.npz"):
+            with np.load(path) as calibration:
+                metadata = json.loads(str(calibration["metadata"]))
+            entries.append(metadata | {"path": path})
+        if not entries:
+            return pd.DataFrame(columns=["rig", "power_dbm", "date", "path"])
+        catalog = pd.DataFrame(entries)
+        if rig is not None:
+            catalog = catalog[catalog["rig"] == rig]
+        return catalog.sort_values("date", ascending=False, ignore_index=True)
+
+    def load(
+        self,
+        rig: str,
+        power_dbm: float | list[float] | None = None,
+        date: str | None = None,
+        **kwargs,
+    ) -> PathLoss:
+        """Loads the latest calibration of each power level of `rig`.
+
+        Args:
+            rig (str): Test rig.
+            power_dbm (float | list, optional): Only load these power levels.
+            date (str, optional): Ignore calibrations made after this date stamp.
+            **kwargs: Passed on to `PathLoss`.
+        """
+        catalog = self.catalog(rig)
+        if power_dbm is not None:
+            powers = power_dbm if isinstance(power_dbm, list) else [power_dbm]
+            catalog = catalog[catalog["power_dbm"].isin(powers)]
+        if date is not None:
+            catalog = catalog[catalog["date"] <= date]
+        catalog = catalog.drop_duplicates("power_dbm")
+        if catalog.empty:
+            raise FileNotFoundError(f"No path loss calibration of rig {rig}")
+
+        frames = [self.read(path)[0] for path in catalog["path"]]
+        path_loss = PathLoss(pd.concat(frames, ignore_index=True), **kwargs)
+        path_loss.sources = list(catalog["path"])
+        return path_loss
+
+    def read(self, path: str | pathlib.Path) -> tuple[pd.DataFrame, dict]:
+        """Reads one stored calibration.
+
+        Returns:
+            tuple: `power`, `frequency` and loss columns, and the metadata.
+        """
+        with np.load(path) as calibration:
+            metadata = json.loads(str(calibration["metadata"]))
+            frame = pd.DataFrame(
+                calibration["losses"], columns=list(calibration["columns"])
+            )
+            frame.insert(0, "frequency", calibration["frequency"])
+        frame.insert(0, "power", metadata["power_dbm"])
+        return frame, metadata
+
+    def loss(
+        self,
+        rig: str,
+        power_dbm: float,
+        frequency: float | np.ndarray,
+        column: str,
+    ) -> float | np.ndarray:
+        """Returns the loss of `rig` at `power_dbm` and `frequency`, interpolated."""
+        if rig not in self._loaded:
+            self._loaded[rig] = self.load(rig)
+        return self._loaded[rig].loss(frequency, column, power=power_dbm)
@@ -0,0 +1,299 @@
+"""Columnar results store.
+
+Every run is appended as one Parquet file per table (`lasig`, `sweep`, `aclr`) to a
+Hive partitioned dataset:
+
+    <root>/<table>/product=<product>/date=<YYYY-MM-DD>/<serial>_<run>.parquet
+
+The partition date is the date of the run stamp. A small index
+(`<root>/_index.parquet`) maps serial, frequency and condition to the files that
+contain them, so a query only opens the partitions and files it needs. Each append
+only writes an index fragment to `<root>/_index/`; the fragments are compacted into
+the index when it is read. Index updates hold a lock file (`<root>/_index.lock`), so
+scripts running in parallel processes can share the store. Files are read
+memory-mapped and only the requested columns are decoded.
+
+    from library.results import ResultsStore
+
+    store = ResultsStore("log/results")
+    store.append("lasig", lasig_data, product="Product-A", serial="12345678", run=date)
+    df = store.query("lasig", columns=["pout_dbm", "pae"], product="Product-A", frequency_hz=3.45e9)
+"""
+import contextlib
+import datetime
+import os
+import pathlib
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.parquet as pq
+
+
+INDEX_COLUMNS = [
+    "table",
+    "product",
+    "date",
+    "serial",
+    "run",
+    "frequency_hz",
+    "condition",
+    "file",
+]
+
+# Seconds after which the lock file of a crashed process is broken
+STALE_LOCK_S = 60
+
+
+class ResultsStore:
+    def __init__(self, root: str | pathlib.Path):
+        self.root = pathlib.Path(root)
+        self.index_path = self.root / "_index.parquet"
+        self.fragments_path = self.root / "_index"
+        self.lock_path = self.root / "_index.lock"
+        self._filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+
+    def append(
+        self,
+        table: str,
+        data: pd.DataFrame,
+        product: str,
+        serial: str,
+        run: str | None = None,
+    ) -> pathlib.Path:
+        """Appends the result of one run to `table` and updates the index.
+
+        Args:
+            table (str): Result table, e.g. "lasig", "sweep" or "aclr".
+            data (pd.DataFrame): Run results. Index levels are stored as columns.
+            product (str): Product name, used as partition key.
+            serial (str): DUT serial number.
+            run (str, optional): Run identifier, the script's date stamp
+                ("%y%m%d-%Hh%Mm"). Defaults to now.
+
+        Returns:
+            pathlib.Path: The written Parquet file.
+        """
+        if run is None:
+            run = time.strftime("%y%m%d-%Hh%Mm")
+        date = run_date(run)
+
+        frame = normalize(table, data)
+        frame.insert(0, "serial", str(serial))
+        frame.insert(1, "run", run)
+
+        partition = self.root / table / f"product={product}" / f"date={date}"
+        partition.mkdir(parents=True, exist_ok=True)
+        file = partition / f"{serial}_{run}.parquet"
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), file)
+
+        entries = frame[[c for c in ["frequency_hz", "condition"] if c in frame]]
+        entries = entries.drop_duplicates().reindex(
+            columns=["frequency_hz", "condition"]
+        )
+        entries.insert(0, "table", table)
+        entries.insert(1, "product", product)
+        entries.insert(2, "date", date)
+        entries.insert(3, "serial", str(serial))
+        entries.insert(4, "run", run)
+        entries["file"] = file.relative_to(self.root).as_posix()
+        self.fragments_path.mkdir(parents=True, exist_ok=True)
+        fragment = self.fragments_path / f"{table}_{product}_{serial}_{run}.parquet"
+        self._write_index(entries, fragment)
+
+        return file
+
+    def index(self) -> pd.DataFrame:
+        """Returns the store index, one row per (file, frequency, condition).
+
+        Index fragments written since the last call are compacted into the index.
+        """
+        with self.lock():
+            fragments = sorted(self.fragments_path.glob("*.parquet"))
+            frames = [
+                pq.read_table(path, memory_map=True).to_pandas()
+                for path in [self.index_path, *fragments]
+                if path.exists()
+            ]
+            if not frames:
+                return pd.DataFrame(columns=INDEX_COLUMNS)
+            index = frames[0]
+            for frame in frames[1:]:
+                # A run appended again replaces all of its earlier entries
+                earlier = index["file"].isin(frame["file"])
+                index = pd.concat([index[~earlier], frame], ignore_index=True)
+            if fragments:
+                self._write_index(index, self.index_path)
+                for path in fragments:
+                    path.unlink()
+            return index
+
+    @contextlib.contextmanager
+    def lock(self, timeout: float = 30):
+        """Holds the lock file of the index, shared by all processes using the store.
+
+        Raises:
+            TimeoutError: If the lock is not released within `timeout` seconds.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    age = time.time() - self.lock_path.stat().st_mtime
+                    if age > STALE_LOCK_S:
+                        self.lock_path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"{self.lock_path} is held by another process")
+                time.sleep(0.01)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield
+        finally:
+            self.lock_path.unlink(missing_ok=True)
+
+    def files(
+        self,
+        table: str,
+        product: str | list[str] | None = None,
+        serial: str | list[str] | None = None,
+        frequency_hz: float | list[float] | None = None,
+        condition: str | list[str] | None = None,
+        date_from: str | None = None,
+        date_to: str | None = None,
+    ) -> list[pathlib.Path]:
+        """Returns the files of `table` that hold data matching the given keys."""
+        index = self.index()
+        mask = index["table"] == table
+        for column, value in [
+            ("product", product),
+            ("serial", serial),
+            ("frequency_hz", frequency_hz),
+            ("condition", condition),
+        ]:
+            if value is not None:
+                mask &= index[column].isin(aslist(value))
+        if date_from is not None:
+            mask &= index["date"] >= date_from
+        if date_to is not None:
+            mask &= index["date"] <= date_to
+        return [self.root / file for file in index.loc[mask, "file"].unique()]
+
+    def query(
+        self,
+        table: str,
+        columns: list[str] | None = None,
+        product: str | list[str] | None = None,
+        serial: str | list[str] | None = None,
+        frequency_hz: float | list[float] | None = None,
+        condition: str | list[str] | None = None,
+        date_from: str | None = None,
+        date_to: str | None = None,
+    ) -> pd.DataFrame:
+        """Loads rows of `table` matching the given keys.
+
+        Only the partitions and files listed in the index are opened, and only `columns`
+        (plus the key columns) are read. Dates are given as "YYYY-MM-DD".
+        """
+        files = self.files(
+            table,
+            product=product,
+            serial=serial,
+            frequency_hz=frequency_hz,
+            condition=condition,
+            date_from=date_from,
+            date_to=date_to,
+        )
+        filters = {
+            column: aslist(value)
+            for column, value in [
+                ("serial", serial),
+                ("frequency_hz", frequency_hz),
+                ("condition", condition),
+            ]
+            if value is not None
+        }
+        return self.read(table, files, columns=columns, filters=filters)
+
+    def read(
+        self,
+        table: str,
+        files: list[str | pathlib.Path],
+        columns: list[str] | None = None,
+        filters: dict[str, list] | None = None,
+    ) -> pd.DataFrame:
+        """Reads `files` of `table` memory-mapped, with the partition keys as columns.
+
+        Args:
+            table (str): Result table the files belong to.
+            files (list): Files as returned by `files()`, or relative to the store root.
+            columns (list, optional): Columns to read in addition to the key columns.
+            filters (dict, optional): `{column: values}` row filter pushed down to the scan.
+        """
+        if not files:
+            return pd.DataFrame(columns=columns)
+
+        dataset = ds.dataset(
+            [str(self.root / file) for file in files],
+            format="parquet",
+            filesystem=self._filesystem,
+            partitioning=ds.partitioning(flavor="hive"),
+            partition_base_dir=str(self.root / table),
+        )
+        names = dataset.schema.names
+        keys = [
+            column
+            for column in ["product", "date", "serial", "run", "frequency_hz", "condition"]
+            if column in names
+        ]
+        if columns is not None:
+            columns = keys + [c for c in columns if c not in keys and c in names]
+
+        expression = None
+        for column, values in (filters or {}).items():
+            if column in names:
+                term = pc.field(column).isin(values)
+                expression = term if expression is None else expression & term
+
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def _write_index(self, index: pd.DataFrame, path: pathlib.Path) -> None:
+        """Writes `index` to `path` atomically, so readers never see a partial file."""
+        tmp = path.with_suffix(".tmp")
+        index = index.astype({"condition": "string", "date": "string"})
+        pq.write_table(pa.Table.from_pandas(index, preserve_index=False), tmp)
+        tmp.replace(path)
+
+
+def normalize(table: str, data: pd.DataFrame) -> pd.DataFrame:
+    """Flattens a result DataFrame into plain columns with `frequency_hz`/`condition` keys."""
+    frame = data.copy()
+    if table == "sweep" and frame.index.nlevels == 2:
+        frame.index.names = ["frequency_hz", frame.index.names[1]]
+    frame = frame.reset_index()
+    if "pout_target" in frame and "condition" not in frame:
+        frame["condition"] = frame["pout_target"].astype(str) + "dbm"
+    return frame
+
+
+def run_date(run: str) -> str:
+    """Returns the date of a run stamp ("%y%m%d-%Hh%Mm") as "YYYY-MM-DD", or today's
+    date for other run identifiers."""
+    try:
+        return datetime.datetime.strptime(run[:6], "%y%m%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return time.strftime("%Y-%m-%d")
+
+
+def aslist(value) -> list:
+    return value if isinstance(value, list) else [value]
@@ -0,0 +1,266 @@
+import concurrent.futures
+import contextlib
+import functools
+import pathlib
+import time
+from typing import Callable
+
+from library.drivers.vsa import FSW43
+from library.drivers.vsg import SMW200A
+from library.drivers.power_supplies import E36313A
+from library.drivers.sensors import NRPZ86
+from library.drivers.switches import RFSwitch
+from library.measurement_cache import MeasurementCache
+from library.path_loss import PathLoss
+from library.scheduler import AnalyzerScheduler
+
+
+class Rig:
+    """The instrument set and path loss of one test station.
+
+    Measurement functions take a `Rig` instead of reading module-level instruments, so
+    several stations can be driven from one process. Any objects with the driver
+    methods can be passed in, e.g. stand-in instruments for testing.
+
+    Rigs sharing one analyzer get the same `scheduler` and use the analyzer through
+    `lease_vsa`; an RF `switch` connects the analyzer to the rig's `switch_port`.
+    Repeated readings at an unchanged generator state can be served from `readings`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        vsa: FSW43,
+        vsg: SMW200A,
+        sensor: NRPZ86,
+        ps1: E36313A,
+        ps2: E36313A,
+        path_loss: PathLoss | None = None,
+        path_loss_path: pathlib.Path | None = None,
+        scheduler: AnalyzerScheduler | None = None,
+        switch: RFSwitch | None = None,
+        switch_port: int | None = None,
+        readings: MeasurementCache | None = None,
+        rm=None,
+    ):
+        self.name = name
+        self.vsa = vsa
+        self.vsg = vsg
+        self.sensor = sensor
+        self.ps1 = ps1
+        self.ps2 = ps2
+        self.path_loss = path_loss
+        self.path_loss_path = path_loss_path
+        self.scheduler = scheduler
+        self.switch = switch
+        self.switch_port = switch_port
+        self.readings = readings if readings is not None else MeasurementCache()
+        self.rm = rm
+
+    @classmethod
+    def open(
+        cls,
+        rm,
+        name: str,
+        settings: dict,
+        path_loss: PathLoss | None = None,
+        path_loss_path: pathlib.Path | None = None,
+    ) -> "Rig":
+        """Opens the instruments listed in a rig file (see `config.load_rig`).
+
+        The sessions are opened and identified concurrently, see `open_instruments`.
+        The analyzer, generator, sensor and RF switch keep their current state; the
+        power supplies are reset.
+        """
+        sensor = settings["PowerSensor"]["NRP_Z86"]
+        openers = dict(
+            vsa=lambda: FSW43(
+                rm, ip_address=settings["SA"]["FSW43"]["ip"], reset=False
+            ),
+            vsg=lambda: SMW200A(
+                rm, ip_address=settings["SG"]["SMW200A"]["ip"], reset=False
+            ),
+            sensor=lambda: NRPZ86(
+                rm,
+                device_id=sensor["device_id"],
+                serial=sensor["serial_nu"],
+                reset=False,
+            ),
+            ps1=lambda: E36313A(
+                rm, ip_address=settings["PowerSupply"]["E36313A_1"]["ip"]
+            ),
+            ps2=lambda: E36313A(
+                rm, ip_address=settings["PowerSupply"]["E36313A_2"]["ip"]
+            ),
+        )
+        switch = settings.get("Switch", {}).get("RFSwitch")
+        if switch is not None:
+            openers["switch"] = lambda: RFSwitch(
+                rm, ip_address=switch["ip"], reset=False
+            )
+        return cls(
+            name=name,
+            rm=rm,
+            path_loss=path_loss,
+            path_loss_path=path_loss_path,
+            switch_port=switch["port"] if switch is not None else None,
+            **open_instruments(**openers),
+        )
+
+    def lease_vsa(self):
+        """Returns a context manager holding the analyzer, see
+        `library.scheduler.AnalyzerScheduler.lease`. Without a `scheduler`, the rig
+        has the analyzer to itself and the lease costs nothing.
+
+        Yields:
+            FSW43: The analyzer.
+        """
+        if self.scheduler is None:
+            return contextlib.nullcontext(self.vsa)
+        route = None
+        if self.switch is not None:
+            route = functools.partial(self.switch.select, self.switch_port)
+        return self.scheduler.lease(self.name, self.vsa, route=route)
+
+    def shutdown(self) -> None:
+        """Turns off the RF output and the DUT supplies."""
+        self.vsg.set_output("OFF")
+        self.ps2.turn_off(1, 2, 3)
+        self.ps1.turn_off(1, 2, 3)
+
+    def close(self) -> None:
+        """Closes the resource manager the rig was opened with, releasing the
+        instruments it shares with other rigs (see `library.simulator.SimLab`)."""
+        if self.rm is not None and hasattr(self.rm, "close"):
+            self.rm.close()
+
+
+def open_instruments(**openers: Callable) -> dict:
+    """Opens instrument sessions concurrently and checks their `*IDN?`.
+
+    Opening a VISA session (and a `*RST`) mostly waits on the network, so the sessions
+    are opened in parallel threads instead of one after another.
+
+    Args:
+        **openers: `name=callable` returning the opened driver, e.g.
+            `vsa=lambda: FSW43(rm, ip_address=...)`.
+
+    Returns:
+        dict: `{name: driver}`.
+
+    Raises:
+        ConnectionError: If an instrument does not identify as the expected model.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(openers)) as pool:
+        futures = {
+            name: pool.submit(open_identified, opener)
+            for name, opener in openers.items()
+        }
+    return {name: future.result() for name, future in futures.items()}
+
+
+def open_identified(opener: Callable):
+    instrument = opener()
+    instrument.identify()
+    return instrument
+
+
+def resource_manager(settings: dict, name: str = "", cfg: dict | None = None):
+    """Returns the VISA resource manager for a rig file: a simulated one if the file
+    has a `[Simulation]` section (see `library.simulator`), else pyvisa's. Simulated
+    rigs of one process share an analyzer listed at the same address.
+
+    Args:
+        settings (dict): Parsed rig file.
+        name (str, optional): Rig name, used in the transcript and socket names.
+        cfg (dict, optional): Parsed `config.toml`, whose options wrap or replace the
+            resource manager:
+
+            * `[InstrumentServer]`: With `connect` and a running server, the sessions
+              of the server are used (see `library.instrument_server`).
+            * `[Transcript]`: With `record`, the command stream is appended to
+              `log/transcripts/{name}_{date}.jsonl`; with a `replay` file, the
+              recorded responses are served instead (see `library.transcript`).
+            * `trace`: Instrument calls are recorded as spans of the running trace
+              (see `library.tracing`).
+    """
+    cfg = cfg or {}
+    transcript = cfg.get("Transcript", {})
+    if replay := transcript.get("replay"):
+        from library.transcript import TRANSCRIPT_DIR, ReplayResourceManager
+
+        rm = ReplayResourceManager(
+            TRANSCRIPT_DIR / replay.format(rig=name),
+            time_scale=transcript.get("time_scale", 0.0),
+            strict=transcript.get("strict", True),
+        )
+    elif (path := server_socket(cfg, name)) is not None:
+        from library.instrument_server import RemoteResourceManager
+
+        rm = RemoteResourceManager(path)
+    elif "Simulation" in settings:
+        from library.simulator import LAB, SimResourceManager
+
+        rm = SimResourceManager(settings, lab=LAB)
+    else:
+        import pyvisa
+
+        rm = pyvisa.ResourceManager()
+
+    if transcript.get("record") and not replay:
+        from library.transcript import TRANSCRIPT_DIR, RecordingResourceManager
+
+        date = time.strftime("%y%m%d-%Hh%Mm")
+        rm = RecordingResourceManager(rm, TRANSCRIPT_DIR / f"{name}_{date}.jsonl")
+
+    if cfg.get("trace"):
+        from library.tracing import TracingResourceManager
+
+        rm = TracingResourceManager(rm)
+    return rm
+
+
+def server_socket(cfg: dict, name: str) -> pathlib.Path | None:
+    """Returns the socket of the running instrument server of rig `name` if the
+    scripts are configured to connect to it, else None."""
+    server = cfg.get("InstrumentServer", {})
+    if server.get("connect") and (path := socket_path(server, name)).exists():
+        return path
+    return None
+
+
+def lock_instruments(*instruments, timeout: float | None = None) -> None:
+    """Locks the sessions of the driver `instruments` exclusively for this script,
+    e.g. the shared sessions of an instrument server, until it unlocks them or
+    exits.
+
+    Args:
+        timeout (float, optional): Seconds to wait for another script's lock, after
+            which the session raises.
+    """
+    for instrument in instruments:
+        instrument.instrument.lock_excl(timeout)
+
+
+def socket_path(server: dict, name: str) -> pathlib.Path:
+    """Returns the socket of the instrument server of rig `name`, see the
+    `[InstrumentServer]` table of `config.toml`."""
+    socket = server.get("socket", "log/instrument_server_{rig}.sock")
+    return pathlib.Path(__file__).parents[1] / socket.format(rig=name)
+
+
+def resource_names(settings: dict) -> dict[str, str]:
+    """Returns the VISA resource names of the instruments of a rig file, as opened by
+    the drivers."""
+    sensor = settings["PowerSensor"]["NRP_Z86"]
+    names = {
+        "vsa": f"TCPIP::{settings['SA']['FSW43']['ip']}::inst0::INSTR",
+        "vsg": f"TCPIP::{settings['SG']['SMW200A']['ip']}::inst0::INSTR",
+        "sensor": f"RSNRP::{sensor['device_id']}::{sensor['serial_nu']}::INSTR",
+        "ps1": f"TCPIP::{settings['PowerSupply']['E36313A_1']['ip']}::inst0::INSTR",
+        "ps2": f"TCPIP::{settings['PowerSupply']['E36313A_2']['ip']}::inst0::INSTR",
+    }
+    if "Switch" in settings:
+        ip_address = settings["Switch"]["RFSwitch"]["ip"]
+        names["switch"] = f"TCPIP::{ip_address}::inst0::INSTR"
+    return names
@@ -0,0 +1,124 @@
+"""Time-sliced sharing of one analyzer between test stations.
+
+Several rigs, each with a generator, sensor and supplies of its own, can list the same
+FSW43 in their rig files. The measurement code leases the analyzer only for the steps
+that use it (`Rig.lease_vsa`), so one station sweeps Pout on its sensor while another
+measures ACLR:
+
+    scheduler = AnalyzerScheduler()
+    rig_a.scheduler = rig_b.scheduler = scheduler
+    with rig_a.lease_vsa() as vsa:
+        vsa.measure_peak()
+
+Leases are granted first come, first served. With one thread per station, every
+waiting station gets the analyzer before any station gets it twice. When the analyzer
+changes hands, the setup of the previous station is saved to a state register of its
+own, the RF switch routes the next station's DUT output to the analyzer, and the next
+station's setup is recalled. Consecutive leases of one station skip all three. The
+time spent waiting for a lease shows in traces as `analyzer wait` spans (category
+`lease`).
+"""
+import collections
+import contextlib
+import threading
+import time
+from typing import Callable
+
+from library import tracing
+
+
+class AnalyzerScheduler:
+    """Grants leases of one shared analyzer, see the module docstring."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue = collections.deque()
+        self.owner = None
+        self.depth = 0
+        self.configured = None
+        self.registers = {}
+        self.saved = set()
+        self.start = time.perf_counter()
+        self.busy_s = 0.0
+        self.handovers = 0
+        self.leases = collections.Counter()
+        self.wait_s = collections.defaultdict(float)
+
+    @contextlib.contextmanager
+    def lease(self, station: str, vsa, route: Callable[[], None] | None = None):
+        """Holds the analyzer for `station` in the enclosed block.
+
+        Leases are reentrant, so a leasing function can call other leasing functions.
+
+        Args:
+            station (str): Rig name.
+            vsa (FSW43): The station's session of the analyzer, used to save and recall
+                the setups.
+            route (Callable, optional): Routes the station's DUT output to the
+                analyzer, e.g. by closing its port of an RF switch.
+
+        Yields:
+            FSW43: `vsa`.
+        """
+        thread = threading.get_ident()
+        if self.owner == thread:
+            self.depth += 1
+            try:
+                yield vsa
+            finally:
+                self.depth -= 1
+            return
+
+        requested = time.perf_counter()
+        with tracing.span("analyzer wait", "lease"), self.condition:
+            ticket = object()
+            self.queue.append(ticket)
+            self.condition.wait_for(lambda: self.queue[0] is ticket)
+            self.owner = thread
+        granted = time.perf_counter()
+        try:
+            if self.configured != station:
+                self.hand_over(station, vsa, route)
+            yield vsa
+        finally:
+            released = time.perf_counter()
+            with self.condition:
+                self.busy_s += released - granted
+                self.leases[station] += 1
+                self.wait_s[station] += granted - requested
+                self.owner = None
+                self.queue.popleft()
+                self.condition.notify_all()
+
+    def hand_over(self, station: str, vsa, route: Callable[[], None] | None) -> None:
+        """Saves the setup of the previous station and recalls the one of `station`."""
+        if self.configured is not None:
+            vsa.save_state(self.register(self.configured))
+            self.saved.add(self.configured)
+        if route is not None:
+            route()
+        if station in self.saved:
+            vsa.recall_state(self.register(station))
+        self.configured = station
+        self.handovers += 1
+
+    def register(self, station: str) -> int:
+        """Returns the state register of `station`, numbered from 1."""
+        return self.registers.setdefault(station, len(self.registers) + 1)
+
+    def utilization(self) -> float:
+        """Returns the fraction of time the analyzer was leased."""
+        elapsed = time.perf_counter() - self.start
+        return self.busy_s / elapsed if elapsed > 0 else 0
+
+    def report(self) -> str:
+        lines = [
+            f"Shared analyzer: {self.utilization():.0%} utilized, "
+            f"{self.handovers} handovers"
+        ]
+        for station, leases in self.leases.items():
+            lines.append(
+                f"  rig {station}: {leases} leases, "
+                f"{self.wait_s[station]:.1f} s waiting"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,189 @@
+"""Settling detection from live readings instead of fixed delays.
+
+A cheap reading (sensor power, supply current, analyzer marker) is polled until the
+last `window` readings lie within `tolerance` of each other. Each measurement context
+has its own criterion, with a minimum wait before a window may count as settled and a
+maximum wait after which the measurement proceeds anyway (`wait` and `until` then warn
+with a `SettlingTimeout`):
+
+    settling = settling_contexts(cfg.get("Settling", {}))
+    pout = settling["sweep_point"].read(sensor.get_power, average_count=3)
+    settling["thermal"].wait(supply_current)
+
+The defaults are in `CONTEXTS` and are overridden per context under `[Settling]` in
+`config.toml`. Waits show in traces as `settle` spans.
+"""
+import dataclasses
+import statistics
+import time
+import warnings
+from typing import Callable
+
+from library import tracing
+
+
+class SettlingTimeout(UserWarning):
+    """Warned when a wait proceeds after `max_wait` without having settled."""
+
+
+@dataclasses.dataclass(frozen=True)
+class Settling:
+    """Settling criterion of one measurement context.
+
+    Args:
+        tolerance (float): Allowed spread of the settling window, in the unit of the
+            reading.
+        window (int): Number of consecutive readings that must agree.
+        min_wait (float): Seconds before a window may count as settled.
+        max_wait (float): Seconds after which the reading counts as settled anyway.
+        interval (float): Pause between readings in seconds, 0 polls back to back.
+    """
+
+    tolerance: float = 0.05
+    window: int = 3
+    min_wait: float = 0
+    max_wait: float = 1
+    interval: float = 0
+
+    def read(self, read: Callable[[], float], average_count: int = 1) -> float:
+        """Returns the settled median of `read`, see `read_settled`."""
+        return read_settled(
+            read,
+            average_count=average_count,
+            tolerance=self.tolerance,
+            window=self.window,
+            max_wait=self.max_wait,
+            min_wait=self.min_wait,
+            interval=self.interval,
+        )
+
+    def wait(self, read: Callable[[], float]) -> bool:
+        """Polls `read` until it settles and returns whether it did within
+        `max_wait`, warning with a `SettlingTimeout` if not."""
+        readings = []
+        start = time.perf_counter()
+        with tracing.span("settle", "settle", max_wait=self.max_wait):
+            while True:
+                readings.append(read())
+                elapsed = time.perf_counter() - start
+                last = readings[-self.window :]
+                if (
+                    elapsed >= self.min_wait
+                    and len(last) == self.window
+                    and max(last) - min(last) <= self.tolerance
+                ):
+                    return True
+                if elapsed > self.max_wait:
+                    warnings.warn(
+                        f"Reading did not settle within {self.max_wait} s, last "
+                        f"readings {last}",
+                        SettlingTimeout,
+                        stacklevel=2,
+                    )
+                    return False
+                if self.interval > 0:
+                    time.sleep(self.interval)
+
+    def until(self, condition: Callable[[], bool]) -> bool:
+        """Polls `condition` until it holds and returns whether it did within
+        `max_wait`, e.g. for a state that has no numeric reading. Warns with a
+        `SettlingTimeout` if not."""
+        start = time.perf_counter()
+        with tracing.span("settle", "settle", max_wait=self.max_wait):
+            while True:
+                elapsed = time.perf_counter() - start
+                if elapsed >= self.min_wait and condition():
+                    return True
+                if elapsed > self.max_wait:
+                    warnings.warn(
+                        f"Condition did not hold within {self.max_wait} s",
+                        SettlingTimeout,
+                        stacklevel=2,
+                    )
+                    return False
+                if self.interval > 0:
+                    time.sleep(self.interval)
+
+
+# Defaults per measurement context, overridden by `[Settling.<context>]`
+CONTEXTS = {
+    # Total supply current in A after the RF turns on at the sweep start, i.e. the
+    # PA heating up under bias
+    "thermal": Settling(tolerance=0.005, window=3, max_wait=2, interval=0.1),
+    # Sensor power in dBm after each Pin step of a power sweep
+    "sweep_point": Settling(tolerance=0.05, window=2, max_wait=0.2),
+    # Sensor power in dBm after each Pin step of the Pout search
+    "pout": Settling(tolerance=0.05, window=2, max_wait=0.25),
+    # Analyzer marker in dBm after retuning to the fundamental or a harmonic
+    "harmonic": Settling(tolerance=0.1, window=3, max_wait=1),
+    # Analyzer connection to the generator after enabling the generator control
+    "generator": Settling(max_wait=0.5, interval=0.05),
+    # Raw EVM in % of the DPD channel after a direct DPD sequence, while the
+    # correction is applied to the generator's waveform
+    "dpd": Settling(tolerance=0.1, window=3, max_wait=20, interval=0.5),
+}
+
+
+def settling_contexts(settings: dict) -> dict[str, Settling]:
+    """Returns `CONTEXTS` updated with the `[Settling]` section of the config.
+
+    Raises:
+        ValueError: If the section names an unknown context or setting.
+    """
+    contexts = dict(CONTEXTS)
+    fields = {field.name for field in dataclasses.fields(Settling)}
+    for context, overrides in settings.items():
+        if context not in CONTEXTS:
+            raise ValueError(f"Unknown settling context {context!r}")
+        if unknown := set(overrides) - fields:
+            raise ValueError(f"Unknown settling setting {unknown} for {context!r}")
+        contexts[context] = dataclasses.replace(CONTEXTS[context], **overrides)
+    return contexts
+
+
+def read_settled(
+    read: Callable[[], float],
+    average_count: int = 10,
+    tolerance: float = 0.05,
+    window: int = 3,
+    max_wait: float = 1,
+    min_wait: float = 0,
+    interval: float = 0,
+) -> float:
+    """Polls `read` until it settles and returns the median of `average_count` readings.
+
+    The reading is settled once the last `window` readings lie within `tolerance` of
+    each other. Those readings count towards the average, so a reading that is settled
+    right away costs no more than `max(window, average_count)` calls. If the reading
+    has not settled within `max_wait` seconds, the last `average_count` readings are
+    used.
+
+    Args:
+        read (Callable): Takes one reading, e.g. `sensor.get_power`.
+        average_count (int): Number of settled readings to take the median of.
+        tolerance (float): Allowed spread of the settling window, in the unit of `read`.
+        window (int): Number of consecutive readings that must agree.
+        max_wait (float): Maximum settling time in seconds.
+        min_wait (float): Seconds before a window may count as settled.
+        interval (float): Pause between readings in seconds.
+    """
+    readings = []
+    settled = None
+    start = time.perf_counter()
+    while True:
+        readings.append(read())
+        if settled is None:
+            elapsed = time.perf_counter() - start
+            last = readings[-window:]
+            if (
+                elapsed >= min_wait
+                and len(last) == window
+                and max(last) - min(last) <= tolerance
+            ):
+                settled = len(readings) - window
+            elif elapsed > max_wait:
+                settled = max(len(readings) - average_count, 0)
+        if settled is not None and len(readings) - settled >= average_count:
+            return statistics.median(readings[settled:])
+        if interval > 0:
+            time.sleep(interval)
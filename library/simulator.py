@@ -0,0 +1,791 @@
+"""Simulated VISA instruments.
+
+`SimResourceManager` stands in for `pyvisa.ResourceManager`. It serves the SCPI
+subsets used by the `FSW43`, `SMW200A`, `NRPZ86`, `E36313A` and `RFSwitch` drivers
+from a shared `Bench`: the generator output goes through the input cable into the
+behavioral PA model of `library/pa_model.py` (or a thru during calibration), and on to
+the analyzer and sensor through the output paths. Every command takes a configurable
+latency, readings settle exponentially after an RF change and carry Gaussian noise,
+and faults (timeouts, errors in the queue) can be injected. A rig file with a
+`[Simulation]` section selects it (see `rig_SIM.toml`):
+
+    rm = SimResourceManager(load_rig("SIM"))
+    rig = Rig.open(rm, "SIM", load_rig("SIM"))
+    rm.inject("FETCH?", "timeout")  # the next sensor read times out
+
+Simulated rigs opened with the same `SimLab` share the analyzer and RF switch their
+rig files list at the same address. The analyzer measures the bench of the rig whose
+switch port is closed, like stations sharing an analyzer (see `library.scheduler`).
+"""
+import collections
+import copy
+import fnmatch
+import math
+import random
+import re
+import threading
+import time
+
+from library.pa_model import PAModel
+
+# Command latencies in seconds. `write`/`query` apply to every command without an entry.
+LATENCY_S = {
+    "write": 0.001,
+    "query": 0.003,
+    "*RST": 1.0,
+    "INST:CRE": 0.5,
+    "INIT": 0.05,
+    "INIT:IMM": 0.02,
+    "CALC:MARK:MAX": 0.02,
+    "LIST:LEAR": 0.5,
+    "BB:ARB:WAV:SEL": 1.0,
+    "BB:ARB:WSEG:CRE:LOAD": 3.0,
+    "CONF:REFS:CGW:READ": 1.0,
+    "MEAS:VOLT?": 0.05,
+    "MEAS:CURR?": 0.05,
+    "*SAV": 0.2,
+    "*RCL": 0.5,
+    "MMEM:STOR:STAT": 0.3,
+    "MMEM:LOAD:STAT": 1.0,
+    "ROUT:CLOS": 0.02,
+}
+
+NOISE_FLOOR_DBM = {"sensor": -70.0, "analyzer": -100.0}
+
+# Bound at import, so that simulated latencies are not counted by a profiler replacing
+# `time.sleep` to measure the sleeps of the scripts (see `benchmark.py`)
+_sleep = time.sleep
+
+
+class VisaTimeout(TimeoutError):
+    """Raised by a simulated query that timed out, like `pyvisa.errors.VisaIOError`."""
+
+
+class Bench:
+    """Physical state shared by the simulated instruments of one rig.
+
+    Args:
+        settings (dict): The `[Simulation]` section of the rig file.
+        dut (PAModel, optional): DUT model. Defaults to a `PAModel` configured by the
+            `[Simulation.dut]` table, with the noise seed of the bench.
+    """
+
+    def __init__(self, settings: dict | None = None, dut=None):
+        settings = settings or {}
+        self.lock = threading.RLock()
+        self.rng = random.Random(settings.get("seed"))
+        self.time_scale = settings.get("time_scale", 1.0)
+        self.noise_db = settings.get("noise_db", 0.02)
+        self.settling_s = settings.get("settling_s", 0.05)
+        self.latency_s = LATENCY_S | settings.get("latency_s", {})
+        self.faults = settings.get("faults", {})
+        self.waited = 0.0
+        paths = settings.get("paths", {})
+        self.paths = {
+            "input": paths.get("input_db", -1.5),
+            "sa": paths.get("sa_db", -31.0),
+            "sensor": paths.get("sensor_db", -21.0),
+        }
+        self.slope_db_per_ghz = paths.get("slope_db_per_ghz", -0.2)
+        self.dut = (
+            dut
+            if dut is not None
+            else PAModel(seed=settings.get("seed"), **settings.get("dut", {}))
+        )
+        self.heated = time.perf_counter()
+        self.connection = settings.get("connection", "dut")
+
+        self.generator = {
+            "frequency": 1e9,
+            "level": -30.0,
+            "offset": 0.0,
+            "output": False,
+            "arb": False,
+            "list_mode": False,
+            "list_index": 0,
+            "list_frequencies": [],
+            "list_powers": [],
+        }
+        self.supplies = {}
+        self.dpd = False
+        self.changed = time.perf_counter()
+        self.start_dbm = NOISE_FLOOR_DBM["analyzer"]
+
+    def wait(self, seconds: float) -> None:
+        if seconds > 0 and self.time_scale > 0:
+            _sleep(seconds * self.time_scale)
+            self.waited += seconds * self.time_scale
+
+    def path_gain(self, path: str, frequency: float) -> float:
+        return self.paths[path] + self.slope_db_per_ghz * frequency / 1e9
+
+    def connect(self, connection: str) -> None:
+        """Reconnects the bench: `"dut"`, `"input"` (sensor at the end of the input
+        cable) or `"output"` (input cable through to the output paths)."""
+        with self.lock:
+            self.connection = connection
+            self.settle_from()
+
+    def set_generator(self, **state) -> None:
+        with self.lock:
+            before = self.plane_dbm()
+            self.generator.update(state)
+            self.settle_from(before)
+
+    def settle_from(self, before: float | None = None) -> None:
+        self.start_dbm = self.plane_dbm() if before is None else before
+        self.changed = time.perf_counter()
+
+    def source(self, index: int | None = None) -> tuple[float, float]:
+        """Returns the frequency and level at the generator output."""
+        g = self.generator
+        if not g["output"]:
+            return g["frequency"], -math.inf
+        if g["list_mode"] and g["list_frequencies"]:
+            i = g["list_index"] if index is None else index
+            return g["list_frequencies"][i], g["list_powers"][i]
+        return g["frequency"], g["level"] - g["offset"]
+
+    def pin_dbm(self, index: int | None = None) -> tuple[float, float]:
+        """Returns the frequency and level at the DUT input plane."""
+        frequency, level = self.source(index)
+        return frequency, level + self.path_gain("input", frequency)
+
+    def powered(self) -> bool:
+        supply = self.supplies.get((1, 1))
+        return bool(supply and supply["on"])
+
+    def plane_dbm(self, index: int | None = None, settled: bool = True) -> float:
+        """Returns the level at the DUT output plane, or at the end of the input cable
+        with the `"input"` connection."""
+        frequency, pin = self.pin_dbm(index)
+        if pin == -math.inf:
+            final = NOISE_FLOOR_DBM["analyzer"]
+        elif self.connection == "dut":
+            final = (
+                self.dut.pout_dbm(pin, frequency) if self.powered() else pin - 40
+            )
+        else:
+            final = pin
+        if settled or self.settling_s <= 0:
+            return final
+        elapsed = time.perf_counter() - self.changed
+        start = max(self.start_dbm, NOISE_FLOOR_DBM["analyzer"])
+        return final + (start - final) * math.exp(-elapsed / self.settling_s)
+
+    def heat(self) -> None:
+        """Advances the DUT temperature to now, at the current drive."""
+        now = time.perf_counter()
+        frequency, pin = self.pin_dbm()
+        powered = self.connection == "dut" and self.powered()
+        self.dut.heat(
+            pin if pin != -math.inf else -100.0,
+            frequency,
+            voltage=self.supplies[(1, 1)]["voltage"] if powered else 0,
+            seconds=now - self.heated,
+        )
+        self.heated = now
+
+    def read(self, port: str, frequency: float, index: int | None = None) -> float:
+        """Returns a noisy reading in dBm of the `"sensor"` or `"sa"` at `frequency`."""
+        with self.lock:
+            self.heat()
+            source_frequency, pin = self.pin_dbm(index)
+            floor = NOISE_FLOOR_DBM["sensor" if port == "sensor" else "analyzer"]
+            level = self.plane_dbm(index, settled=index is not None)
+            tolerance = max(abs(source_frequency) * 1e-6, 1e3)
+            harmonic = round(frequency / source_frequency) if source_frequency else 0
+            if port == "sensor" or abs(frequency - source_frequency) < tolerance:
+                pass
+            elif harmonic > 1 and abs(frequency - harmonic * source_frequency) < tolerance:
+                if self.connection == "dut" and self.powered() and pin != -math.inf:
+                    level += self.dut.harmonic_dbc(harmonic, pin, source_frequency)
+                else:
+                    level -= 80
+            else:
+                level = floor
+            match (port, self.connection):
+                case ("sensor", "input"):
+                    pass
+                case ("sa", "input"):
+                    level = floor
+                case _:
+                    level += self.path_gain(port, source_frequency)
+            level += self.rng.gauss(0, self.noise_db)
+            return 10 * math.log10(10 ** (level / 10) + 10 ** (floor / 10))
+
+    def aclr(self, channels: int, carriers: int) -> list[float]:
+        """Returns the channel powers (dBm) and ACLRs (dBc) of a modulated signal at the
+        analyzer input, laid out like `CALC:MARK:FUNC:POW:RES? MCAC`."""
+        with self.lock:
+            frequency, pin = self.pin_dbm()
+            total = self.read("sa", frequency)
+            tx = [total - 10 * math.log10(carriers)] * carriers
+            if carriers > 1:
+                tx.append(total)
+            if self.generator["arb"] and self.powered() and pin != -math.inf:
+                aclr = self.dut.aclr_dbc(pin, frequency, dpd=self.dpd, channels=channels)
+            else:
+                aclr = [[-70.0 - 10 * k] * 2 for k in range(channels)]
+            return tx + [
+                float(value) + self.rng.gauss(0, self.noise_db)
+                for channel in aclr
+                for value in channel
+            ]
+
+    def evm_pct(self) -> float:
+        frequency, pin = self.pin_dbm()
+        if pin == -math.inf or not self.powered():
+            return 100.0
+        return self.dut.evm_pct(pin, frequency, dpd=self.dpd)
+
+    def supply_current(self, supply: int, channel: int) -> float:
+        with self.lock:
+            self.heat()
+            state = self.supplies.get((supply, channel))
+            if state is None or not state["on"]:
+                return 0.0
+            if supply == 2:
+                current = 0.002
+            else:
+                frequency, pin = self.pin_dbm()
+                if pin == -math.inf:
+                    pin = -100.0
+                main = [
+                    ch
+                    for ch in (1, 2, 3)
+                    if self.supplies.get((1, ch), {}).get("on")
+                ]
+                current = float(
+                    self.dut.supply_current(pin, frequency, state["voltage"])
+                ) / len(main)
+            current *= 1 + self.rng.gauss(0, self.noise_db / 10)
+            return min(current, state["current"])
+
+
+class SimResource:
+    """One simulated VISA session. Subclasses handle the commands of one instrument."""
+
+    IDN = "Simulated,Instrument,0,1.0"
+
+    def __init__(self, manager: "SimResourceManager", resource_name: str):
+        self.manager = manager
+        self.home = manager.bench
+        self.resource_name = resource_name
+        self.timeout = 2000
+        self.errors = collections.deque(maxlen=100)
+        self.settings = {}
+        self.response = ""
+
+    @property
+    def bench(self) -> Bench:
+        """The bench the instrument is connected to."""
+        return self.home
+
+    def write(self, message: str) -> int:
+        self.manager.record_call("write")
+        self.execute(message, query=False)
+        return len(message)
+
+    def query(self, message: str) -> str:
+        self.manager.record_call("query")
+        self.execute(message, query=True)
+        return self.read()
+
+    def read(self) -> str:
+        response, self.response = self.response, ""
+        return response + "\n"
+
+    def close(self) -> None:
+        pass
+
+    def execute(self, message: str, query: bool) -> None:
+        responses = []
+        for command in message.split(";"):
+            header, _, args = command.strip().partition(" ")
+            header = header.lstrip(":").upper()
+            if not header:
+                continue
+            self.manager.record(self.resource_name, header)
+            is_query = header.endswith("?")
+            latency = self.bench.latency_s.get(
+                header, self.bench.latency_s["query" if is_query else "write"]
+            )
+            self.bench.wait(latency)
+            match self.manager.fault(header):
+                case "timeout" if is_query:
+                    self.bench.wait(self.timeout / 1000)
+                    raise VisaTimeout(f"{self.resource_name}: {header} timed out")
+                case "error":
+                    self.errors.append('-200,"Execution error"')
+                    continue
+            response = self.handle(header, args.strip())
+            if response is not None:
+                responses.append(str(response))
+        if query:
+            self.response = ";".join(responses)
+
+    def handle(self, header: str, args: str):
+        match header:
+            case "*IDN?":
+                return self.IDN
+            case "*OPC?":
+                return 1
+            case "*WAI" | "*CLS":
+                if header == "*CLS":
+                    self.errors.clear()
+            case "*RST":
+                self.reset()
+            case "SYST:ERR?":
+                return self.errors.popleft() if self.errors else '0,"No error"'
+            case _ if header.endswith("?") and header[:-1] in self.settings:
+                return self.settings[header[:-1]]
+            case _ if not header.endswith("?"):
+                self.settings[header] = args
+            case _:
+                self.errors.append(f'-113,"Undefined header;{header}"')
+
+    def reset(self) -> None:
+        self.settings.clear()
+
+
+class SimFSW43(SimResource):
+    IDN = "Rohde&Schwarz,FSW-43,1312.8000K43/000000,5.00"
+    # Setup saved and recalled by `*SAV`/`*RCL` and in save set files
+    STATE = (
+        "channels",
+        "channel",
+        "center",
+        "offset",
+        "continuous",
+        "list_frequencies",
+        "settings",
+    )
+
+    def __init__(self, manager: "SimResourceManager", resource_name: str):
+        super().__init__(manager, resource_name)
+        # Kept by `*RST`, like the state registers and files of the instrument
+        self.registers = {}
+        self.files = {}
+        self.corrections = set()
+
+    @property
+    def bench(self) -> Bench:
+        """The bench the RF switch routes to the analyzer input, see `SimLab`."""
+        return self.manager.lab.routed(self.home)
+
+    def reset(self) -> None:
+        super().reset()
+        self.channels = {"Spectrum": "SANALYZER"}
+        self.channel = "Spectrum"
+        self.center = 1e9
+        self.offset = 0.0
+        self.continuous = True
+        self.marker = None
+        self.list_frequencies = []
+        self.ddpd_start = None
+        self.settings |= {"POW:ACH:TXCH:COUN": "1", "POW:ACH:ACP": "1"}
+
+    def handle(self, header: str, args: str):
+        bench = self.bench
+        match header:
+            case "INST" | "INST:CRE":
+                self.channel = args.split(",")[-1].strip("'\"")
+                if header == "INST:CRE":
+                    self.channels[self.channel] = args.split(",")[0]
+            case "INST:LIST?":
+                return ",".join(
+                    f"'{kind}','{name}'" for name, kind in self.channels.items()
+                )
+            case "FREQ:CENT":
+                self.center = float(args)
+            case "DISP:TRAC:Y:RLEV:OFFS":
+                self.offset = float(args)
+            case "INIT:CONT":
+                self.continuous = args.upper() in ("ON", "1")
+            case "INIT:CONT?":
+                return int(self.continuous)
+            case "*SAV":
+                self.registers[int(args)] = self.snapshot()
+            case "*RCL":
+                if int(args) not in self.registers:
+                    self.errors.append(f'-222,"Data out of range;{args}"')
+                    return None
+                self.restore(self.registers[int(args)])
+            case "MMEM:STOR:STAT":
+                self.files[args.split(",")[-1].strip("'\"")] = self.snapshot()
+            case "MMEM:LOAD:STAT":
+                path = args.split(",")[-1].strip("'\"")
+                if path not in self.files:
+                    self.errors.append(f'-256,"File name not found;{path}"')
+                    return None
+                self.restore(self.files[path])
+            case "CALC:MARK:MAX":
+                self.marker = bench.read("sa", self.center) + self.offset
+            case "CALC:MARK:Y?":
+                return self.marker
+            case "CALC:MARK:FUNC:POW:RES?":
+                results = bench.aclr(
+                    channels=int(self.settings["POW:ACH:ACP"]),
+                    carriers=int(self.settings["POW:ACH:TXCH:COUN"]),
+                )
+                carriers = int(self.settings["POW:ACH:TXCH:COUN"])
+                tx = carriers + 1 if carriers > 1 else 1
+                results[:tx] = [p + self.offset for p in results[:tx]]
+                return ",".join(f"{p:.3f}" for p in results)
+            case "CONF:GEN:CONN:STAT?":
+                return int(self.settings.get("CONF:GEN:CONT", "OFF") in ("ON", "1"))
+            case "CONF:DDPD:STAR":
+                self.ddpd_start = time.perf_counter()
+            case "ABOR":
+                self.ddpd_iteration()
+                self.ddpd_start = None
+            case "MMEM:STOR:DDPD":
+                self.corrections.add(args.strip("'\""))
+            case "MMEM:LOAD:DDPD":
+                if args.strip("'\"") not in self.corrections:
+                    self.errors.append(f'-256,"File name not found;{args}"')
+            case "CONF:DDPD:COUN:CURR?":
+                return self.ddpd_iteration()
+            case "FETC:DDPD:OPER:STAT?":
+                return int(self.ddpd_start is not None)
+            case "CONF:DDPD:APPL":
+                bench.dpd = args.upper() in ("ON", "1")
+                if not bench.dpd:
+                    self.ddpd_start = None
+            case "FETC:POW:OUTP:MAX?" | "FETC:POW:OUTP:MIN?" | "FETC:POW:OUTP:CURR?":
+                return bench.read("sa", self.center) + self.offset
+            case "FETC:MACC:REVM:MAX?" | "FETC:MACC:REVM:MIN?" | "FETC:MACC:REVM:CURR?":
+                return bench.evm_pct() * (1 + bench.rng.gauss(0, 0.02))
+            case "LIST:POW":
+                fields = args.split(",")
+                self.list_frequencies = [float(f) for f in fields[::9]]
+            case "LIST:POW:RES?":
+                return ",".join(
+                    f"{bench.read('sa', freq, index=i) + self.offset:.3f}"
+                    for i, freq in enumerate(self.list_frequencies)
+                )
+            case _:
+                return super().handle(header, args)
+
+    def snapshot(self) -> dict:
+        return {name: copy.deepcopy(getattr(self, name)) for name in self.STATE}
+
+    def restore(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, copy.deepcopy(value))
+
+    def ddpd_iteration(self) -> int:
+        if self.ddpd_start is None:
+            return 0
+        count = int(self.settings.get("CONF:DDPD:COUN", 1))
+        per_iteration = self.bench.latency_s.get("ddpd_iteration", 0.5)
+        elapsed = (time.perf_counter() - self.ddpd_start) / max(
+            self.bench.time_scale, 1e-9
+        )
+        iteration = min(count, int(elapsed / per_iteration))
+        # Most of the correction comes with the first iteration
+        if iteration >= 1:
+            self.bench.dpd = True
+        return iteration
+
+
+class SimSMW200A(SimResource):
+    IDN = "Rohde&Schwarz,SMW200A,1412.0000K02/000000,5.00"
+
+    def reset(self) -> None:
+        super().reset()
+        self.bench.set_generator(
+            frequency=1e9,
+            level=-30.0,
+            offset=0.0,
+            output=False,
+            arb=False,
+            list_mode=False,
+            list_index=0,
+        )
+        self.bench.dpd = False
+        self.settings["BB:ARB:WAV:SEL"] = "''"
+
+    def handle(self, header: str, args: str):
+        set_generator = self.bench.set_generator
+        on = args.upper() in ("ON", "1")
+        match header:
+            case "OUTP":
+                set_generator(output=on)
+            case "FREQ:CW":
+                set_generator(frequency=float(args))
+            case "POW:OFFS":
+                set_generator(offset=float(args))
+            case "POW":
+                set_generator(level=float(args))
+            case "POW:POW":
+                set_generator(level=float(args) + self.bench.generator["offset"])
+            case "BB:ARB:STAT":
+                set_generator(arb=on)
+            case "FREQ:MODE":
+                set_generator(list_mode=args.upper() == "LIST")
+            case "LIST:FREQ":
+                set_generator(list_frequencies=[float(f) for f in args.split(",")])
+            case "LIST:POW":
+                set_generator(list_powers=[float(p) for p in args.split(",")])
+            case "LIST:IND":
+                set_generator(list_index=int(args))
+            case "BB:ARB:WSEG:CRE:LOAD":
+                self.settings["BB:ARB:WAV:SEL"] = args
+            case _:
+                return super().handle(header, args)
+
+
+class SimNRPZ86(SimResource):
+    IDN = "ROHDE&SCHWARZ,NRP-Z86,000000,1.0"
+
+    def reset(self) -> None:
+        super().reset()
+        self.frequency = 1e9
+        self.power_w = 0.0
+
+    def handle(self, header: str, args: str):
+        match header:
+            case "SENS:FREQ":
+                self.frequency = float(args)
+            case "INIT:IMM":
+                self.power_w = 1e-3 * 10 ** (self.bench.read("sensor", self.frequency) / 10)
+            case "FETCH?":
+                return f"{self.power_w:e},0"
+            case _:
+                return super().handle(header, args)
+
+
+class SimE36313A(SimResource):
+    IDN = "Keysight Technologies,E36313A,MY00000000,1.0"
+
+    def __init__(self, manager: "SimResourceManager", resource_name: str, supply: int):
+        self.supply = supply
+        super().__init__(manager, resource_name)
+
+    def reset(self) -> None:
+        super().reset()
+        for channel in (1, 2, 3):
+            self.bench.supplies[(self.supply, channel)] = {
+                "voltage": 0.0,
+                "current": 0.0,
+                "on": False,
+            }
+
+    def handle(self, header: str, args: str):
+        supplies = self.bench.supplies
+        match header:
+            case "APPL":
+                channel, voltage, current = [a.strip() for a in args.split(",")]
+                state = supplies[(self.supply, int(channel.removeprefix("CH")))]
+                state |= {"voltage": float(voltage), "current": float(current)}
+            case "OUTP":
+                state, _, channels = args.partition(",")
+                with self.bench.lock:
+                    before = self.bench.plane_dbm()
+                    for channel in re.findall(r"\d+", channels):
+                        supplies[(self.supply, int(channel))]["on"] = state == "ON"
+                    self.bench.settle_from(before)
+            case "MEAS:VOLT?":
+                state = supplies[(self.supply, int(args.removeprefix("CH")))]
+                return state["voltage"] if state["on"] else 0.0
+            case "MEAS:CURR?":
+                return self.bench.supply_current(self.supply, int(args.removeprefix("CH")))
+            case _:
+                return super().handle(header, args)
+
+
+class SimRFSwitch(SimResource):
+    """Connects the analyzer input to one of the rigs of its `SimLab`."""
+
+    IDN = "Simulated,RF Switch,000000,1.0"
+
+    def reset(self) -> None:
+        super().reset()
+        self.manager.lab.port = 1
+
+    def handle(self, header: str, args: str):
+        lab = self.manager.lab
+        match header:
+            case "ROUT:CLOS":
+                lab.port = int(args.strip("()@"))
+            case "ROUT:CLOS:STAT?":
+                return f"(@{lab.port})"
+            case _:
+                return super().handle(header, args)
+
+
+class SimLab:
+    """Instruments shared by several simulated rigs, e.g. the rigs of one process.
+
+    The analyzer and RF switch of rigs whose files list them at the same address are
+    one simulated instrument. The analyzer input follows the switch: it measures the
+    bench of the rig whose `[Switch] RFSwitch.port` is closed, or the bench of the
+    rig that opened it first if no rig's port is. A closed rig leaves the lab: the
+    instruments it opened move to a rig still open, or are dropped with the last rig.
+    """
+
+    SHARED = (SimFSW43, SimRFSwitch)
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.sessions = {}
+        self.benches = {}
+        self.port = None
+        self.managers = []
+
+    def join(self, manager: "SimResourceManager") -> None:
+        """Adds the rig of `manager` to the lab."""
+        with self.lock:
+            self.managers.append(manager)
+
+    def attach(self, port: int, bench: Bench) -> None:
+        """Connects `bench` to `port` of the RF switch."""
+        with self.lock:
+            self.benches[port] = bench
+
+    def release(self, manager: "SimResourceManager") -> None:
+        """Removes the rig of `manager` from the lab, see the class docstring."""
+        with self.lock:
+            if manager not in self.managers:
+                return
+            self.managers.remove(manager)
+            self.benches = {
+                port: bench
+                for port, bench in self.benches.items()
+                if bench is not manager.bench
+            }
+            if not self.managers:
+                self.sessions.clear()
+                self.port = None
+                return
+            heir = self.managers[0]
+            for session in self.sessions.values():
+                if session.manager is manager:
+                    session.manager = heir
+                    session.home = heir.bench
+
+    def routed(self, default: Bench) -> Bench:
+        """Returns the bench connected to the closed switch port, else `default`."""
+        return self.benches.get(self.port, default)
+
+    def open(self, resource_name: str, create) -> SimResource:
+        """Returns the shared session of `resource_name`, created by `create` on
+        first use."""
+        with self.lock:
+            if resource_name not in self.sessions:
+                session = create()
+                session.reset()
+                self.sessions[resource_name] = session
+            return self.sessions[resource_name]
+
+
+class SimResourceManager:
+    """Drop-in for `pyvisa.ResourceManager` serving the instruments of a rig file.
+
+    Args:
+        rig_settings (dict): Parsed rig file. The instrument addresses select the
+            simulated instrument, the `[Simulation]` section configures the bench.
+        dut (PAModel, optional): DUT model, see `Bench`.
+        lab (SimLab, optional): Shares the analyzer and RF switch with the other rigs
+            of `lab`. Defaults to a lab of this rig alone.
+    """
+
+    def __init__(self, rig_settings: dict, dut=None, lab: SimLab | None = None):
+        self.bench = Bench(rig_settings.get("Simulation"), dut=dut)
+        self.lab = lab if lab is not None else SimLab()
+        self.lab.join(self)
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        self.calls = collections.Counter()
+        self.injected = []
+        sensor = rig_settings["PowerSensor"]["NRP_Z86"]
+        self.resources = {
+            tcpip(rig_settings["SA"]["FSW43"]["ip"]): SimFSW43,
+            tcpip(rig_settings["SG"]["SMW200A"]["ip"]): SimSMW200A,
+            f"RSNRP::{sensor['device_id']}::{sensor['serial_nu']}::INSTR": SimNRPZ86,
+            tcpip(rig_settings["PowerSupply"]["E36313A_1"]["ip"]): (
+                lambda manager, name: SimE36313A(manager, name, supply=1)
+            ),
+            tcpip(rig_settings["PowerSupply"]["E36313A_2"]["ip"]): (
+                lambda manager, name: SimE36313A(manager, name, supply=2)
+            ),
+        }
+        if "Switch" in rig_settings:
+            switch = rig_settings["Switch"]["RFSwitch"]
+            self.resources[tcpip(switch["ip"])] = SimRFSwitch
+            self.lab.attach(switch["port"], self.bench)
+        self.sessions = {}
+
+    def open_resource(self, resource_name: str, **kwargs) -> SimResource:
+        with self.lock:
+            if resource_name not in self.resources:
+                raise ValueError(f"No simulated instrument at {resource_name}")
+            if resource_name not in self.sessions:
+                create = self.resources[resource_name]
+                if create in SimLab.SHARED:
+                    session = self.lab.open(
+                        resource_name, lambda: create(self, resource_name)
+                    )
+                else:
+                    session = create(self, resource_name)
+                    session.reset()
+                self.sessions[resource_name] = session
+            return self.sessions[resource_name]
+
+    def list_resources(self, query: str = "?*::INSTR") -> tuple[str, ...]:
+        return tuple(self.resources)
+
+    def close(self) -> None:
+        self.sessions.clear()
+        self.lab.release(self)
+
+    def connect(self, connection: str) -> None:
+        """Reconnects the bench, see `Bench.connect`."""
+        self.bench.connect(connection)
+
+    def inject(self, header: str, fault: str, count: int = 1) -> None:
+        """Makes the next `count` commands matching `header` fail.
+
+        Args:
+            header (str): SCPI header pattern, e.g. `"FETCH?"` or `"MEAS:*"`.
+            fault (str): `"timeout"` (queries raise `VisaTimeout`) or `"error"` (the
+                command is ignored and an error is queued for `SYST:ERR?`).
+        """
+        with self.lock:
+            self.injected.append([header.upper(), fault, count])
+
+    def fault(self, header: str) -> str | None:
+        with self.lock:
+            for entry in self.injected:
+                pattern, fault, count = entry
+                if fnmatch.fnmatchcase(header, pattern):
+                    if count <= 1:
+                        self.injected.remove(entry)
+                    else:
+                        entry[2] -= 1
+                    return fault
+        faults = self.bench.faults
+        if self.bench.rng.random() < faults.get("timeout_rate", 0):
+            return "timeout"
+        if self.bench.rng.random() < faults.get("error_rate", 0):
+            return "error"
+        return None
+
+    def record(self, resource_name: str, header: str) -> None:
+        with self.lock:
+            self.counts[(resource_name, header)] += 1
+
+    def record_call(self, kind: str) -> None:
+        with self.lock:
+            self.calls[kind] += 1
+
+
+# Lab of the rigs opened by `library.rig.resource_manager`, so that the simulated rigs
+# of one process (e.g. of `orchestrate.py`) share their analyzer like real stations
+LAB = SimLab()
+
+
+def tcpip(ip_address: str) -> str:
+    return f"TCPIP::{ip_address}::inst0::INSTR"
@@ -0,0 +1,53 @@
+"""Startup timing.
+
+Splits the time from script start to the first measurement into phases:
+
+    startup = Startup()
+    ...
+    startup.mark("config")
+    rig = Rig.open(...)
+    startup.mark("instruments")
+    print(startup.report())
+
+Import this module first, so the `imports` phase covers the remaining imports. The
+time to first measurement is appended to the results store (table `startup`) with the
+run, so it can be tracked across runs like any other metric.
+"""
+import time
+
+# Reference point of all phases, taken when the script imports this module
+started = time.perf_counter()
+
+
+class Startup:
+    def __init__(self, start: float = started):
+        self.start = start
+        self.last = start
+        self.phases = {}
+        self.first_measurement_s = None
+
+    def mark(self, phase: str) -> float:
+        """Ends `phase` now and returns its duration in seconds."""
+        now = time.perf_counter()
+        self.phases[phase] = now - self.last
+        self.last = now
+        return self.phases[phase]
+
+    def first_measurement(self) -> None:
+        """Records the time to first measurement. Later calls are ignored."""
+        if self.first_measurement_s is None:
+            self.first_measurement_s = time.perf_counter() - self.start
+
+    def report(self) -> str:
+        lines = [f"  {phase}: {seconds:.2f} s" for phase, seconds in self.phases.items()]
+        lines.append(f"  total: {self.last - self.start:.2f} s")
+        if self.first_measurement_s is not None:
+            lines.append(f"  first measurement after {self.first_measurement_s:.2f} s")
+        return "\n".join(["Startup:"] + lines)
+
+    def as_dict(self) -> dict[str, float]:
+        """Returns `{phase: seconds}`, including `total` and `first_measurement`."""
+        times = self.phases | {"total": self.last - self.start}
+        if self.first_measurement_s is not None:
+            times["first_measurement"] = self.first_measurement_s
+        return times
@@ -0,0 +1,72 @@
+"""Cached Touchstone S-parameters for de-embedding.
+
+Parsing a Touchstone file needs scikit-rf, which is slow to import. The parsed
+S-parameters are therefore cached next to the file as a compact `.npz`, keyed by the
+SHA-256 of the file content. scikit-rf is only imported when the file is new or has
+changed:
+
+    adapter = Touchstone("config/adapter.s2p")
+    adapter.s21_db([3.3e9, 3.45e9])
+"""
+import hashlib
+import pathlib
+import re
+
+import numpy as np
+
+
+class Touchstone:
+    def __init__(
+        self, path: str | pathlib.Path, cache_dir: str | pathlib.Path | None = None
+    ):
+        """
+        Args:
+            path (str | pathlib.Path): Touchstone file, e.g. an `.s2p`.
+            cache_dir (str | pathlib.Path, optional): Where to keep the `.npz` cache.
+                Defaults to the directory of `path`.
+        """
+        self.path = pathlib.Path(path)
+        self.cache_dir = pathlib.Path(cache_dir) if cache_dir else self.path.parent
+        digest = hashlib.sha256(self.path.read_bytes()).hexdigest()[:16]
+        self.cache_path = self.cache_dir / f"{self.path.stem}.{digest}.npz"
+
+        if self.cache_path.exists():
+            with np.load(self.cache_path) as cache:
+                self.frequency = cache["frequency"]
+                self.s = cache["s"]
+        else:
+            self.frequency, self.s = self._parse()
+            # Only this file's caches, not those of e.g. `adapter.v2.s2p`
+            pattern = re.compile(rf"{re.escape(self.path.stem)}\.[0-9a-f]{{16}}\.npz")
+            for stale in self.cache_dir.glob(f"{self.path.stem}.*.npz"):
+                if pattern.fullmatch(stale.name):
+                    stale.unlink()
+            np.savez_compressed(self.cache_path, frequency=self.frequency, s=self.s)
+
+    def s_db(self, frequency, m: int, n: int) -> float | np.ndarray:
+        """Returns |S_mn| in dB, linearly interpolated at `frequency` (Hz).
+
+        Raises:
+            ValueError: If `frequency` lies outside the frequencies of the file.
+        """
+        s_db = 20 * np.log10(np.abs(self.s[:, m - 1, n - 1]))
+        f = np.asarray(frequency)
+        outside = f[(f < self.frequency[0]) | (f > self.frequency[-1])]
+        if outside.size:
+            raise ValueError(
+                f"{self.path.name} covers {self.frequency[0]:g} to "
+                f"{self.frequency[-1]:g} Hz, not {outside.size} frequencies from "
+                f"{outside.min():g} to {outside.max():g} Hz"
+            )
+        return np.interp(frequency, self.frequency, s_db)
+
+    def s21_db(self, frequency) -> float | np.ndarray:
+        """Returns the insertion loss S21 in dB at `frequency` (Hz)."""
+        return self.s_db(frequency, 2, 1)
+
+    def _parse(self) -> tuple[np.ndarray, np.ndarray]:
+        import skrf as rf
+
+        network = rf.Network(str(self.path))
+        order = np.argsort(network.f)
+        return network.f[order], network.s[order].astype(np.complex64)
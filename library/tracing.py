@@ -0,0 +1,282 @@
+"""Timing spans in the Chrome trace event format.
+
+A trace records nested spans of the thread that started it and writes them as a
+Chrome trace JSON file, which opens in https://ui.perfetto.dev or `chrome://tracing`:
+
+    with tracing.trace("log/run/trace.json", name="Product-A 12345678"):
+        with tracing.span("frequency", frequency_hz=3.45e9):
+            run_power_sweep(...)
+
+    @tracing.traced
+    def run_power_sweep(...): ...
+
+Spans are grouped by category: `phase` for functions and loop iterations, `visa` for
+instrument calls (sessions of a `TracingResourceManager`) and `sleep` for
+`time.sleep`, so dead time stands out. Outside a trace, `span` and `traced` cost one
+thread-local lookup and record nothing.
+"""
+import contextlib
+import functools
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Callable
+
+_local = threading.local()
+# Functions of the `time` module replaced by `patch_time`, and the active patches,
+# oldest first
+_originals = {"perf_counter": time.perf_counter, "sleep": time.sleep}
+_patches = []
+_patches_lock = threading.RLock()
+# Patch installing `traced_sleep` while any recording runs, and their number
+_hook = None
+_hook_users = 0
+
+
+class Trace:
+    """Events of one trace, see `trace`."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.start = time.perf_counter()
+        self.events = []
+
+    def add(self, name: str, category: str, start: float, args: dict) -> None:
+        """Adds a span that started at `start` (`time.perf_counter`) and ended now."""
+        end = time.perf_counter()
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self.start) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": self.pid,
+                "tid": self.tid,
+                "args": args,
+            }
+        )
+
+    def durations(self, category: str | None = None) -> dict[str, float]:
+        """Returns the total seconds per span name, optionally of one category.
+
+        Spans within a span of the same name, e.g. of a recursive function, are
+        counted once.
+        """
+        totals = {}
+        ends = {}
+        for event in sorted(self.events, key=lambda event: event["ts"]):
+            if category is not None and event["cat"] != category:
+                continue
+            name = event["name"]
+            if event["ts"] < ends.get(name, -1):
+                continue
+            ends[name] = event["ts"] + event["dur"]
+            totals[name] = totals.get(name, 0) + event["dur"] / 1e6
+        return totals
+
+    def write(self, path: str | pathlib.Path) -> None:
+        metadata = {"pid": self.pid, "tid": self.tid, "ph": "M"}
+        events = [
+            metadata | {"name": "process_name", "args": {"name": self.name}},
+            metadata | {"name": "thread_name", "args": {"name": self.name}},
+        ]
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps({"traceEvents": events + self.events, "displayTimeUnit": "ms"})
+        )
+
+
+def current() -> Trace | None:
+    """Returns the trace of the calling thread, if one is running."""
+    return getattr(_local, "trace", None)
+
+
+@contextlib.contextmanager
+def trace(path: str | pathlib.Path | None, name: str = "run"):
+    """Traces the calling thread and writes the trace to `path` when done.
+
+    Hooks `time.sleep` (see `traced_sleep`) while it runs. Without a `path` nothing
+    is traced, so callers can pass an optional path straight through.
+    See `recording` to trace without a file.
+
+    Yields:
+        Trace | None: The running trace.
+    """
+    if path is None:
+        yield None
+        return
+    running = None
+    try:
+        with recording(name) as running:
+            yield running
+    finally:
+        if running is not None:
+            running.write(path)
+
+
+@contextlib.contextmanager
+def recording(name: str = "run"):
+    """Traces the calling thread without writing a file, e.g. to sum up durations.
+
+    `time.sleep` is hooked (see `traced_sleep`) until the last recording of any thread
+    ends.
+
+    Yields:
+        Trace: The running trace.
+    """
+    global _hook, _hook_users
+    with _patches_lock:
+        if _hook_users == 0:
+            _hook = _add_patch({"sleep": traced_sleep})
+        _hook_users += 1
+    previous = current()
+    _local.trace = running = Trace(name)
+    try:
+        with span(name):
+            yield running
+    finally:
+        _local.trace = previous
+        with _patches_lock:
+            _hook_users -= 1
+            if _hook_users == 0:
+                _remove_patch(_hook)
+                _hook = None
+
+
+@contextlib.contextmanager
+def patch_time(**functions: Callable):
+    """Replaces functions of the `time` module, e.g. `sleep=...`, within the block.
+
+    Patches may end in any order, e.g. the recordings of several threads and a
+    `library.estimate.virtual_clock`: once one ends, each function is the one of the
+    latest patch still active, or the original one.
+
+    Yields:
+        Callable: Returns the function a replacement stands in for, e.g.
+            `beneath("sleep")`, so that it can call through.
+    """
+    patch = _add_patch(functions)
+    try:
+        yield functools.partial(_beneath, patch)
+    finally:
+        _remove_patch(patch)
+
+
+def _add_patch(functions: dict) -> dict:
+    patch = dict(functions)
+    with _patches_lock:
+        _patches.append(patch)
+        _apply_patches()
+    return patch
+
+
+def _remove_patch(patch: dict) -> None:
+    with _patches_lock:
+        _patches[:] = [p for p in _patches if p is not patch]
+        _apply_patches()
+
+
+def _apply_patches() -> None:
+    for name, original in _originals.items():
+        patched = [patch[name] for patch in _patches if name in patch]
+        setattr(time, name, patched[-1] if patched else original)
+
+
+def _beneath(patch: dict, name: str) -> Callable:
+    """Returns the function `name` of the latest patch older than `patch`, or the
+    original one."""
+    with _patches_lock:
+        index = next((i for i, p in enumerate(_patches) if p is patch), 0)
+        older = [p[name] for p in _patches[:index] if name in p]
+    return older[-1] if older else _originals[name]
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = "phase", **args):
+    """Records the enclosed block as a span of the running trace, if any."""
+    running = current()
+    if running is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        running.add(name, category, start, args)
+
+
+def traced(function: Callable) -> Callable:
+    """Decorator recording each call of `function` as a span named after it."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if current() is None:
+            return function(*args, **kwargs)
+        with span(function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def traced_sleep(seconds: float) -> None:
+    """`time.sleep` recording a `sleep` span in the running trace."""
+    sleep = _beneath(_hook, "sleep")
+    running = current()
+    if running is None:
+        return sleep(seconds)
+    start = time.perf_counter()
+    sleep(seconds)
+    running.add("sleep", "sleep", start, {"seconds": seconds})
+
+
+class TracingResource:
+    """VISA session recording its writes and queries as `visa` spans, named after the
+    SCPI header."""
+
+    def __init__(self, resource, name: str):
+        object.__setattr__(self, "resource", resource)
+        object.__setattr__(self, "name", name)
+
+    def __getattr__(self, name: str):
+        return getattr(self.resource, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self.resource, name, value)
+
+    def write(self, command: str):
+        with span(header(command), "visa", command=command, resource=self.name):
+            return self.resource.write(command)
+
+    def query(self, command: str) -> str:
+        with span(header(command), "visa", command=command, resource=self.name):
+            return self.resource.query(command)
+
+
+class TracingResourceManager:
+    """Wraps a VISA resource manager so that instrument calls appear in traces.
+
+    Args:
+        rm: The resource manager to wrap. Its other methods are passed through.
+    """
+
+    def __init__(self, rm):
+        self.rm = rm
+
+    def __getattr__(self, name: str):
+        return getattr(self.rm, name)
+
+    def open_resource(self, resource_name: str, **kwargs) -> TracingResource:
+        return TracingResource(
+            self.rm.open_resource(resource_name, **kwargs), resource_name
+        )
+
+
+def header(command: str) -> str:
+    """Returns the SCPI header of `command`, e.g. `SOUR:FREQ` of `SOUR:FREQ 3.45e9`."""
+    return command.split(maxsplit=1)[0] if command.strip() else command
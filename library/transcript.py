@@ -0,0 +1,317 @@
+"""Record and replay of the SCPI command stream.
+
+`RecordingResourceManager` wraps a VISA resource manager (pyvisa's or the simulated
+one) and appends every write, query and response of the opened sessions to a
+transcript, together with the time it was sent and how long the instrument took.
+`ReplayResourceManager` serves the recorded responses again without instruments:
+
+    rm = RecordingResourceManager(pyvisa.ResourceManager(), "log/transcripts/A.jsonl")
+    rig = Rig.open(rm, "A", settings)       # run as usual, the transcript grows
+    ...
+    rm = ReplayResourceManager("log/transcripts/A.jsonl", time_scale=0)
+    rig = Rig.open(rm, "A", settings)       # same run, offline and deterministic
+    ...
+    print(rm.summary())
+
+With `time_scale=0` replay does not wait, so the run time is the Python-side overhead
+of the scripts and drivers. With `strict=False`, a driver may skip recorded writes,
+e.g. after an optimization; queries must still match in order so the results stay
+identical, and `summary` reports the commands saved.
+
+The transcript is a JSON lines file, written append-only and flushed per line:
+
+    {"transcript": 1, "started": "2026-10-18T09:30:00"}
+    [0.0, 0.0021, 0, "o", "TCPIP::10.0.0.1::inst0::INSTR"]
+    [0.0031, 0.0009, 0, "w", "*CLS"]
+    [0.0042, 0.0154, 0, "q", "*IDN?", "Rohde&Schwarz,FSW-43,..."]
+    [1.2001, 5.0003, 1, "qx", "FETCH?", "VisaIOError: Timeout expired"]
+
+A header opens every recording session. Each record is `[seconds since the header,
+duration, session, operation, command, response]`, where the operation is `o` (open
+the resource named in `command`), `w` (write), `q` (query) or `wx`/`qx` (the call
+raised the exception in `response`). Sessions are numbered per recording session.
+"""
+import collections
+import datetime
+import json
+import pathlib
+import threading
+import time
+
+VERSION = 1
+
+TRANSCRIPT_DIR = pathlib.Path(__file__).parents[1] / "log" / "transcripts"
+
+
+class TranscriptMismatch(AssertionError):
+    """Raised in replay when a driver sends a command the transcript does not hold."""
+
+
+class ReplayedError(Exception):
+    """Raised in replay where the recorded call raised, with the recorded message."""
+
+
+class TranscriptLog:
+    """Thread-safe, append-only writer of a transcript file."""
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = self.path.open("a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.sessions = 0
+        started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.write_line({"transcript": VERSION, "started": started})
+
+    def write_line(self, record) -> None:
+        line = json.dumps(record, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def open_session(self, resource_name: str, duration: float) -> int:
+        with self.lock:
+            session = self.sessions
+            self.sessions += 1
+        self.record(session, "o", resource_name, start=time.perf_counter() - duration)
+        return session
+
+    def record(
+        self,
+        session: int,
+        operation: str,
+        command: str,
+        response: str | None = None,
+        start: float | None = None,
+    ) -> None:
+        """Appends one call that started at `start` (`time.perf_counter`) and ended
+        now."""
+        now = time.perf_counter()
+        start = now if start is None else start
+        record = [round(start - self.start, 6), round(now - start, 6), session]
+        record += [operation, command]
+        if response is not None:
+            record.append(response)
+        self.write_line(record)
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+class RecordingResource:
+    """VISA session that records its writes and queries, see `RecordingResourceManager`.
+
+    Other attributes (e.g. `timeout`) are passed through to the wrapped session.
+    """
+
+    def __init__(self, resource, log: TranscriptLog, session: int):
+        object.__setattr__(self, "resource", resource)
+        object.__setattr__(self, "log", log)
+        object.__setattr__(self, "session", session)
+
+    def __getattr__(self, name: str):
+        return getattr(self.resource, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self.resource, name, value)
+
+    def write(self, command: str):
+        start = time.perf_counter()
+        try:
+            result = self.resource.write(command)
+        except Exception as error:
+            self.log.record(self.session, "wx", command, describe(error), start)
+            raise
+        self.log.record(self.session, "w", command, start=start)
+        return result
+
+    def query(self, command: str) -> str:
+        start = time.perf_counter()
+        try:
+            response = self.resource.query(command)
+        except Exception as error:
+            self.log.record(self.session, "qx", command, describe(error), start)
+            raise
+        self.log.record(self.session, "q", command, response, start)
+        return response
+
+
+class RecordingResourceManager:
+    """Wraps a VISA resource manager and records the command stream of its sessions.
+
+    Args:
+        rm: The resource manager to record, e.g. `pyvisa.ResourceManager()` or a
+            `SimResourceManager`. Its other methods are passed through.
+        path (str | pathlib.Path): Transcript file, appended to if it exists.
+    """
+
+    def __init__(self, rm, path: str | pathlib.Path):
+        self.rm = rm
+        self.log = TranscriptLog(path)
+
+    def __getattr__(self, name: str):
+        return getattr(self.rm, name)
+
+    def open_resource(self, resource_name: str, **kwargs) -> RecordingResource:
+        start = time.perf_counter()
+        resource = self.rm.open_resource(resource_name, **kwargs)
+        session = self.log.open_session(resource_name, time.perf_counter() - start)
+        return RecordingResource(resource, self.log, session)
+
+    def close(self) -> None:
+        self.log.close()
+        if hasattr(self.rm, "close"):
+            self.rm.close()
+
+
+class ReplayResource:
+    """VISA session serving the recorded calls of one resource in order.
+
+    Sessions opened more than once share the recorded calls of their resource.
+    """
+
+    def __init__(self, manager: "ReplayResourceManager", resource_name: str):
+        self.manager = manager
+        self.resource_name = resource_name
+        self.timeout = 2000
+
+    def write(self, command: str) -> None:
+        self.manager.replay(self.resource_name, "w", command)
+
+    def query(self, command: str) -> str:
+        return self.manager.replay(self.resource_name, "q", command)
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayResourceManager:
+    """Drop-in for `pyvisa.ResourceManager` serving a recorded transcript.
+
+    The calls are replayed per resource, so concurrently used instruments replay
+    deterministically whatever the thread interleaving. All recording sessions in the
+    file are replayed one after another.
+
+    Args:
+        path (str | pathlib.Path): Transcript written by `RecordingResourceManager`.
+        time_scale (float, optional): Each call takes its recorded duration times
+            `time_scale`: 1 replays in real time, 0 without waiting. Defaults to 0.
+        strict (bool, optional): Require the recorded commands in the recorded order.
+            If False, recorded writes a driver no longer sends are skipped until the
+            next matching call, and writes without a recording are accepted; recorded
+            queries are never skipped. Defaults to True.
+    """
+
+    def __init__(
+        self, path: str | pathlib.Path, time_scale: float = 0.0, strict: bool = True
+    ):
+        self.path = pathlib.Path(path)
+        self.time_scale = time_scale
+        self.strict = strict
+        self.lock = threading.Lock()
+        self.calls = read_transcript(self.path)
+        self.recorded = {name: len(calls) for name, calls in self.calls.items()}
+        self.sent = collections.Counter()
+        self.skipped = collections.Counter()
+        self.unrecorded = collections.Counter()
+
+    def open_resource(self, resource_name: str, **kwargs) -> ReplayResource:
+        if resource_name not in self.calls:
+            raise ValueError(f"{resource_name} is not in {self.path}")
+        return ReplayResource(self, resource_name)
+
+    def list_resources(self, query: str = "?*::INSTR") -> tuple[str, ...]:
+        return tuple(self.calls)
+
+    def close(self) -> None:
+        pass
+
+    def replay(self, resource_name: str, operation: str, command: str) -> str | None:
+        """Serves the next recorded call of `resource_name`, see the class docstring.
+
+        Raises:
+            TranscriptMismatch: If the call is not the recorded one.
+            ReplayedError: If the recorded call raised.
+        """
+        with self.lock:
+            self.sent[resource_name] += 1
+            calls = self.calls[resource_name]
+            position = self.find(calls, operation, command)
+            if position is None:
+                if self.strict or operation == "q":
+                    expected = f"{calls[0][0]} {calls[0][1]!r}" if calls else "nothing"
+                    raise TranscriptMismatch(
+                        f"{resource_name}: sent {operation} {command!r}, "
+                        f"recorded {expected}"
+                    )
+                self.unrecorded[resource_name] += 1
+                return None
+            self.skipped[resource_name] += position
+            for _ in range(position + 1):
+                recorded_operation, _, duration, response = calls.popleft()
+
+        if self.time_scale > 0:
+            time.sleep(duration * self.time_scale)
+        if recorded_operation.endswith("x"):
+            raise ReplayedError(f"{resource_name}: {command}: {response}")
+        return response
+
+    def find(self, calls: collections.deque, operation: str, command: str):
+        """Returns the position of the next recorded `operation` of `command`, or None.
+
+        In strict mode only the first call is considered, otherwise the calls up to the
+        next recorded query: skipping a query would drop a response the run used.
+        """
+        for position, call in enumerate(calls):
+            if (call[0].rstrip("x"), call[1]) == (operation, command):
+                return position
+            if self.strict or call[0].startswith("q"):
+                return None
+        return None
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        """Returns `{resource: counts}` of the recorded calls, the calls sent in replay,
+        the recorded calls skipped and left over, and the writes without a recording.
+        """
+        return {
+            name: {
+                "recorded": self.recorded[name],
+                "sent": self.sent[name],
+                "skipped": self.skipped[name],
+                "remaining": len(self.calls[name]),
+                "unrecorded": self.unrecorded[name],
+            }
+            for name in self.recorded
+        }
+
+
+def read_transcript(path: str | pathlib.Path) -> dict[str, collections.deque]:
+    """Reads a transcript into `{resource name: deque of calls}`.
+
+    Each call is `(operation, command, duration, response)`, in recorded order.
+    """
+    calls = {}
+    sessions = {}
+    with pathlib.Path(path).open(encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            match record:
+                case {"transcript": version}:
+                    if version > VERSION:
+                        raise ValueError(f"{path}: transcript version {version}")
+                    sessions = {}
+                case [_, _, session, "o", resource_name]:
+                    sessions[session] = resource_name
+                    calls.setdefault(resource_name, collections.deque())
+                case [_, duration, session, operation, command, *response]:
+                    response = response[0] if response else None
+                    calls[sessions[session]].append(
+                        (operation, command, duration, response)
+                    )
+    return calls
+
+
+def describe(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"
@@ -0,0 +1,174 @@
+# Standard library imports
+import concurrent.futures
+import threading
+import time
+import traceback
+from typing import Callable
+
+# Local imports
+from config import config as cfg, load_rig, load_path_loss
+from config.plan import TestPlan, PlanError, compile_plan
+from library.rig import Rig, resource_manager
+from library.scheduler import AnalyzerScheduler
+import pa_characterization
+
+
+class Progress:
+    """Thread-safe job counters and throughput per rig."""
+
+    def __init__(self, jobs: dict[str, list]):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.total = {name: len(queue) for name, queue in jobs.items()}
+        self.done = {name: 0 for name in jobs}
+        self.failed = {name: [] for name in jobs}
+
+    def update(self, rig: str, serial: str, error: Exception | None = None) -> None:
+        with self.lock:
+            self.done[rig] += 1
+            if error is not None:
+                self.failed[rig].append(serial)
+            print(self.report())
+
+    def throughput(self, rig: str | None = None) -> float:
+        """Returns finished DUTs per hour on `rig`, or on all rigs combined."""
+        hours = (time.perf_counter() - self.start) / 3600
+        done = self.done[rig] if rig is not None else sum(self.done.values())
+        return done / hours if hours > 0 else 0
+
+    def report(self) -> str:
+        lines = [
+            f"{sum(self.done.values())}/{sum(self.total.values())} DUTs, "
+            f"{self.throughput():.1f} DUTs/h"
+        ]
+        for rig in self.total:
+            lines.append(
+                f"  rig {rig}: {self.done[rig]}/{self.total[rig]} DUTs, "
+                f"{self.throughput(rig):.1f} DUTs/h, {len(self.failed[rig])} failed"
+            )
+        return "\n".join(lines)
+
+
+def open_rig(name: str) -> Rig:
+    """Opens the instruments of test rig `name` in a session of its own."""
+    settings = load_rig(name)
+    path_loss_path, path_loss = load_path_loss(
+        name, settings.get("path_loss_file", cfg["path_loss_file"])
+    )
+    return Rig.open(
+        resource_manager(settings, name, cfg),
+        name=name,
+        settings=settings,
+        path_loss=path_loss,
+        path_loss_path=path_loss_path,
+    )
+
+
+def shared_analyzers(names: list[str]) -> dict[str, AnalyzerScheduler]:
+    """Returns one scheduler per analyzer that several of the rigs `names` list in
+    their rig files, as `{rig name: scheduler}`."""
+    rigs_by_analyzer = {}
+    for name in names:
+        ip_address = load_rig(name)["SA"]["FSW43"]["ip"]
+        rigs_by_analyzer.setdefault(ip_address, []).append(name)
+    schedulers = {}
+    for rigs in rigs_by_analyzer.values():
+        if len(rigs) > 1:
+            scheduler = AnalyzerScheduler()
+            schedulers |= {name: scheduler for name in rigs}
+    return schedulers
+
+
+def run_rig(
+    name: str,
+    jobs: list[tuple[TestPlan, str]],
+    progress: Progress,
+    open_rig: Callable[[str], Rig] = open_rig,
+    scheduler: AnalyzerScheduler | None = None,
+    **tests,
+) -> None:
+    """Runs the (plan, serial) jobs of one rig in order on its own instrument set,
+    leasing the analyzer from `scheduler` if it is shared."""
+    rig = open_rig(name)
+    rig.scheduler = scheduler
+    try:
+        for plan, serial in jobs:
+            date = time.strftime("%y%m%d-%Hh%Mm")
+            try:
+                pa_characterization.main(rig, plan, serial, date, **tests)
+            except Exception as error:
+                traceback.print_exc()
+                progress.update(name, serial, error)
+            else:
+                progress.update(name, serial)
+            finally:
+                rig.shutdown()
+    finally:
+        rig.close()
+
+
+def main(
+    jobs: dict[str, list[tuple[TestPlan, str]]],
+    open_rig: Callable[[str], Rig] = open_rig,
+    test_lasig: bool = True,
+    test_aclr: bool = True,
+    with_dpd: bool = True,
+    schedulers: dict[str, AnalyzerScheduler] | None = None,
+) -> Progress:
+    """Characterizes DUTs on several rigs in parallel, one worker thread per rig.
+
+    Args:
+        jobs (dict): `{rig name: [(plan, serial), ...]}`, run in order on each rig. The
+            plans are compiled up front with `config.plan.compile_plan`.
+        open_rig (Callable): Returns the `Rig` for a rig name. Replace to run on
+            stand-in instruments.
+        schedulers (dict, optional): `{rig name: scheduler}` of the rigs sharing an
+            analyzer, see `shared_analyzers`.
+
+    Returns:
+        Progress: Finished/failed DUTs and throughput per rig.
+    """
+    progress = Progress(jobs)
+    tests = {"test_lasig": test_lasig, "test_aclr": test_aclr, "with_dpd": with_dpd}
+    schedulers = schedulers or {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [
+            pool.submit(
+                run_rig, name, queue, progress, open_rig, schedulers.get(name), **tests
+            )
+            for name, queue in jobs.items()
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    return progress
+
+
+if __name__ == "__main__":
+
+    if (product := cfg["product"]) == "":
+        product = input("Enter product: ")
+
+    jobs = {}
+    for name in cfg["Orchestrator"]["rigs"]:
+        settings = load_rig(name)
+        _, path_loss = load_path_loss(
+            name, settings.get("path_loss_file", cfg["path_loss_file"])
+        )
+        try:
+            plan = compile_plan(cfg, product, name, settings, path_loss=path_loss)
+        except PlanError as error:
+            raise SystemExit(f"Invalid test plan for rig {name}: {error}")
+        serials = input(f"Enter serial numbers on rig {name} (separated by spaces): ")
+        jobs[name] = [(plan, serial) for serial in serials.split()]
+
+    schedulers = shared_analyzers(list(jobs))
+    progress = main(
+        jobs,
+        test_lasig=bool(cfg["test_lasig"]),
+        test_aclr=bool(cfg["test_aclr"]),
+        with_dpd=bool(cfg["with_dpd"]),
+        schedulers=schedulers,
+    )
+    print(progress.report())
+    for scheduler in set(schedulers.values()):
+        print(scheduler.report())
@@ -1,327 +1,687 @@
 # Standard library imports
+import argparse
+import functools
+import hashlib
 import pathlib
 import time
 import zipfile
+from typing import Callable, Iterable, Iterator
+
+# Startup timing, imported first so it covers the imports below. pandas and NumPy are
+# not deferred: every measurement needs them, deferring would only move their cost
+from library.startup import Startup
 
 # Third party imports
 import pandas as pd
-import pyvisa
 import numpy as np
 
 # Local imports
-from config import config as cfg, config_path, rig, path_loss, path_loss_path
+from config import config as cfg, config_path, load_rig, load_path_loss
+from config.plan import TestPlan, PlanError, compile_plan
+from library import tracing
+from library.dpd import DirectDpd
 from library.drivers.vsa import FSW43
 from library.drivers.vsg import SMW200A
-from library.drivers.power_supplies import E36313A
-from library.drivers.sensors import NRPZ86
-
-
-def main() -> None:
-
-    if (test_lasig := cfg["test_lasig"]) == "":
+from library.measurement_cache import MeasurementCache
+from library.results import ResultsStore
+from library.rig import Rig, lock_instruments, resource_manager, server_socket
+from library.settling import CONTEXTS, Settling
+
+
+def main(
+    rig: Rig,
+    plan: TestPlan,
+    serial: str,
+    date: str,
+    test_lasig: bool | None = None,
+    test_aclr: bool | None = None,
+    with_dpd: bool | None = None,
+    configure: bool = True,
+    startup: Startup | None = None,
+) -> float:
+    """Characterizes one DUT on `rig`.
+
+    `plan` is the compiled test plan of the DUT's product, see `config.plan`. Tests
+    not selected by argument are taken from the config, or prompted for when the
+    config leaves them empty. With `configure=False` the rig must already be set up by
+    `configure_rig`, and only the supplies and the LASIG/ACLR selection are applied.
+    With `startup`, the time to first measurement is reported and stored with the run.
+
+    Returns:
+        float: Setup overhead in seconds, i.e. time spent before measuring.
+    """
+    if test_lasig is None and (test_lasig := cfg["test_lasig"]) == "":
         match input("Test large signals (Y/n)? ").casefold():
             case "y" | "yes":
                 test_lasig = True
             case _:
                 test_lasig = False
-    if (test_aclr := cfg["test_aclr"]) == "":
+    if test_aclr is None and (test_aclr := cfg["test_aclr"]) == "":
         match input("Test ACLR (Y/n)? ").casefold():
             case "y" | "yes":
                 test_aclr = True
             case _:
                 test_aclr = False
-    if (with_dpd := cfg["with_dpd"]) == "":
+    if with_dpd is None and (with_dpd := cfg["with_dpd"]) == "":
         match input("ACLR with DPD (Y/n)? ").casefold():
             case "y" | "yes":
                 with_dpd = True
             case _:
                 with_dpd = False
 
-    vcc = cfg["PowerSupply"]["ps1_ch1_voltage"]
-    icc = cfg["PowerSupply"]["ps1_ch1_current"]
-    vbias = cfg["PowerSupply"]["ps2_ch1_voltage"]
-    ibias = cfg["PowerSupply"]["ps2_ch1_current"]
-    vpaen = cfg["PowerSupply"]["ps2_ch2_voltage"]
-    ipaen = cfg["PowerSupply"]["ps2_ch2_current"]
+    trace_path = None
+    if cfg.get("trace"):
+        trace_path = (
+            log_dir(plan.product, serial)
+            / f"TRACE_{plan.product}_SER{serial}_DATE{date}.json"
+        )
+    with tracing.trace(trace_path, name=f"{plan.product} {serial}"):
+        start = time.perf_counter()
+        power_up(rig, plan)
+        setup_s = time.perf_counter() - start
+
+        store = ResultsStore(pathlib.Path(__file__).parent / cfg["results_dir"])
+        results = {}
+
+        if test_lasig:
+            start = time.perf_counter()
+            if configure:
+                reset_rig(rig)
+            else:
+                select_lasig(rig, plan)
+            setup_s += time.perf_counter() - start
+            if startup is not None:
+                startup.first_measurement()
+            results["lasig"], results["sweep"] = run_lasig(rig, plan, configure=False)
+            print(results["lasig"])
 
+        if test_aclr:
+            start = time.perf_counter()
+            if configure:
+                reset_rig(rig)
+                configure_aclr(rig, plan, with_dpd=with_dpd)
+            else:
+                select_aclr(rig, plan)
+            setup_s += time.perf_counter() - start
+            if startup is not None:
+                startup.first_measurement()
+            results["aclr"] = run_aclr(rig, plan, with_dpd=with_dpd, configure=False)
+            print(results["aclr"])
+
+        if plan.readings_freshness_s > 0:
+            print(rig.readings.report())
+
+        if startup is not None:
+            print(startup.report())
+            results["startup"] = (
+                pd.Series(startup.as_dict(), name="seconds")
+                .rename_axis("phase")
+                .to_frame()
+            )
+
+        for table, data in results.items():
+            store.append(table, data, product=plan.product, serial=serial, run=date)
+
+        if cfg["export_csv"]:
+            export_csv(rig, plan.product, serial, date, results)
+
+    print(f"Setup overhead: {setup_s:.1f} s")
+    return setup_s
+
+
+@tracing.traced
+def power_up(rig: Rig, plan: TestPlan) -> None:
+    """Sets and turns on the DUT supplies."""
+    # A DUT powered up starts without readings
+    rig.readings = MeasurementCache(plan.readings_freshness_s)
+    supplies = plan.supplies
     for ch in [1, 2, 3]:
-        ps1.set_channel(ch, voltage=vcc, current=icc)
-    ps2.set_channel(1, voltage=vbias, current=ibias)
-    ps2.set_channel(2, voltage=vpaen, current=ipaen)
+        rig.ps1.set_channel(ch, voltage=supplies.vcc, current=supplies.icc)
+    rig.ps2.set_channel(1, voltage=supplies.vbias, current=supplies.ibias)
+    rig.ps2.set_channel(2, voltage=supplies.vpaen, current=supplies.ipaen)
+
+    rig.ps1.turn_on(1, 2, 3)
+    rig.ps2.turn_on(1, 2)
+
+
+def configure_rig(
+    rig: Rig, plan: TestPlan, test_aclr: bool = True, with_dpd: bool = False
+) -> None:
+    """Resets the rig and sets up everything `main(configure=False)` relies on."""
+    reset_rig(rig)
+    if test_aclr:
+        configure_aclr(rig, plan, with_dpd=with_dpd)
 
-    ps1.turn_on(1, 2, 3)
-    ps2.turn_on(1, 2)
 
+def run_batch(
+    rig: Rig,
+    jobs: Iterable[tuple[TestPlan, str]],
+    test_lasig: bool = True,
+    test_aclr: bool = True,
+    with_dpd: bool = False,
+    startup: Startup | None = None,
+) -> dict[str, float]:
+    """Characterizes a queue of DUTs, configuring the rig only when the product changes.
+
+    Args:
+        jobs (Iterable): (plan, serial) pairs. May be a generator prompting the
+            operator for the next DUT.
+        startup (Startup, optional): Reported and stored with the first DUT.
+
+    Returns:
+        dict: Setup overhead in seconds per serial.
+    """
+    overhead = {}
+    configured = None
+    for plan, serial in jobs:
+        if plan != configured:
+            start = time.perf_counter()
+            configure_rig(rig, plan, test_aclr=test_aclr, with_dpd=with_dpd)
+            setup_s = time.perf_counter() - start
+            print(f"Configured rig for {plan.product} in {setup_s:.1f} s")
+            configured = plan
+        date = time.strftime("%y%m%d-%Hh%Mm")
+        try:
+            overhead[serial] = main(
+                rig,
+                plan,
+                serial,
+                date,
+                test_lasig=test_lasig,
+                test_aclr=test_aclr,
+                with_dpd=with_dpd,
+                configure=False,
+                startup=startup,
+            )
+        finally:
+            startup = None
+            rig.shutdown()
+
+    if overhead:
+        print("Setup overhead per DUT:")
+        for serial, setup_s in overhead.items():
+            print(f"  {serial}: {setup_s:.1f} s")
+        print(f"  mean: {sum(overhead.values()) / len(overhead):.1f} s")
+    return overhead
+
+
+def prompt_serials(
+    plan: TestPlan, serials: list[str]
+) -> Iterator[tuple[TestPlan, str]]:
+    """Yields the queued serials, then prompts the operator for more between DUTs."""
+    for serial in serials:
+        input(f"Insert DUT {serial} and press Enter ")
+        yield plan, serial
+    while serial := input("Enter next serial number (blank to finish): "):
+        yield plan, serial
+
+
+def dry_run(
+    plan: TestPlan,
+    test_lasig: bool = True,
+    test_aclr: bool = True,
+    with_dpd: bool = False,
+    cost_model=None,
+):
+    """Estimates how long `main` takes per DUT of `plan`, without the instruments.
+
+    The measurements run on the simulated rig on a virtual clock, see
+    `library.estimate`.
+
+    Args:
+        cost_model (CostModel, optional): Instrument latencies. Defaults to the ones
+            recorded on the plan's rig.
+
+    Returns:
+        Estimate: Duration per phase and the cost of the main plan parameters.
+    """
+    from library.estimate import CostModel, Estimate, simulated_rig, virtual_clock
+
+    cost_model = cost_model or CostModel.for_rig(plan.rig)
+    settings = load_rig("SIM")
+    # Let the simulated DUT reach every Pout target, so that `find_pout` converges
+    dut = settings["Simulation"].setdefault("dut", {})
+    dut["psat_dbm"] = max(dut.get("psat_dbm", 33.0), max(plan.pout_targets) + 3)
+
+    with virtual_clock():
+        rig, rm = simulated_rig(settings, cost_model)
+        calls, waited = sum(rm.calls.values()), rm.bench.waited
+        with tracing.recording(f"{plan.product} dry run") as trace:
+            power_up(rig, plan)
+            if test_lasig:
+                reset_rig(rig)
+                run_lasig(rig, plan, configure=False)
+            if test_aclr:
+                reset_rig(rig)
+                configure_aclr(rig, plan, with_dpd=with_dpd)
+                run_aclr(rig, plan, with_dpd=with_dpd, configure=False)
+            rig.shutdown()
+
+    durations = trace.durations()
+    phases = ["power_up", "reset_rig", "run_lasig", "configure_aclr", "run_aclr"]
+    frequencies = len(plan.lasig_frequencies) * test_lasig
+    frequencies += len(plan.modulated_frequencies) * test_aclr
+    sweep = plan.sweep
+    sweep_points = len(
+        np.arange(sweep.start_dbm, sweep.stop_dbm + sweep.step_dbm, sweep.step_dbm)
+    )
+    modulated_points = len(plan.modulated_frequencies) * len(plan.pout_targets)
+    parameters = {
+        "lasig_frequencies": (
+            durations.get("run_lasig", 0),
+            len(plan.lasig_frequencies),
+        ),
+        "modulated_frequencies": (
+            durations.get("run_aclr", 0),
+            len(plan.modulated_frequencies),
+        ),
+        # Everything per frequency but the sweep is repeated per Pout target
+        "pout_targets": (
+            durations.get("frequency", 0) - durations.get("run_power_sweep", 0),
+            len(plan.pout_targets) * frequencies,
+        ),
+        "sweep (start, stop, step)": (
+            durations.get("run_power_sweep", 0),
+            sweep_points * len(plan.lasig_frequencies),
+        ),
+        "dpd.iteration": (
+            durations.get("ddpd", 0),
+            plan.dpd.iteration * modulated_points,
+        ),
+    }
+    return Estimate(
+        name=f"one {plan.product} DUT",
+        phases={phase: durations[phase] for phase in phases if phase in durations},
+        parameters={
+            parameter: cost for parameter, cost in parameters.items() if cost[0] > 0
+        },
+        commands=sum(rm.calls.values()) - calls,
+        sleep_s=durations.get("sleep", 0),
+        instrument_s=rm.bench.waited - waited,
+        cost_model=cost_model,
+    )
+
+
+def log_dir(product: str, serial: str) -> pathlib.Path:
+    """Returns the directory of the per-run files of a DUT, creating it if needed."""
     dir_log = pathlib.Path(__file__).parent / "log" / product / serial
     dir_log.mkdir(parents=True, exist_ok=True)
+    return dir_log
 
-    if test_lasig:
-        lasig_log = dir_log / f"LASIG_{product}_SER{serial}_DATE{date}.csv"
-        sweep_log = dir_log / f"SWEEP_{product}_SER{serial}_DATE{date}.csv"
-        lasig_data, sweep_data = run_lasig()
-        lasig_data.to_csv(lasig_log)
-        sweep_data.to_csv(sweep_log)
-        print(lasig_data)
 
-    if test_aclr:
-        aclr_log = dir_log / f"ACLR_{product}_SER{serial}_DATE{date}.csv"
-        aclr_data = run_aclr(with_dpd=with_dpd)
-        aclr_data.to_csv(aclr_log)
-        print(aclr_data)
+def export_csv(
+    rig: Rig, product: str, serial: str, date: str, results: dict[str, pd.DataFrame]
+) -> None:
+    """Writes the run results as CSV files and zips them with the config and path loss file."""
+    dir_log = log_dir(product, serial)
+
+    logs = []
+    for table, frame in results.items():
+        log = dir_log / f"{table.upper()}_{product}_SER{serial}_DATE{date}.csv"
+        frame.to_csv(log)
+        logs.append(log)
 
     data = dir_log / f"{product}_SER{serial}_DATE{date}.zip"
     with zipfile.ZipFile(data, mode="w") as archive:
         archive.write(config_path, arcname=config_path.name)
-        archive.write(path_loss_path, arcname=path_loss_path.name)
-        if test_lasig:
-            archive.write(lasig_log, arcname=lasig_log.name)
-            archive.write(sweep_log, arcname=sweep_log.name)
-        if test_aclr:
-            archive.write(aclr_log, arcname=aclr_log.name)
+        for source in rig.path_loss.sources:
+            archive.write(source, arcname=source.name)
+        for log in logs:
+            archive.write(log, arcname=log.name)
 
 
-def run_lasig() -> tuple[pd.DataFrame, pd.DataFrame]:
+@tracing.traced
+def run_lasig(
+    rig: Rig, plan: TestPlan, configure: bool = True
+) -> tuple[pd.DataFrame, pd.DataFrame]:
 
-    vsa.reset(wait=True, clear_status=True)
-    vsg.reset(wait=True, clear_status=True)
-    sensor.reset()
-
-    frange = cfg[product]["Freqs"]["lasig"]
-
-    match (pout_targets := cfg["pout_target_dbm"]):
-        case int():
-            pout_targets = [pout_targets]
-        case list():
-            pass
+    vsg, sensor, path_loss = rig.vsg, rig.sensor, rig.path_loss
+    if configure:
+        reset_rig(rig)
 
     sweep = {}
     tmp = []
-    for freq in frange:
-        input_path_loss = path_loss.at[freq, "sg_to_dut_p1_loss_db"]
-        sa_path_loss = path_loss.at[freq, "sa_to_dut_p2_loss_db"]
-        sensor_path_loss = path_loss.at[freq, "sensor_to_dut_p2_loss_db"]
-        vsa.set_reference_level(offset=(-sa_path_loss))
-
-        vsa.set_frequency(center=freq, span=0)
-        vsg.set_rf(frequency=freq, compensation_offset=input_path_loss)
-        sensor.set_frequency(freq)
-
-        sweep[freq] = run_power_sweep(
-            start=cfg[product]["sweep_start_dbm"],
-            stop=cfg[product]["sweep_stop_dbm"],
-            step=cfg[product]["sweep_step_dbm"],
-            sensor_path_loss=sensor_path_loss,
-            average_count=1,
-            timeout=0.2,
-        )
-
-        gain_compression = find_gain_compression(
-            sweep_data=sweep[freq], dbm_at_linear_gain=cfg[product]["sweep_start_dbm"]
-        )
-        tmp.append(
-            pd.DataFrame(
-                {
-                    "frequency_hz": [freq for _ in gain_compression],
-                    "condition": gain_compression.keys(),
-                    "pout_dbm": gain_compression.values(),
-                }
+    for freq in plan.lasig_frequencies:
+        with tracing.span("frequency", frequency_hz=freq):
+            # Path losses at the drive levels: Pin at the input, Pout at the output
+            input_path_loss = path_loss.loss(
+                freq, "sg_to_dut_p1_loss_db", power=plan.sweep.start_dbm
             )
-        )
-        for pout_target in pout_targets:
-            dut_pin, dut_pout = find_pout(
-                target_dbm=pout_target,
-                sensor_path_loss=sensor_path_loss,
-                pin_low=cfg[product]["sweep_start_dbm"],
-                pin_high=cfg[product]["sweep_stop_dbm"],
-                average_count=3,
-                timeout=0.25,
+            sa_path_loss = path_loss.loss(
+                freq, "sa_to_dut_p2_loss_db", power=plan.pout_targets[0]
+            )
+            with rig.lease_vsa() as vsa:
+                vsa.set_reference_level(offset=(-sa_path_loss))
+                vsa.set_frequency(center=freq, span=0)
+            vsg.set_rf(frequency=freq, compensation_offset=input_path_loss)
+            sensor.set_frequency(freq)
+
+            sweep[freq] = run_power_sweep(
+                rig,
+                frequency=freq,
+                start=plan.sweep.start_dbm,
+                stop=plan.sweep.stop_dbm,
+                step=plan.sweep.step_dbm,
+                average_count=1,
+                settling=plan.settling["sweep_point"],
+                thermal=plan.settling["thermal"],
             )
 
-            conditions = {"frequency_hz": freq, "condition": f"{pout_target}dbm"}
-            gain = {"pout_dbm": dut_pout, "gain_db": dut_pout - dut_pin}
-            harmonics = measure_harmonic(multiple=[2, 3], fundamental_frequency=freq)
-            pae = {
-                "pae": measure_pae(sensor_path_loss=sensor_path_loss, pin=dut_pin) * 100
-            }
-            tmp.append(pd.DataFrame([conditions | gain | harmonics | pae]))
-        vsg.set_output("off")
+            gain_compression = find_gain_compression(
+                sweep_data=sweep[freq], dbm_at_linear_gain=plan.sweep.start_dbm
+            )
+            tmp.append(
+                pd.DataFrame(
+                    {
+                        "frequency_hz": [freq for _ in gain_compression],
+                        "condition": gain_compression.keys(),
+                        "pout_dbm": gain_compression.values(),
+                    }
+                )
+            )
+            for pout_target in plan.pout_targets:
+                dut_pin, dut_pout = find_pout(
+                    rig,
+                    frequency=freq,
+                    target_dbm=pout_target,
+                    pin_low=plan.sweep.start_dbm,
+                    pin_high=plan.sweep.stop_dbm,
+                    average_count=3,
+                    settling=plan.settling["pout"],
+                )
+
+                conditions = {"frequency_hz": freq, "condition": f"{pout_target}dbm"}
+                gain = {"pout_dbm": dut_pout, "gain_db": dut_pout - dut_pin}
+                harmonics = measure_harmonic(
+                    rig,
+                    multiple=[2, 3],
+                    fundamental_frequency=freq,
+                    settling=plan.settling["harmonic"],
+                )
+                pae = {"pae": measure_pae(rig, frequency=freq, pin=dut_pin) * 100}
+                tmp.append(pd.DataFrame([conditions | gain | harmonics | pae]))
+            vsg.set_output("off")
     lasig_data = pd.concat(tmp).set_index(["frequency_hz", "condition"])
     sweep_data = pd.concat(sweep)
 
     return lasig_data, sweep_data
 
 
-def run_aclr(with_dpd: bool = False):
-
-    vsa.reset(wait=True, clear_status=True)
-    vsg.reset(wait=True, clear_status=True)
-    sensor.reset()
-
-    frange = cfg[product]["Freqs"]["modulated"]
-    signal_bandwidth = cfg[product]["signal_bw"]
-    resolution_bandwidth = cfg["ACLR"]["resolution_bandwidth"]
-    sweep_time = cfg["ACLR"]["sweep_time"]
-    carrier_number = cfg[product]["carrier_number"]
-    sa_ref_level = cfg[product]["sa_ref_level"]
-    sa_inp_att_level = cfg[product]["sa_inp_att_level"]
-    sg_att_level = cfg[product]["sg_att_level"]
-
-    match (pout_targets := cfg["pout_target_dbm"]):
-        case int():
-            pout_targets = [pout_targets]
-        case list():
-            pass
-        case _:
-            raise Exception
-
-    if with_dpd:
-        dpd_gain_exp = cfg[product]["dpd_expansion"]
-        dpd_iteration = cfg["DPD"]["iteration"]
-        dpd_tradeoff = cfg["DPD"]["tradeoff"]
-        estim_range = cfg["DPD"]["estim_range"]
-        iq_count = cfg["DPD"]["iq_count"]
-
-    match cfg["test_rig"].casefold():
-        case "a":
-            usb_drive = "UDISK"
-        case "b":
-            usb_drive = "GG"
-
-    match (carrier_number, signal_bandwidth):
-        case (int(), 20e6):
-            aclr_channel_bandwidth = 19080000
-            aclr_adjacent_channels = carrier_number
-            signal_pathname = (
-                f"'/usb/{usb_drive}/5GNR_ETM31_{carrier_number}X20MHZ_85DB_CCDF001'"
+@tracing.traced
+def reset_rig(rig: Rig) -> None:
+    """Resets the analyzer, generator and sensor to their default state."""
+    with rig.lease_vsa() as vsa:
+        vsa.reset(wait=True, clear_status=True)
+    rig.vsg.reset(wait=True, clear_status=True)
+    rig.sensor.reset()
+    rig.readings.invalidate()
+
+
+@tracing.traced
+def configure_aclr(rig: Rig, plan: TestPlan, with_dpd: bool = False) -> None:
+    """Creates the ACLR (and DPD) channels and loads the product's ARB waveform.
+
+    The analyzer setup is stored in a save set on the analyzer (see
+    `aclr_setup_file`) and recalled in one step the next time.
+    """
+    vsg = rig.vsg
+    aclr, dpd = plan.aclr, plan.dpd
+
+    configure_arb(vsg, plan)
+    with rig.lease_vsa() as vsa:
+        setup = aclr_setup_file(rig, plan, with_dpd)
+        if setup is not None and recall_aclr_setup(vsa, setup, plan, with_dpd):
+            return
+        vsa.create_channel(kind="spectrum", name="ACLR")
+
+        if with_dpd:
+            vsa.create_channel(kind="amplifier", name="DPD")
+            vsa.configure_window(replace="ACP")
+            vsa.configure_aclr(
+                transmission_channels=aclr.carrier_number,
+                transmission_channel_spacing=aclr.signal_bandwidth,
+                transmission_channel_bandwidth=aclr.channel_bandwidth,
+                adjacent_channels=aclr.adjacent_channels,
+                adjacent_channel_spacing=aclr.signal_bandwidth,
+                adjacent_channel_bandwidth=aclr.channel_bandwidth,
+                automatic_measurement_bandwidth="on",
             )
-        case (1, 100e6):
-            aclr_channel_bandwidth = 98280000
-            aclr_adjacent_channels = 2
-            signal_pathname = f"'/usb/{usb_drive}/5gnrfdd_BW_100_CF_8.5dB_mkr'"
-
-    if sg_att_level > 0:
-        vsg.set_output(attenuation=sg_att_level)
-    vsg.set_baseband(digital_modulation="on", optimization_mode="high quality table")
-    vsg.set_arb(waveform_pathname=signal_pathname, state="on")
-    vsa.create_channel(kind="spectrum", name="ACLR")
+            vsa.set_resolution_bandwidth(rbw=aclr.resolution_bandwidth)
+            vsa.configure_signal_generator(state="on", ip_address=vsg.ip_address)
+            plan.settling["generator"].until(vsa.get_generator_connection)
+            vsa.configure_ddpd(
+                count=dpd.iteration,
+                gain_expansion_db=dpd.gain_expansion_db,
+                tradeoff=dpd.tradeoff,
+            )
+            if dpd.estimation_range is not None:
+                vsa.set_synchronization(
+                    estimation_range=dpd.estimation_range,
+                    evaluation_range=dpd.estimation_range,
+                )
+            if dpd.iq_count is not None:
+                vsa.set_sweep_statistics(count=dpd.iq_count)
+            if aclr.signal_bandwidth == 100e6:
+                vsa.set_trigger(source="external")
+                vsa.set_sample_rate(bandwitdh=6e8)
+            vsa.configure_reference_signal(read_from_signal_generator=True)
+            vsa.select_channel(name="ACLR")
 
-    if with_dpd:
-        vsa.create_channel(kind="amplifier", name="DPD")
-        vsa.configure_window(replace="ACP")
         vsa.configure_aclr(
-            transmission_channels=carrier_number,
-            transmission_channel_spacing=signal_bandwidth,
-            transmission_channel_bandwidth=aclr_channel_bandwidth,
-            adjacent_channels=aclr_adjacent_channels,
-            adjacent_channel_spacing=signal_bandwidth,
-            adjacent_channel_bandwidth=aclr_channel_bandwidth,
-            automatic_measurement_bandwidth="on",
-        )
-        vsa.set_resolution_bandwidth(rbw=resolution_bandwidth)
-        vsa.configure_signal_generator(state="on", ip_address=vsg.ip_address)
-        time.sleep(0.5)
-        vsa.configure_ddpd(
-            count=dpd_iteration,
-            gain_expansion_db=dpd_gain_exp,
-            tradeoff=dpd_tradeoff,
+            preset="eutra",
+            transmission_channels=aclr.carrier_number,
+            transmission_channel_spacing=aclr.signal_bandwidth,
+            transmission_channel_bandwidth=aclr.channel_bandwidth,
+            adjacent_channels=aclr.adjacent_channels,
+            adjacent_channel_spacing=aclr.signal_bandwidth,
+            adjacent_channel_bandwidth=aclr.channel_bandwidth,
         )
-        if cfg["DPD"]["estim_flag"]:
-            vsa.set_synchronization(
-                estimation_range=estim_range, evaluation_range=estim_range
-            )
-        if cfg["DPD"]["iq_flag"]:
-            vsa.set_sweep_statistics(count=iq_count)
-        if signal_bandwidth == 100e6:
-            vsa.set_trigger(source="external")
-            vsa.set_sample_rate(bandwitdh=6e8)
-        vsa.configure_reference_signal(read_from_signal_generator=True)
+        vsa.set_resolution_bandwidth(rbw=aclr.resolution_bandwidth)
+        vsa.set_sweep(time=aclr.sweep_time)
+        if setup is not None:
+            vsa.store_setup(setup)
+
+
+def configure_arb(vsg: SMW200A, plan: TestPlan) -> None:
+    """Plays the ACLR waveform of `plan`, from its multi-segment waveform if it has
+    one. Settings the generator still holds are not sent again."""
+    aclr = plan.aclr
+    if aclr.sg_att_level > 0:
+        vsg.set_output(attenuation=aclr.sg_att_level)
+    vsg.set_baseband(digital_modulation="on", optimization_mode="high quality table")
+    if aclr.segments:
+        vsg.load_segments(aclr.segments)
+    vsg.set_arb(waveform_pathname=aclr.waveform, state="on")
+
+
+def aclr_setup_file(rig: Rig, plan: TestPlan, with_dpd: bool) -> str | None:
+    """Returns the analyzer save set of the ACLR setup of `plan`, or None without a
+    `setup_dir` under `[ACLR]` in the config.
+
+    The file is named after a hash of the settings the setup is built from, so a
+    changed plan builds and stores a new setup.
+    """
+    setup_dir = cfg["ACLR"].get("setup_dir", "")
+    if not setup_dir:
+        return None
+    settings = (plan.aclr, plan.dpd, rig.vsg.ip_address) if with_dpd else plan.aclr
+    digest = hashlib.sha1(repr(settings).encode()).hexdigest()[:8]
+    kind = "aclr_dpd" if with_dpd else "aclr"
+    return f"{setup_dir}\\{plan.product}_{kind}_{digest}.dfl"
+
+
+def recall_aclr_setup(vsa: FSW43, path: str, plan: TestPlan, with_dpd: bool) -> bool:
+    """Loads the save set `path` and checks that it holds the ACLR (and DPD)
+    channel, with the channel counts of `plan`.
+
+    Returns:
+        bool: False if the file does not exist yet or holds another setup. The
+            analyzer is then left without an ACLR channel and with an empty error
+            queue, ready to be configured.
+    """
+    vsa.load_setup(path)
+    channels = vsa.get_channels()
+    expected = {"ACLR": "SANALYZER"} | ({"DPD": "AMPL"} if with_dpd else {})
+    if all(channels.get(name) == kind for name, kind in expected.items()):
         vsa.select_channel(name="ACLR")
+        counts = plan.aclr.carrier_number, plan.aclr.adjacent_channels
+        if vsa.get_aclr_channel_count() == counts:
+            return True
+    if "ACLR" in channels or "DPD" in channels:
+        vsa.reset(wait=True, clear_status=True)
+    else:
+        # A missing file leaves "File name not found" in the error queue
+        vsa.clear_status()
+    return False
+
+
+@tracing.traced
+def select_lasig(rig: Rig, plan: TestPlan) -> None:
+    """Switches a configured rig to the CW large signal setup, undoing the manual
+    attenuation of the ACLR setup."""
+    with rig.lease_vsa() as vsa:
+        vsa.select_channel(name="Spectrum")
+    rig.vsg.set_arb(state="off")
+    rig.vsg.set_baseband(digital_modulation="off")
+    if plan.aclr.sg_att_level > 0:
+        rig.vsg.set_output(attenuation="auto")
+
+
+@tracing.traced
+def select_aclr(rig: Rig, plan: TestPlan) -> None:
+    """Switches a configured rig back to the modulated ACLR setup, reloading the
+    waveform if the DPD replaced it."""
+    with rig.lease_vsa() as vsa:
+        vsa.select_channel(name="ACLR")
+    configure_arb(rig.vsg, plan)
 
-    vsa.configure_aclr(
-        preset="eutra",
-        transmission_channels=carrier_number,
-        transmission_channel_spacing=signal_bandwidth,
-        transmission_channel_bandwidth=aclr_channel_bandwidth,
-        adjacent_channels=aclr_adjacent_channels,
-        adjacent_channel_spacing=signal_bandwidth,
-        adjacent_channel_bandwidth=aclr_channel_bandwidth,
-    )
-    vsa.set_resolution_bandwidth(rbw=resolution_bandwidth)
-    vsa.set_sweep(time=sweep_time)
+
+@tracing.traced
+def run_aclr(
+    rig: Rig, plan: TestPlan, with_dpd: bool = False, configure: bool = True
+) -> pd.DataFrame:
+
+    vsg, sensor, path_loss = rig.vsg, rig.sensor, rig.path_loss
+    if configure:
+        with rig.lease_vsa():
+            reset_rig(rig)
+            configure_aclr(rig, plan, with_dpd=with_dpd)
+
+    sa_ref_level = plan.aclr.sa_ref_level
+    sa_inp_att_level = plan.aclr.sa_inp_att_level
 
     tmp = []
-    for freq in frange:
-        input_path_loss = path_loss.at[freq, "sg_to_dut_p1_loss_db"]
-        sa_path_loss = path_loss.at[freq, "sa_to_dut_p2_loss_db"]
-        sensor_path_loss = path_loss.at[freq, "sensor_to_dut_p2_loss_db"]
-        vsa.set_reference_level(offset=(-sa_path_loss), value=sa_ref_level)
-
-        vsa.set_frequency(center=freq)
-        vsg.set_rf(frequency=freq, compensation_offset=input_path_loss)
-        sensor.set_frequency(freq)
-
-        vsa.set_input_attenuation(level="auto")
-        for pout_target in pout_targets:
-            dut_pin, dut_pout = find_pout(
-                target_dbm=pout_target,
-                sensor_path_loss=sensor_path_loss,
-                pin_low=cfg[product]["sweep_start_dbm"],
-                pin_high=cfg[product]["sweep_stop_dbm"],
-                average_count=3,
-                timeout=0.25,
+    # The DPD channel keeps its frequency and reference level offset across pout
+    # targets
+    dpd_tuning = None
+    dpd = DirectDpd(
+        rig.vsa,
+        max_iterations=plan.dpd.iteration,
+        min_improvement_pct=plan.dpd.min_evm_improvement_pct,
+        correction_dir=cfg["DPD"].get("warm_start_dir", ""),
+        name=f"{plan.product}_{rig.name}",
+    )
+    for freq in plan.modulated_frequencies:
+        with tracing.span("frequency", frequency_hz=freq):
+            input_path_loss = path_loss.loss(
+                freq, "sg_to_dut_p1_loss_db", power=plan.sweep.start_dbm
             )
-            vsa.set_input_attenuation(level=sa_inp_att_level)
-            aclr_data = vsa.get_aclr_channel_power()
-            metadata = {
-                "frequency_hz": freq,
-                "pout_target": pout_target,
-            }
-
-            if with_dpd:
-                vsa.select_channel(name="DPD")
+            with rig.lease_vsa() as vsa:
                 vsa.set_frequency(center=freq)
-                vsa.set_reference_level(offset=(-sa_path_loss), value=sa_ref_level)
-                # vsa.set_input_attenuation(level=sa_inp_att_level)
-                vsa.start_ddpd()
-                while vsa.get_ddpd_iteration() < dpd_iteration:
-                    time.sleep(1)
-                time.sleep(20)
-
-                metadata["pout_max_dbm"] = vsa.get_power_maximum()
-                metadata["evm_pct"] = vsa.get_raw_evm_current()
-                vsa.select_channel(name="ACLR")
-                aclr_with_dpd = vsa.get_aclr_channel_power()
-                for key in aclr_with_dpd:
-                    aclr_data[key + "_dpd"] = aclr_with_dpd[key]
-
-                vsa.select_channel(name="DPD")
-                vsa.apply_ddpd(state="off")
-                vsa.select_channel(name="ACLR")
-            tmp.append(pd.DataFrame([aclr_data | metadata]))
+                vsa.set_input_attenuation(level="auto")
+            vsg.set_rf(frequency=freq, compensation_offset=input_path_loss)
+            sensor.set_frequency(freq)
+
+            sa_path_loss = None
+            for pout_target in plan.pout_targets:
+                # The analyzer reads the Pout target, through the loss at that power
+                loss = path_loss.loss(freq, "sa_to_dut_p2_loss_db", power=pout_target)
+                if loss != sa_path_loss:
+                    sa_path_loss = loss
+                    with rig.lease_vsa() as vsa:
+                        vsa.set_reference_level(
+                            offset=(-sa_path_loss), value=sa_ref_level
+                        )
+                dut_pin, dut_pout = find_pout(
+                    rig,
+                    frequency=freq,
+                    target_dbm=pout_target,
+                    pin_low=plan.sweep.start_dbm,
+                    pin_high=plan.sweep.stop_dbm,
+                    average_count=3,
+                    settling=plan.settling["pout"],
+                )
+                metadata = {
+                    "frequency_hz": freq,
+                    "pout_target": pout_target,
+                }
+                # The analyzer is only needed once the sensor found the Pout
+                with rig.lease_vsa() as vsa:
+                    vsa.set_input_attenuation(level=sa_inp_att_level)
+                    aclr_data = vsa.get_aclr_channel_power()
+
+                    if with_dpd:
+                        vsa.select_channel(name="DPD")
+                        if dpd_tuning != (freq, sa_path_loss):
+                            vsa.set_frequency(center=freq)
+                            vsa.set_reference_level(
+                                offset=(-sa_path_loss), value=sa_ref_level
+                            )
+                            dpd_tuning = freq, sa_path_loss
+                        # vsa.set_input_attenuation(level=sa_inp_att_level)
+                        dpd_result = dpd.run(freq, pout_target)
+                        metadata["dpd_iterations"] = dpd_result.iterations
+                        plan.settling["dpd"].wait(vsa.get_raw_evm_current)
+
+                        metadata["pout_max_dbm"] = vsa.get_power_maximum()
+                        metadata["evm_pct"] = vsa.get_raw_evm_current()
+                        vsa.select_channel(name="ACLR")
+                        aclr_with_dpd = vsa.get_aclr_channel_power()
+                        for key in aclr_with_dpd:
+                            aclr_data[key + "_dpd"] = aclr_with_dpd[key]
+
+                        vsa.select_channel(name="DPD")
+                        vsa.apply_ddpd(state="off")
+                        vsa.select_channel(name="ACLR")
+                        # The analyzer changed the generator's waveform
+                        vsg.invalidate()
+                        rig.readings.invalidate()
+                tmp.append(pd.DataFrame([aclr_data | metadata]))
 
     return pd.concat(tmp).set_index(["frequency_hz", "pout_target"])
 
 
+@tracing.traced
 def run_power_sweep(
+    rig: Rig,
+    frequency: float,
     start: float,
     stop: float,
     step: float,
-    sensor_path_loss: float,
     average_count: int = 10,
-    timeout: float = 0.5,
+    settling: Settling = CONTEXTS["sweep_point"],
+    thermal: Settling = CONTEXTS["thermal"],
 ) -> pd.DataFrame:
 
+    vsg, sensor = rig.vsg, rig.sensor
     dut_pout = {}
     dut_gain = {}
-    vsg.set_rf(dut_input_level=start)
+    set_pin(rig, frequency, start)
     vsg.set_output("ON")
-    time.sleep(2 - timeout)
+    # The PA heats up under bias and drive until its supply current settles
+    thermal.wait(functools.partial(supply_current, rig))
     for pwr in np.arange(start, stop + step, step):
-        vsg.set_rf(dut_input_level=pwr)
-        time.sleep(timeout)
-        dut_pout[pwr] = (
-            np.median([sensor.get_power() for _ in range(average_count)])
-            - sensor_path_loss
+        set_pin(rig, frequency, pwr)
+        dut_pout[pwr] = rig.path_loss.output_power(
+            frequency,
+            "sensor_to_dut_p2_loss_db",
+            read_cached(
+                rig,
+                "sensor",
+                functools.partial(settling.read, sensor.get_power, average_count),
+                settling,
+                average_count,
+            ),
         )
         dut_gain[pwr] = dut_pout[pwr] - pwr
     sweep_data = pd.DataFrame({"dut_pout_dbm": dut_pout, "dut_gain_db": dut_gain})
@@ -356,23 +716,33 @@ def find_gain_compression(sweep_data: pd.DataFrame, dbm_at_linear_gain: float) -
     return {"op1db": op1db, "op3db": op3db, "op5db": op5db}
 
 
+@tracing.traced
 def find_pout(
+    rig: Rig,
+    frequency: float,
     target_dbm: float,
-    sensor_path_loss: float,
     pin_low: float,
     pin_high: float,
     pout_margin: float = 0.05,
     average_count: int = 10,
-    timeout: float = 0.5,
+    settling: Settling = CONTEXTS["pout"],
     iteration: int = 1,
 ) -> tuple[float, float]:
 
+    vsg, sensor = rig.vsg, rig.sensor
     dut_pin = (pin_low + pin_high) / 2
-    vsg.set_rf(dut_input_level=dut_pin)
+    set_pin(rig, frequency, dut_pin)
     vsg.set_output("ON")
-    time.sleep(timeout)
-    pout_now = (
-        np.median([sensor.get_power() for _ in range(average_count)]) - sensor_path_loss
+    pout_now = rig.path_loss.output_power(
+        frequency,
+        "sensor_to_dut_p2_loss_db",
+        read_cached(
+            rig,
+            "sensor",
+            functools.partial(settling.read, sensor.get_power, average_count),
+            settling,
+            average_count,
+        ),
     )
 
     if abs(pout_now - target_dbm) <= pout_margin:
@@ -381,91 +751,204 @@ def find_pout(
         raise Exception("Unable to find Pout target.")
     elif pout_now > target_dbm:
         return find_pout(
+            rig,
+            frequency=frequency,
             target_dbm=target_dbm,
-            sensor_path_loss=sensor_path_loss,
             pin_low=pin_low,
             pin_high=dut_pin,
             pout_margin=pout_margin,
             average_count=average_count,
-            timeout=timeout,
+            settling=settling,
             iteration=iteration + 1,
         )
     else:
         return find_pout(
+            rig,
+            frequency=frequency,
             target_dbm=target_dbm,
-            sensor_path_loss=sensor_path_loss,
             pin_low=dut_pin,
             pin_high=pin_high,
             pout_margin=pout_margin,
             average_count=average_count,
-            timeout=timeout,
+            settling=settling,
             iteration=iteration + 1,
         )
 
 
+@tracing.traced
 def measure_harmonic(
+    rig: Rig,
     multiple: list[int],
     fundamental_frequency: float,
     average_count: int = 10,
-    sampling_timeout: float = 0.1,
+    settling: Settling = CONTEXTS["harmonic"],
 ) -> dict[str, float]:
 
-    vsa.set_frequency(center=fundamental_frequency, span=0)
-    fundamental = []
-    for _ in range(average_count):
-        fundamental.append(vsa.measure_peak())
-        time.sleep(sampling_timeout)
-    fundamental = np.median(fundamental)
-
-    harmonics = {}
-    for k in multiple:
-        vsa.set_frequency(center=fundamental_frequency * k)
-        # vsa.set_reference_level(auto=True)
-        tmp = []
-        for _ in range(average_count):
-            tmp.append(vsa.measure_peak())
-            time.sleep(sampling_timeout)
-        harmonics[f"harmonic_{k}_dbc"] = np.median(tmp) - fundamental
-    return harmonics
+    with rig.lease_vsa() as vsa:
+        read_peak = functools.partial(settling.read, vsa.measure_peak, average_count)
+        vsa.set_frequency(center=fundamental_frequency, span=0)
+        fundamental = read_cached(
+            rig, "analyzer", read_peak, settling, average_count, fundamental_frequency
+        )
 
+        harmonics = {}
+        for k in multiple:
+            vsa.set_frequency(center=fundamental_frequency * k)
+            # vsa.set_reference_level(auto=True)
+            harmonics[f"harmonic_{k}_dbc"] = (
+                read_cached(
+                    rig,
+                    "analyzer",
+                    read_peak,
+                    settling,
+                    average_count,
+                    fundamental_frequency * k,
+                )
+                - fundamental
+            )
+    return harmonics
 
-def measure_pae(sensor_path_loss: float, pin: float, average_count: int = 10) -> float:
 
-    pout = (
-        np.median([sensor.get_power() for _ in range(average_count)]) - sensor_path_loss
+@tracing.traced
+def measure_pae(
+    rig: Rig, frequency: float, pin: float, average_count: int = 10
+) -> float:
+
+    sensor, ps1 = rig.sensor, rig.ps1
+    pout = rig.path_loss.output_power(
+        frequency,
+        "sensor_to_dut_p2_loss_db",
+        read_cached(
+            rig,
+            "sensor",
+            lambda: np.median([sensor.get_power() for _ in range(average_count)]),
+            "median",
+            average_count,
+        ),
     )
     voltage = ps1.get_voltage(1)
-    current_ps1 = [ps1.get_current(channel) for channel in [1, 2, 3]]
-    current_ps2 = [ps2.get_current(channel) for channel in [1, 2]]
-    current = sum(current_ps1 + current_ps2)
+    current = supply_current(rig)
 
     return ps1.power_added_efficiency(pout, pin, voltage, current, power_unit="dbm")
 
 
+def set_pin(rig: Rig, frequency: float, pin: float) -> None:
+    """Drives the DUT input at `pin` dBm, compensating the input path loss at that
+    power. The offset is only sent again if the loss changes with power."""
+    offset = rig.path_loss.loss(frequency, "sg_to_dut_p1_loss_db", power=pin)
+    if rig.vsg.rf.get("POW:OFFS") != offset:
+        rig.vsg.set_rf(compensation_offset=offset, dut_input_level=pin)
+    else:
+        rig.vsg.set_rf(dut_input_level=pin)
+
+
+def read_cached(
+    rig: Rig, instrument: str, read: Callable[[], float], *state
+) -> float:
+    """Returns `read()` at the current generator state, served from `rig.readings` if
+    it was read there recently.
+
+    Args:
+        instrument (str): The reading instrument, `"sensor"` or `"analyzer"`.
+        read (Callable): Takes the reading.
+        *state: Everything else the reading depends on: how `read` takes it, e.g.
+            its `Settling` criterion and average count, so that a single reading is
+            not served to a read averaging ten, and settings of the reading
+            instrument, e.g. the analyzer center frequency. Settings fixed per
+            frequency can be left out.
+    """
+    return rig.readings.read((instrument, *state, rig.vsg.get_state()), read)
+
+
+def supply_current(rig: Rig) -> float:
+    """Returns the total current drawn by the DUT from both supplies."""
+    current_ps1 = [rig.ps1.get_current(channel) for channel in [1, 2, 3]]
+    current_ps2 = [rig.ps2.get_current(channel) for channel in [1, 2]]
+    return sum(current_ps1 + current_ps2)
+
+
 if __name__ == "__main__":
 
+    startup = Startup()
+    startup.mark("imports")
+
+    parser = argparse.ArgumentParser(description="Characterizes PAs on the test rig.")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="estimate the duration per DUT without touching the instruments",
+    )
+    args = parser.parse_args()
+
     if (product := cfg["product"]) == "":
         product = input("Enter product: ")
-    if (serial := cfg["serial"]) == "":
+    if (serial := cfg["serial"]) == "" and not cfg["batch"]:
         serial = input("Enter serial number: ")
+    tests = ["test_lasig", "test_aclr", "with_dpd"]
+    if cfg["batch"] and (prompted := [test for test in tests if cfg[test] == ""]):
+        raise SystemExit(
+            "Batch mode selects the tests once for the queue: set "
+            f"{', '.join(prompted)} to true or false in the config"
+        )
     date = time.strftime("%y%m%d-%Hh%Mm")
+    startup.mark("operator input")
 
-    # Open instruments
-    rm = pyvisa.ResourceManager()
-    vsa = FSW43(rm, ip_address=rig["SA"]["FSW43"]["ip"], reset=False)
-    vsg = SMW200A(rm, ip_address=rig["SG"]["SMW200A"]["ip"], reset=False)
-    ps1 = E36313A(rm, ip_address=rig["PowerSupply"]["E36313A_1"]["ip"])
-    ps2 = E36313A(rm, ip_address=rig["PowerSupply"]["E36313A_2"]["ip"])
-    sensor = NRPZ86(
-        rm,
-        device_id=rig["PowerSensor"]["NRP_Z86"]["device_id"],
-        serial=rig["PowerSensor"]["NRP_Z86"]["serial_nu"],
-        reset=False,
+    rig_settings = load_rig(cfg["test_rig"])
+    path_loss_path, path_loss = load_path_loss(
+        cfg["test_rig"], rig_settings.get("path_loss_file", cfg["path_loss_file"])
     )
+    try:
+        plan = compile_plan(cfg, product, cfg["test_rig"], rig_settings, path_loss)
+    except PlanError as error:
+        raise SystemExit(f"Invalid test plan: {error}")
+    startup.mark("config")
+
+    if args.dry_run:
+        # Tests left to the operator (empty in the config) are estimated too
+        test_aclr = cfg["test_aclr"] in (True, "")
+        estimate = dry_run(
+            plan,
+            test_lasig=cfg["test_lasig"] in (True, ""),
+            test_aclr=test_aclr,
+            with_dpd=test_aclr and cfg["with_dpd"] in (True, ""),
+        )
+        print(estimate.report())
+        raise SystemExit
+
+    rig = Rig.open(
+        resource_manager(rig_settings, cfg["test_rig"], cfg),
+        name=cfg["test_rig"],
+        settings=rig_settings,
+        path_loss=path_loss,
+        path_loss_path=path_loss_path,
+    )
+    if server_socket(cfg, cfg["test_rig"]) is not None:
+        # Shared sessions of an instrument server, held for the run
+        lock_instruments(
+            rig.vsa, rig.vsg, rig.sensor, rig.ps1, rig.ps2,
+            timeout=cfg["InstrumentServer"].get("lock_timeout", 60),
+        )
+    startup.mark("instruments")
 
     try:
-        main()
+        if cfg["batch"]:
+            match serial:
+                case list():
+                    queue = serial
+                case "":
+                    queue = []
+                case _:
+                    queue = [serial]
+            run_batch(
+                rig,
+                prompt_serials(plan, queue),
+                test_lasig=cfg["test_lasig"],
+                test_aclr=cfg["test_aclr"],
+                with_dpd=cfg["with_dpd"],
+                startup=startup,
+            )
+        else:
+            main(rig, plan, serial, date, startup=startup)
     finally:
-        vsg.set_output("OFF")
-        ps2.turn_off(1, 2, 3)
-        ps1.turn_off(1, 2, 3)
+        rig.shutdown()
+        rig.close()
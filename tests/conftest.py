@@ -0,0 +1,56 @@
+"""Fixtures running the scripts on simulated rigs (`config/rig_SIM.toml`), on a
+virtual clock so that latencies, sleeps and settling waits take no time."""
+# Standard library imports
+import dataclasses
+
+# Third party imports
+import pytest
+
+# Local imports
+from config import config as cfg, load_rig
+from config.plan import TestPlan, compile_plan
+from library.estimate import true_path_loss, virtual_clock
+from library.rig import Rig
+from library.simulator import SimResourceManager
+
+FREQUENCY = 3.45e9
+
+
+@pytest.fixture
+def clock():
+    with virtual_clock() as clock:
+        yield clock
+
+
+@pytest.fixture
+def results_dir(tmp_path, monkeypatch):
+    """Writes the results of `pa_characterization.main` to a temporary store only."""
+    monkeypatch.setitem(cfg, "results_dir", str(tmp_path / "results"))
+    monkeypatch.setitem(cfg, "export_csv", False)
+    monkeypatch.setitem(cfg, "trace", False)
+    return tmp_path / "results"
+
+
+def sim_settings(**simulation) -> dict:
+    """Returns the simulated rig file without faults, updated with `simulation`."""
+    settings = load_rig("SIM")
+    settings["Simulation"] |= {"time_scale": 1.0, "faults": {}} | simulation
+    return settings
+
+
+def sim_rig(name: str = "SIM", settings: dict | None = None, **kwargs) -> Rig:
+    """Opens a simulated rig with a path loss equal to the simulated paths."""
+    settings = settings or sim_settings()
+    rm = SimResourceManager(settings, **kwargs)
+    return Rig.open(rm, name, settings, path_loss=true_path_loss(rm))
+
+
+def sim_plan() -> TestPlan:
+    """Returns the plan of the configured product, reduced to one frequency."""
+    plan = compile_plan(cfg, cfg["product"], "SIM", load_rig("SIM"))
+    return dataclasses.replace(
+        plan,
+        lasig_frequencies=(FREQUENCY,),
+        modulated_frequencies=(FREQUENCY,),
+        pout_targets=(28.0,),
+    )
@@ -0,0 +1,30 @@
+# Standard library imports
+import dataclasses
+
+# Local imports
+from config import config as cfg
+import pa_characterization
+
+from conftest import sim_plan, sim_rig
+
+
+def test_aclr_setup_is_stored_and_recalled(clock, monkeypatch):
+    monkeypatch.setitem(cfg["ACLR"], "setup_dir", "C:\\setups")
+    rig, plan = sim_rig(), sim_plan()
+    vsa = rig.vsa
+    path = pa_characterization.aclr_setup_file(rig, plan, with_dpd=False)
+
+    # Not stored yet, the missing file's error is cleared
+    assert not pa_characterization.recall_aclr_setup(vsa, path, plan, False)
+    assert vsa.instrument.query("SYST:ERR?").startswith("0,")
+
+    pa_characterization.configure_aclr(rig, plan)
+    vsa.reset(clear_status=True)
+    assert pa_characterization.recall_aclr_setup(vsa, path, plan, False)
+    assert vsa.get_channels()["ACLR"] == "SANALYZER"
+
+    # A save set with other channel counts is not used
+    aclr = dataclasses.replace(plan.aclr, carrier_number=plan.aclr.carrier_number + 1)
+    other = dataclasses.replace(plan, aclr=aclr)
+    assert not pa_characterization.recall_aclr_setup(vsa, path, other, False)
+    assert "ACLR" not in vsa.get_channels()
@@ -0,0 +1,89 @@
+# Standard library imports
+import os
+
+# Third party imports
+import numpy as np
+import pandas as pd
+
+# Local imports
+from library.analytics import FleetSummary
+from library.results import ResultsStore
+
+FREQUENCIES = [3.4e9, 3.5e9]
+LIMITS = {"A": {"pae": (0.3, None)}}
+
+
+def lasig(seed: int) -> pd.DataFrame:
+    """Returns a LASIG result of random Pout, PAE and gain at `FREQUENCIES`."""
+    rng = np.random.default_rng(seed)
+    rows = len(FREQUENCIES) * 5
+    return pd.DataFrame(
+        {
+            "frequency_hz": np.repeat(FREQUENCIES, 5),
+            "condition": "",
+            "pout_dbm": rng.normal(28, 1, rows),
+            "pae": rng.normal(0.4, 0.03, rows),
+            "gain_db": rng.normal(30, 0.5, rows),
+        }
+    )
+
+
+def expected(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Computes the statistics of the summary directly from the rows."""
+    values = pd.concat(frames).melt(
+        id_vars=["frequency_hz"],
+        value_vars=["pout_dbm", "pae", "gain_db"],
+        var_name="metric",
+    )
+    stats = values.groupby(["metric", "frequency_hz"])["value"].agg(
+        ["count", "mean", "std", "min", "max"]
+    )
+    stats["cpk"] = (stats["mean"] - 0.3) / (3 * stats["std"])
+    stats.loc[["pout_dbm", "gain_db"], "cpk"] = np.nan
+    return stats
+
+
+def check(summary: FleetSummary, frames: list[pd.DataFrame]) -> None:
+    stats = summary.statistics(limits=LIMITS).droplevel(["product", "condition"])
+    direct = expected(frames)
+    stats = stats.reindex(direct.index)
+    assert stats["n"].tolist() == direct["count"].tolist()
+    for column in ["mean", "std", "min", "max", "cpk"]:
+        np.testing.assert_allclose(stats[column], direct[column], rtol=1e-9)
+
+
+def test_incremental_statistics_match_pandas(tmp_path):
+    store = ResultsStore(tmp_path)
+    summary = FleetSummary()
+    frames = [lasig(seed) for seed in range(3)]
+    store.append("lasig", frames[0], "A", serial="1", run="261016-09h30m")
+    assert summary.ingest(store) == 1
+    # Merged with the moments of the first run
+    store.append("lasig", frames[1], "A", serial="2", run="261017-09h30m")
+    store.append("lasig", frames[2], "A", serial="3", run="261018-09h30m")
+    assert summary.ingest(store) == 2
+    assert summary.ingest(store) == 0
+    check(summary, frames)
+
+    summary.save(tmp_path / "_analytics")
+    loaded = FleetSummary.load(tmp_path / "_analytics")
+    check(loaded, frames)
+    assert loaded.percentiles((50,)).columns.tolist() == ["p50"]
+
+
+def test_run_appended_again_is_ingested_again(tmp_path):
+    store = ResultsStore(tmp_path)
+    summary = FleetSummary()
+    frames = [lasig(0), lasig(1)]
+    store.append("lasig", frames[0], "A", serial="1", run="261016-09h30m")
+    file = store.append("lasig", frames[1], "A", serial="2", run="261017-09h30m")
+    summary.ingest(store)
+
+    # Serial 2 is measured again under the same run stamp, a minute later
+    frames[1] = lasig(2)
+    store.append("lasig", frames[1], "A", serial="2", run="261017-09h30m")
+    mtime = file.stat().st_mtime_ns + 60 * 10**9
+    os.utime(file, ns=(mtime, mtime))
+
+    assert summary.ingest(store) == 2
+    check(summary, frames)
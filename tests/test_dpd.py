@@ -0,0 +1,31 @@
+# Third party imports
+import pytest
+
+# Local imports
+from library.dpd import DirectDpd
+
+from conftest import sim_rig, sim_settings
+
+
+def test_stalled_sequence_times_out(clock):
+    settings = sim_settings(latency_s={"ddpd_iteration": 3600})
+    vsa = sim_rig(settings=settings).vsa
+    vsa.configure_ddpd(count=5)
+    dpd = DirectDpd(vsa, max_iterations=5, timeout_s=60)
+
+    with pytest.raises(TimeoutError):
+        dpd.run(3.45e9, 28.0)
+    # The sequence was stopped
+    assert not vsa.get_ddpd_operation_status()
+
+
+def test_corrections_are_named_after_product_and_rig(clock):
+    vsa = sim_rig().vsa
+    vsa.configure_ddpd(count=2)
+    dpd = DirectDpd(vsa, max_iterations=2, correction_dir="C:\\ddpd", name="P_A")
+
+    first = dpd.run(3.45e9, 28.0)
+    second = dpd.run(3.45e9, 29.0)
+
+    assert first.correction == "C:\\ddpd\\P_A_ddpd_3450MHz_28dBm"
+    assert second.seed is first
@@ -0,0 +1,58 @@
+# Standard library imports
+import concurrent.futures
+import threading
+import time
+
+# Third party imports
+import pytest
+
+# Local imports
+from library.instrument_server import InstrumentServer, RemoteError
+from library.instrument_server import RemoteResourceManager
+from library.rig import resource_names
+from library.simulator import SimResourceManager
+
+from conftest import sim_settings
+
+
+@pytest.fixture
+def server(tmp_path):
+    settings = sim_settings(latency_s={"query": 0.2})
+    server = InstrumentServer(SimResourceManager(settings), tmp_path / "rig.sock")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, resource_names(settings)
+    server.shutdown()
+    server.server_close()
+
+
+def test_sessions_of_different_instruments_run_concurrently(server):
+    server, names = server
+    rm = RemoteResourceManager(server.path)
+    vsa = rm.open_resource(names["vsa"])
+    vsg = rm.open_resource(names["vsg"])
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        idns = list(pool.map(lambda session: session.query("*IDN?"), [vsa, vsg]))
+    elapsed = time.perf_counter() - start
+
+    assert "FSW" in idns[0] and "SMW" in idns[1]
+    assert elapsed < 0.35
+    rm.close()
+
+
+def test_locked_instrument_waits_for_the_other_script(server):
+    server, names = server
+    server.lock_timeout = 0.5
+    owner, other = RemoteResourceManager(server.path), RemoteResourceManager(server.path)
+    vsa = owner.open_resource(names["vsa"])
+    vsa.lock_excl()
+
+    with pytest.raises(RemoteError, match="locked"):
+        other.open_resource(names["vsa"]).query("*IDN?")
+    # Other instruments are not affected, and closing the session unlocks
+    assert "SMW" in other.open_resource(names["vsg"]).query("*IDN?")
+    vsa.close()
+    assert "FSW" in other.open_resource(names["vsa"]).query("*IDN?")
+    owner.close()
+    other.close()
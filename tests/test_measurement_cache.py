@@ -0,0 +1,64 @@
+# Standard library imports
+import itertools
+import time
+
+# Local imports
+from library.measurement_cache import MeasurementCache
+import pa_characterization
+
+from conftest import sim_rig
+
+
+def counter():
+    """Returns a reading that counts up, so each measurement is told apart."""
+    return itertools.count(1).__next__
+
+
+def test_fresh_reading_is_served(clock):
+    cache, read = MeasurementCache(freshness_s=30), counter()
+
+    assert cache.read("a", read) == 1
+    assert cache.read("a", read) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_other_key_is_measured(clock):
+    cache, read = MeasurementCache(freshness_s=30), counter()
+
+    assert cache.read("a", read) == 1
+    assert cache.read("b", read) == 2
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_reading_older_than_freshness_is_measured(clock):
+    cache, read = MeasurementCache(freshness_s=30), counter()
+
+    cache.read("a", read)
+    time.sleep(29)
+    assert cache.read("a", read) == 1
+    time.sleep(2)
+    assert cache.read("a", read) == 2
+
+
+def test_invalidate_forgets_readings(clock):
+    cache, read = MeasurementCache(freshness_s=30), counter()
+
+    cache.read("a", read)
+    cache.invalidate()
+    assert cache.read("a", read) == 2
+
+
+def test_zero_freshness_measures_every_reading(clock):
+    cache, read = MeasurementCache(), counter()
+
+    cache.read("a", read)
+    assert cache.read("a", read) == 2
+
+
+def test_reading_is_not_served_to_other_average_count(clock):
+    rig, read = sim_rig(), counter()
+    rig.readings = MeasurementCache(freshness_s=30)
+
+    assert pa_characterization.read_cached(rig, "sensor", read, "median", 1) == 1
+    assert pa_characterization.read_cached(rig, "sensor", read, "median", 10) == 2
+    assert pa_characterization.read_cached(rig, "sensor", read, "median", 1) == 1
@@ -0,0 +1,24 @@
+# Local imports
+from library.results import ResultsStore
+import orchestrate
+
+from conftest import sim_plan, sim_rig
+
+
+def test_main_runs_jobs_on_simulated_rigs(clock, results_dir):
+    plan = sim_plan()
+    jobs = {"A": [(plan, "1001"), (plan, "1002")], "B": [(plan, "2001")]}
+    opened = []
+
+    def open_rig(name):
+        opened.append(name)
+        return sim_rig(name)
+
+    progress = orchestrate.main(jobs, open_rig=open_rig, with_dpd=False)
+
+    assert sorted(opened) == ["A", "B"]
+    assert progress.done == {"A": 2, "B": 1}
+    assert progress.failed == {"A": [], "B": []}
+    index = ResultsStore(results_dir).index()
+    assert set(index["serial"]) == {"1001", "1002", "2001"}
+    assert set(index["table"]) == {"sweep", "lasig", "aclr"}
@@ -0,0 +1,58 @@
+# Third party imports
+import pandas as pd
+import pytest
+
+# Local imports
+from library.path_loss import PathLoss
+import pa_characterization
+
+from conftest import FREQUENCY, sim_plan, sim_rig
+
+COLUMNS = ["sg_to_dut_p1_loss_db", "sa_to_dut_p2_loss_db", "sensor_to_dut_p2_loss_db"]
+
+
+def test_loss_is_interpolated_along_power():
+    data = pd.DataFrame(
+        {
+            "power": [0, 0, 20, 20],
+            "frequency": [3e9, 4e9, 3e9, 4e9],
+            "sensor_to_dut_p2_loss_db": [-1.0, -2.0, -1.4, -2.4],
+        }
+    )
+    path_loss = PathLoss(data)
+    column = "sensor_to_dut_p2_loss_db"
+
+    assert path_loss.loss(3.5e9, column) == pytest.approx(-1.5)
+    assert path_loss.loss(3.5e9, column, power=10) == pytest.approx(-1.7)
+    assert path_loss.loss(3.5e9, column, power=30) == pytest.approx(-1.9)
+    # 9 dBm read at 3 GHz are about 10 dBm at the DUT, where the loss is -1.2 dB
+    assert path_loss.output_power(3e9, column, 9.0) == pytest.approx(10.2)
+
+
+def test_pout_search_uses_the_output_loss_at_the_pout(clock):
+    rig = sim_rig()
+    pa_characterization.power_up(rig, sim_plan())
+    rig.vsg.set_rf(frequency=FREQUENCY)
+    rig.sensor.set_frequency(FREQUENCY)
+
+    def find_pin(path_loss: PathLoss) -> float:
+        rig.path_loss = path_loss
+        rig.readings.invalidate()
+        dut_pin, dut_pout = pa_characterization.find_pout(
+            rig, frequency=FREQUENCY, target_dbm=20, pin_low=-30, pin_high=10
+        )
+        assert dut_pout == pytest.approx(20, abs=0.05)
+        return dut_pin
+
+    frequencies = rig.path_loss.tables[float("inf")][0]
+    table = pd.DataFrame(
+        {"frequency": frequencies}
+        | {column: rig.path_loss.loss(frequencies, column) for column in COLUMNS}
+    )
+    # The sensor path reads 1 dB higher at 40 dBm, i.e. 0.5 dB at the 20 dBm Pout
+    high = table.assign(power=40.0)
+    high["sensor_to_dut_p2_loss_db"] += 1.0
+    pin = find_pin(PathLoss(table))
+    pin_at_power = find_pin(PathLoss(pd.concat([table.assign(power=0.0), high])))
+
+    assert pin_at_power - pin == pytest.approx(0.5, abs=0.15)
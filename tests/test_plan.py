@@ -0,0 +1,62 @@
+# Standard library imports
+import copy
+
+# Third party imports
+import pandas as pd
+import pytest
+
+# Local imports
+from config import config as cfg, load_rig
+from config.plan import PlanError, compile_plan
+from library.path_loss import PathLoss
+
+
+def compile_with(path_loss=None, **changes) -> None:
+    """Compiles the configured product with `changes`, given as `section={key: value}`
+    of the config or of the product section (`product={...}`)."""
+    config = copy.deepcopy(cfg)
+    product = config["product"]
+    for section, settings in changes.items():
+        target = config[product] if section == "product" else config[section]
+        for key, value in settings.items():
+            target[key] = value
+    compile_plan(config, product, "SIM", load_rig("SIM"), path_loss=path_loss)
+
+
+def test_valid_plan_compiles():
+    compile_with()
+
+
+def test_bad_frequency_is_rejected():
+    freqs = copy.deepcopy(cfg[cfg["product"]]["Freqs"]) | {"lasig": [3.3e9, -1]}
+    with pytest.raises(PlanError, match="lasig frequencies"):
+        compile_with(product={"Freqs": freqs})
+
+
+def test_bad_sweep_is_rejected():
+    with pytest.raises(PlanError, match="Invalid sweep"):
+        compile_with(product={"sweep_start_dbm": 10, "sweep_stop_dbm": -20})
+    with pytest.raises(PlanError, match="Invalid sweep"):
+        compile_with(product={"sweep_step_dbm": 0})
+
+
+def test_dpd_settings_out_of_range_are_rejected():
+    with pytest.raises(PlanError, match="DPD iteration"):
+        compile_with(DPD={"iteration": 0})
+    with pytest.raises(PlanError, match="DPD tradeoff"):
+        compile_with(DPD={"tradeoff": 101})
+
+
+def test_frequencies_without_path_loss_are_rejected():
+    # Covers the lower test frequencies only
+    data = pd.DataFrame(
+        {
+            "power": [0, 0],
+            "frequency": [3.0e9, 3.4e9],
+            "sg_to_dut_p1_loss_db": [-1.0, -1.0],
+            "sa_to_dut_p2_loss_db": [-2.0, -2.0],
+            "sensor_to_dut_p2_loss_db": [-3.0, -3.0],
+        }
+    )
+    with pytest.raises(PlanError, match="No path loss"):
+        compile_with(path_loss=PathLoss(data))
@@ -0,0 +1,82 @@
+# Standard library imports
+import os
+import time
+
+# Third party imports
+import pandas as pd
+import pytest
+
+# Local imports
+from library.results import STALE_LOCK_S, ResultsStore
+
+
+def lasig(*frequencies: float) -> pd.DataFrame:
+    """Returns a LASIG result of two sweep points per frequency."""
+    return pd.DataFrame(
+        {
+            "frequency_hz": [f for f in frequencies for _ in range(2)],
+            "pout_dbm": [20.0, 30.0] * len(frequencies),
+            "pae": [0.2, 0.4] * len(frequencies),
+        }
+    )
+
+
+def test_append_is_queried(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append("lasig", lasig(3.4e9, 3.5e9), "A", serial="1", run="261018-09h30m")
+
+    df = store.query("lasig", columns=["pae"], product="A", frequency_hz=3.5e9)
+    assert df["pae"].tolist() == [0.2, 0.4]
+    assert set(df["date"]) == {"2026-10-18"}
+
+
+def test_fragments_are_compacted(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append("lasig", lasig(3.4e9), "A", serial="1", run="261018-09h30m")
+    store.append("lasig", lasig(3.4e9), "A", serial="2", run="261018-10h30m")
+    assert len(list(store.fragments_path.iterdir())) == 2
+
+    index = store.index()
+    assert list(store.fragments_path.iterdir()) == []
+    assert store.index_path.exists()
+    pd.testing.assert_frame_equal(store.index(), index)
+
+
+def test_run_appended_again_replaces_its_entries(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append("lasig", lasig(3.4e9, 3.5e9), "A", serial="1", run="261018-09h30m")
+    store.index()
+    # The run is repeated at fewer frequencies, into the same file
+    store.append("lasig", lasig(3.4e9), "A", serial="1", run="261018-09h30m")
+
+    assert store.index()["frequency_hz"].tolist() == [3.4e9]
+    assert store.files("lasig", frequency_hz=3.5e9) == []
+
+
+def test_stale_lock_is_broken(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.lock_path.write_text("0")
+    with pytest.raises(TimeoutError):
+        with store.lock(timeout=0.05):
+            pass
+
+    stale = time.time() - STALE_LOCK_S - 1
+    os.utime(store.lock_path, (stale, stale))
+    with store.lock(timeout=0.05):
+        assert store.lock_path.read_text() == str(os.getpid())
+    assert not store.lock_path.exists()
+
+
+def test_query_opens_matching_partitions_only(tmp_path):
+    store = ResultsStore(tmp_path)
+    store.append("lasig", lasig(3.4e9), "A", serial="1", run="261017-09h30m")
+    store.append("lasig", lasig(3.4e9), "A", serial="2", run="261018-09h30m")
+    other = store.append("lasig", lasig(3.4e9), "B", serial="3", run="261018-09h30m")
+
+    files = store.files("lasig", product="A", date_from="2026-10-18")
+    partition = tmp_path / "lasig" / "product=A" / "date=2026-10-18"
+    assert files == [partition / "2_261018-09h30m.parquet"]
+    # The file of product B is not opened, the query would fail on it
+    other.unlink()
+    df = store.query("lasig", product="A", serial=["2", "3"])
+    assert df["serial"].unique().tolist() == ["2"]
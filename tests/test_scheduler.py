@@ -0,0 +1,82 @@
+# Standard library imports
+import threading
+import time
+
+# Local imports
+from library.scheduler import AnalyzerScheduler
+from library.simulator import SimLab
+
+from conftest import FREQUENCY, sim_rig, sim_settings
+
+
+def station(name: str, port: int, lab: SimLab):
+    settings = sim_settings(time_scale=0, settling_s=0)
+    settings["Switch"] = {"RFSwitch": {"ip": "sim-switch", "port": port}}
+    return sim_rig(name, settings, lab=lab)
+
+
+def test_stations_share_one_analyzer_in_turns():
+    lab = SimLab()
+    rigs = {"A": station("A", 1, lab), "B": station("B", 2, lab)}
+    assert rigs["A"].vsa.instrument is rigs["B"].vsa.instrument
+    scheduler = AnalyzerScheduler()
+    # Only station A drives its DUT input
+    for rig in rigs.values():
+        rig.scheduler = scheduler
+        rig.vsg.set_rf(frequency=FREQUENCY, dut_input_level=-10)
+    rigs["A"].vsg.set_output("ON")
+
+    centers = {"A": FREQUENCY, "B": FREQUENCY + 1e6}
+    grants, readings, restored = [], {"A": [], "B": []}, []
+    start = threading.Barrier(2)
+
+    def measure(name: str) -> None:
+        rig = rigs[name]
+        start.wait()
+        for lease in range(4):
+            with rig.lease_vsa() as vsa:
+                grants.append(name)
+                session = vsa.instrument
+                if lease > 0:
+                    restored.append(session.center == centers[name])
+                vsa.set_frequency(center=centers[name], span=0)
+                readings[name].append(vsa.measure_peak())
+                # Hold the analyzer until the other station queues up
+                time.sleep(0.02)
+
+    threads = [threading.Thread(target=measure, args=(name,)) for name in rigs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # First come, first served: the stations alternate
+    assert all(a != b for a, b in zip(grants, grants[1:]))
+    assert len(grants) == 8
+    # Each station finds its own setup recalled and measures its own DUT
+    assert all(restored) and len(restored) == 6
+    assert min(readings["A"]) > max(readings["B"]) + 10
+    assert scheduler.handovers == 8
+
+
+def test_closed_rig_leaves_the_lab():
+    lab = SimLab()
+    settings = sim_settings(time_scale=0, settling_s=0)
+    settings["Switch"] = {"RFSwitch": {"ip": "sim-switch", "port": 1}}
+    first = sim_rig("A", settings, lab=lab)
+    second = station("B", 2, lab)
+    # The switch resets to port 1: the analyzer measures the first rig's DUT
+    first.vsg.set_rf(frequency=FREQUENCY, dut_input_level=-10)
+    first.vsg.set_output("ON")
+    second.vsa.set_frequency(center=FREQUENCY, span=0)
+    driven = second.vsa.measure_peak()
+
+    first.close()
+    assert lab.benches.keys() == {2}
+    assert second.vsa.measure_peak() < driven - 10
+
+    # The lab is empty once the last rig closes: a new rig gets fresh instruments
+    second.close()
+    third = station("C", 2, lab)
+    assert third.vsa.instrument is not second.vsa.instrument
+    assert third.vsa.instrument.home is third.rm.bench
@@ -0,0 +1,51 @@
+# Standard library imports
+import time
+import warnings
+
+# Third party imports
+import pytest
+
+# Local imports
+from library.settling import Settling, SettlingTimeout
+
+
+def reading(*values: float):
+    """Returns a reading taking 0.1 s that yields `values`, then the last one."""
+    values = list(values)
+
+    def read() -> float:
+        time.sleep(0.1)
+        return values.pop(0) if len(values) > 1 else values[0]
+
+    return read
+
+
+def test_wait_returns_once_settled(clock):
+    settling = Settling(tolerance=0.1, window=3, max_wait=2)
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert settling.wait(reading(5.0, 3.0, 2.0, 2.05, 2.0))
+    assert time.perf_counter() - start == pytest.approx(0.5)
+
+
+def test_wait_warns_on_timeout(clock):
+    settling = Settling(tolerance=0.1, window=3, max_wait=1)
+    start = time.perf_counter()
+    with pytest.warns(SettlingTimeout, match="within 1 s"):
+        assert not settling.wait(reading(*range(100)))
+    assert 1 <= time.perf_counter() - start <= 1.2
+
+
+def test_until_returns_once_the_condition_holds(clock):
+    settling = Settling(max_wait=1, interval=0.1)
+    deadline = time.perf_counter() + 0.3
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert settling.until(lambda: time.perf_counter() >= deadline)
+
+
+def test_until_warns_on_timeout(clock):
+    settling = Settling(max_wait=1, interval=0.1)
+    with pytest.warns(SettlingTimeout, match="within 1 s"):
+        assert not settling.until(lambda: False)
@@ -0,0 +1,36 @@
+# Local imports
+from library.drivers.vsg.smw200a import waveform_key
+
+from conftest import sim_rig
+
+WAVEFORM = "/var/user/product_a.wv"
+
+
+def loads(rig) -> int:
+    """Returns the number of waveform files the generator was told to load."""
+    return rig.rm.counts[(rig.vsg.instrument.resource_name, "BB:ARB:WAV:SEL")]
+
+
+def test_resident_waveform_is_not_loaded_again(clock):
+    rig = sim_rig()
+    assert rig.vsg.select_waveform(WAVEFORM)
+    assert not rig.vsg.select_waveform(WAVEFORM)
+    assert loads(rig) == 1
+
+    # Still resident after the tracking is reset: asked, not loaded
+    rig.vsg.invalidate()
+    assert not rig.vsg.select_waveform(WAVEFORM)
+    assert loads(rig) == 1
+
+
+def test_waveform_is_loaded_again_after_invalidate(clock):
+    rig = sim_rig()
+    rig.vsg.select_waveform(WAVEFORM)
+    # Another controller, e.g. the analyzer's DPD, replaces the waveform
+    rig.vsg.instrument.write("BB:ARB:WAV:SEL '/var/user/dpd.wv'")
+    assert not rig.vsg.select_waveform(WAVEFORM)
+
+    rig.vsg.invalidate()
+    assert rig.vsg.select_waveform(WAVEFORM)
+    assert rig.vsg.get_waveform() == waveform_key(WAVEFORM)
+    assert loads(rig) == 3
@@ -0,0 +1,33 @@
+# Third party imports
+import pytest
+
+# Local imports
+from library.touchstone import Touchstone
+
+S2P = """# Hz S DB R 50
+1e9 -0.1 0 -1.0 0 -1.0 0 -0.1 0
+5e9 -0.2 0 -2.0 0 -2.0 0 -0.2 0
+"""
+
+
+def test_cache_replaces_only_its_own_stale_caches(tmp_path):
+    (tmp_path / "adapter.s2p").write_text(S2P)
+    stale = tmp_path / "adapter.0123456789abcdef.npz"
+    other = tmp_path / "adapter.v2.0123456789abcdef.npz"
+    stale.touch()
+    other.touch()
+
+    adapter = Touchstone(tmp_path / "adapter.s2p")
+
+    assert adapter.cache_path.exists()
+    assert not stale.exists()
+    assert other.exists()
+    assert Touchstone(tmp_path / "adapter.s2p").s21_db(3e9) == pytest.approx(-1.5)
+
+
+def test_frequency_outside_the_file_raises(tmp_path):
+    (tmp_path / "adapter.s2p").write_text(S2P)
+    adapter = Touchstone(tmp_path / "adapter.s2p")
+
+    with pytest.raises(ValueError, match="covers 1e\\+09 to 5e\\+09 Hz"):
+        adapter.s21_db([3e9, 6e9])
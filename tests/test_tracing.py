@@ -0,0 +1,77 @@
+# Standard library imports
+import time
+
+# Third party imports
+import pytest
+
+# Local imports
+from library import tracing
+from library.estimate import virtual_clock
+
+SLEEP, PERF_COUNTER = time.sleep, time.perf_counter
+
+
+def test_recording_restores_sleep():
+    with tracing.recording() as trace:
+        assert time.sleep is tracing.traced_sleep
+        time.sleep(0.001)
+    assert time.sleep is SLEEP
+    assert trace.durations("sleep")["sleep"] > 0
+
+
+def test_sleep_is_hooked_until_the_last_recording_ends():
+    first = tracing.recording("first")
+    second = tracing.recording("second")
+    first.__enter__()
+    second.__enter__()
+    # Ended out of order, like the recordings of two threads
+    first.__exit__(None, None, None)
+    assert time.sleep is tracing.traced_sleep
+    second.__exit__(None, None, None)
+    assert time.sleep is SLEEP
+
+
+def test_recording_within_virtual_clock_sleeps_virtually():
+    with virtual_clock() as clock, tracing.recording() as trace:
+        start = clock.perf_counter()
+        time.sleep(3600)
+        assert clock.perf_counter() - start == pytest.approx(3600)
+    assert trace.durations("sleep")["sleep"] == pytest.approx(3600)
+    assert (time.sleep, time.perf_counter) == (SLEEP, PERF_COUNTER)
+
+
+def test_clock_and_recording_may_end_in_any_order():
+    clock = virtual_clock()
+    recording = tracing.recording()
+    clock.__enter__()
+    recording.__enter__()
+    clock.__exit__(None, None, None)
+    # The recording keeps its hook, which sleeps for real again
+    assert time.sleep is tracing.traced_sleep
+    assert time.perf_counter is PERF_COUNTER
+    time.sleep(0.001)
+    recording.__exit__(None, None, None)
+    assert (time.sleep, time.perf_counter) == (SLEEP, PERF_COUNTER)
+
+
+def test_patch_calls_through_to_the_sleep_beneath():
+    slept = []
+
+    def counting_sleep(seconds):
+        slept.append(seconds)
+        beneath("sleep")(seconds)
+
+    with virtual_clock() as clock, tracing.patch_time(sleep=counting_sleep) as beneath:
+        with tracing.recording():
+            start = clock.perf_counter()
+            time.sleep(60)
+    assert slept == [60]
+    assert clock.perf_counter() - start == pytest.approx(60)
+    assert time.sleep is SLEEP
+
+
+def test_virtual_clock_restores_time_after_an_error():
+    with pytest.raises(RuntimeError):
+        with virtual_clock():
+            raise RuntimeError
+    assert (time.sleep, time.perf_counter) == (SLEEP, PERF_COUNTER)
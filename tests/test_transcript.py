@@ -0,0 +1,83 @@
+# Third party imports
+import pytest
+
+# Local imports
+from library.simulator import SimResourceManager, tcpip
+from library.transcript import (
+    RecordingResourceManager,
+    ReplayResourceManager,
+    TranscriptMismatch,
+)
+
+from conftest import sim_settings
+
+COMMANDS = [
+    ("w", "*CLS"),
+    ("w", "INIT:CONT OFF"),
+    ("q", "*IDN?"),
+    ("w", "*CLS"),
+    ("q", "*OPC?"),
+]
+
+
+def record(path) -> tuple[str, list]:
+    """Records `COMMANDS` on the simulated analyzer, returns its name and responses."""
+    settings = sim_settings(time_scale=0)
+    name = tcpip(settings["SA"]["FSW43"]["ip"])
+    rm = RecordingResourceManager(SimResourceManager(settings), path)
+    responses = run(rm.open_resource(name), COMMANDS)
+    rm.close()
+    return name, responses
+
+
+def run(session, commands: list) -> list:
+    return [
+        session.query(command) if operation == "q" else session.write(command)
+        for operation, command in commands
+    ]
+
+
+def test_replay_serves_the_recording(tmp_path):
+    name, responses = record(tmp_path / "A.jsonl")
+    rm = ReplayResourceManager(tmp_path / "A.jsonl")
+
+    assert run(rm.open_resource(name), COMMANDS)[2] == responses[2]
+    assert rm.summary()[name] == {
+        "recorded": 5, "sent": 5, "skipped": 0, "remaining": 0, "unrecorded": 0
+    }
+
+
+def test_reordered_writes_need_non_strict_replay(tmp_path):
+    name, responses = record(tmp_path / "A.jsonl")
+    reordered = [COMMANDS[1], COMMANDS[0], *COMMANDS[2:]]
+
+    strict = ReplayResourceManager(tmp_path / "A.jsonl")
+    with pytest.raises(TranscriptMismatch):
+        run(strict.open_resource(name), reordered)
+
+    rm = ReplayResourceManager(tmp_path / "A.jsonl", strict=False)
+    assert run(rm.open_resource(name), reordered)[2] == responses[2]
+    # `*CLS` was skipped to reach `INIT:CONT OFF`, and is not looked for past `*IDN?`
+    assert rm.summary()[name]["skipped"] == 1
+    assert rm.summary()[name]["unrecorded"] == 1
+
+
+def test_missing_command_is_a_mismatch(tmp_path):
+    name, responses = record(tmp_path / "A.jsonl")
+
+    strict = ReplayResourceManager(tmp_path / "A.jsonl")
+    with pytest.raises(TranscriptMismatch):
+        run(strict.open_resource(name), COMMANDS[1:])
+
+    # A missing write is skipped
+    rm = ReplayResourceManager(tmp_path / "A.jsonl", strict=False)
+    assert run(rm.open_resource(name), COMMANDS[1:])[-1] == responses[-1]
+    assert rm.summary()[name]["skipped"] == 1
+
+    # A missing query is not: the next write stays unrecorded rather than skip it,
+    # and the next query does not match
+    rm = ReplayResourceManager(tmp_path / "A.jsonl", strict=False)
+    with pytest.raises(TranscriptMismatch):
+        run(rm.open_resource(name), COMMANDS[:2] + COMMANDS[3:])
+    assert rm.summary()[name]["unrecorded"] == 1
+    assert rm.summary()[name]["remaining"] == 3